@@ -0,0 +1,107 @@
+"""
+Compares rows/second of the per row dict renaming/filtering against the compiled row projector.
+
+    python -m benchmarks.bench_projection --rows 1000000
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+
+import dyno_grp.utils as utils
+
+from dyno_grp.builder import HierarchyBuilder
+from dyno_grp.definitions import GroupRule
+
+RULE = {
+    "select": [{"item": {"as": "Item"}}, "Qty", "Supplier", "Category", "City", "Price"],
+    "where": {},
+    "groups": {
+        "Supplier": {"similar_items": ["Category"], "aggregated_property": "items_data"},
+        "City": {},
+        "Item": {},
+    }
+}
+
+
+def generate_csv(file_name, rows, seed=42):
+    rnd = random.Random(seed)
+    with open(file_name, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["item", "Qty", "Supplier", "Category", "City", "Price", "Comment"])
+        for _ in range(rows):
+            supplier = rnd.randrange(1000)
+            writer.writerow([f"item{rnd.randrange(100)}", rnd.randrange(1, 10), f"supplier{supplier}",
+                             f"category{supplier % 20}", f"city{rnd.randrange(50)}",
+                             rnd.randrange(100, 10000) / 100, "n/a"])
+
+
+def read_rows(file_name):
+    with open(file_name) as f:
+        return list(csv.DictReader(f))
+
+
+def dict_churn(group_rule: GroupRule, rows):
+    select_clause = group_rule.select_clause
+    first_group = next(iter(group_rule.group_clause))
+    receiver = dict()
+    for row in rows:
+        renamed_row = dict()
+        for k, v in row.items():
+            column = select_clause.get(k)
+            k = column.alias if column else k
+            renamed_row[k] = v
+        result_columns = select_clause.alias_set - {first_group}
+        group_key = renamed_row[first_group]
+        if receiver.get(group_key, None) is None:
+            receiver[group_key] = []
+        receiver[group_key].append(utils.filter_dict(renamed_row, *result_columns, include=True))
+
+
+def compiled_projector(group_rule: GroupRule, rows):
+    projector = group_rule.compile_projector(list(rows[0]))
+    project = projector.getter
+    first_group = projector.aliases.index(next(iter(group_rule.group_clause)))
+    receiver = dict()
+    for row in rows:
+        values = project(row)
+        group_key = values[first_group]
+        bucket = receiver.get(group_key)
+        if bucket is None:
+            bucket = receiver[group_key] = []
+        bucket.append(values)
+
+
+def grouping(group_rule: GroupRule, rows):
+    projector = group_rule.compile_projector(list(rows[0]))
+    project = projector.getter
+    add = HierarchyBuilder(group_rule, projector.aliases).add
+    for row in rows:
+        add(project(row))
+
+
+def measure(name, func, group_rule, rows):
+    start = time.perf_counter()
+    func(group_rule, rows)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<26} {elapsed:8.3f}s {len(rows) / elapsed:14,.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_name = os.path.join(tmp_dir, "bench.csv")
+        generate_csv(file_name, args.rows)
+        rows = read_rows(file_name)
+    group_rule = GroupRule.from_raw(RULE)
+    measure("first pass, dict churn", dict_churn, group_rule, rows)
+    measure("first pass, projector", compiled_projector, group_rule, rows)
+    measure("projector + full groups", grouping, group_rule, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Seeded generator of wide denormalized CSV files and of the group rules matching them.
+A dataset has depth group key columns, similar item columns which depend on the key of their level only
+(the denormalized attributes), a numeric Qty column, leaf value columns and unused padding columns.
+
+    python -m benchmarks.generator data.csv --rows 1000000 --columns 40 --depth 3 --rule rule.json
+"""
+import argparse
+import csv
+import json
+import random
+
+LEAF_POOL_SIZE = 1000
+
+
+class DatasetSpec:
+    """
+    Shape of a generated dataset. cardinality is the number of distinct keys of every group column,
+    similar_ratio is the part of the selected (non key) columns which are similar items of a group,
+    selected_ratio is the part of the non key columns selected by the rule (the rest is padding).
+    If sorted_keys is True the rows are ordered by the first group column
+    """
+    def __init__(self,
+                 rows: int = 100000,
+                 columns: int = 8,
+                 cardinality: int = 1000,
+                 depth: int = 3,
+                 similar_ratio: float = 0.25,
+                 selected_ratio: float = 1.0,
+                 sorted_keys: bool = False,
+                 seed: int = 42) -> None:
+        super().__init__()
+        if rows < 0 or cardinality <= 0 or depth <= 0:
+            raise ValueError("Rows must not be negative, cardinality and depth must be positive")
+        if columns < depth + 1:
+            raise ValueError("There must be more columns than the group depth")
+        if not 0 <= similar_ratio <= 1 or not 0 < selected_ratio <= 1:
+            raise ValueError("Similar ratio must be within [0, 1] and selected ratio within (0, 1]")
+        self.rows = rows
+        self.columns = columns
+        self.cardinality = cardinality
+        self.depth = depth
+        self.similar_ratio = similar_ratio
+        self.selected_ratio = selected_ratio
+        self.sorted_keys = sorted_keys
+        self.seed = seed
+        non_key = columns - depth
+        selected = min(non_key, max(1, round(non_key * selected_ratio)))
+        # Qty is always a selected leaf column
+        self._similar = min(selected - 1, round(selected * similar_ratio))
+        self._leaves = selected - self._similar - 1
+        self._unused = non_key - selected
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.as_dict()})"
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "columns": self.columns,
+            "cardinality": self.cardinality,
+            "depth": self.depth,
+            "similar_ratio": self.similar_ratio,
+            "selected_ratio": self.selected_ratio,
+            "sorted_keys": self.sorted_keys,
+            "seed": self.seed,
+        }
+
+    def scaled(self, scale: float) -> "DatasetSpec":
+        """The same shape of max(1, rows * scale) rows"""
+        spec = dict(self.as_dict(), rows=max(1, int(self.rows * scale)))
+        return DatasetSpec(**spec)
+
+    @property
+    def key_columns(self):
+        return [f"Key{level}" for level in range(self.depth)]
+
+    @property
+    def similar_columns(self):
+        """Similar item columns, assigned to the levels round robin, as (level, column) pairs"""
+        return [(i % self.depth, f"Attr{i % self.depth}_{i // self.depth}") for i in range(self._similar)]
+
+    @property
+    def leaf_columns(self):
+        return ["Qty"] + [f"Value{i}" for i in range(self._leaves)]
+
+    @property
+    def unused_columns(self):
+        return [f"Unused{i}" for i in range(self._unused)]
+
+    @property
+    def header(self):
+        return self.key_columns + [column for _, column in self.similar_columns] + self.leaf_columns + \
+            self.unused_columns
+
+    def rule(self) -> dict:
+        """Raw group rule in the rule_test*.json style: a group per key column with its similar items"""
+        similar_columns = self.similar_columns
+        groups = dict()
+        for level, key in enumerate(self.key_columns):
+            similar_items = [column for column_level, column in similar_columns if column_level == level]
+            groups[key] = {"similar_items": similar_items, "aggregated_property": "items"} if similar_items else {}
+        return {
+            "select": self.key_columns + [column for _, column in similar_columns] + self.leaf_columns,
+            "where": {},
+            "groups": groups,
+        }
+
+
+def generate_rows(spec: DatasetSpec):
+    """Generates the rows of the dataset as lists of strings, the same rows for the same spec"""
+    rnd = random.Random(spec.seed)
+    randrange, choices = rnd.randrange, rnd.choices
+    cardinality, depth, rows = spec.cardinality, spec.depth, spec.rows
+    similar_levels = [level for level, _ in spec.similar_columns]
+    pool = [f"v{i}" for i in range(LEAF_POOL_SIZE)]
+    filler = len(spec.leaf_columns) - 1 + len(spec.unused_columns)
+    for n in range(rows):
+        keys = [randrange(cardinality) for _ in range(depth)]
+        if spec.sorted_keys:
+            keys[0] = n * cardinality // rows
+        row = [f"k{level}_{key}" for level, key in enumerate(keys)]
+        # the similar items are functions of the key of their level, so they never conflict within a group
+        row.extend(f"a{i}_{keys[level] * (i + 7) % 101}" for i, level in enumerate(similar_levels))
+        row.append(str(randrange(1, 10)))
+        row.extend(choices(pool, k=filler))
+        yield row
+
+
+def generate_csv(file_name, spec: DatasetSpec):
+    with open(file_name, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(spec.header)
+        writer.writerows(generate_rows(spec))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a denormalized CSV file and its group rule")
+    parser.add_argument("file_name")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--cardinality", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--similar-ratio", type=float, default=0.25)
+    parser.add_argument("--selected-ratio", type=float, default=1.0)
+    parser.add_argument("--sorted", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rule", help="File to save the group rule to")
+    args = parser.parse_args()
+    spec = DatasetSpec(rows=args.rows, columns=args.columns, cardinality=args.cardinality, depth=args.depth,
+                       similar_ratio=args.similar_ratio, selected_ratio=args.selected_ratio, sorted_keys=args.sorted,
+                       seed=args.seed)
+    generate_csv(args.file_name, spec)
+    if args.rule:
+        with open(args.rule, "w") as f:
+            json.dump(spec.rule(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
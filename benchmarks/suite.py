@@ -0,0 +1,269 @@
+"""
+Reproducible grouping benchmarks over generated datasets (see generator.py).
+Every scenario is measured in a fresh process: rows/second and seconds of the grouping, seconds of the JSON output
+and the peak RSS. The results are saved as JSON, by default to benchmarks/results/<commit>.json,
+and can be compared with the results of another commit.
+
+    python -m benchmarks.suite --scale 0.1 --scenario baseline --scenario wide
+    python -m benchmarks.suite --compare benchmarks/results/1a2b3c4.json
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_projection import dict_churn
+from benchmarks.generator import DatasetSpec, generate_csv
+from dyno_grp.definitions import GroupRule
+from dyno_grp.grouper import Grouper
+from dyno_grp.sinks import JsonSink
+
+try:
+    import resource
+except ImportError:  # pragma: no cover, e.g. on Windows
+    resource = None
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIRECTORY = os.path.join(ROOT_DIRECTORY, "benchmarks", "results")
+
+
+def _with_where(rule: dict) -> dict:
+    return dict(rule, where={"small_orders": "Qty <= 5"})
+
+
+def _aggregates_only(rule: dict) -> dict:
+    groups = dict(rule["groups"])
+    last_group = list(groups)[-1]
+    groups[last_group] = dict(groups[last_group], aggregated_property="items", keep_items=False,
+                              aggregates={"rows": "count", "total": "sum(Qty)", "max_qty": "max(Qty)"})
+    return dict(rule, groups=groups)
+
+
+class Scenario:
+    """A dataset, the options of Grouper.csv_to_json_grouper and an optional change of the generated rule"""
+    def __init__(self, name: str, spec: DatasetSpec, options: dict = None, rule=None, runner: str = "grouper") -> None:
+        super().__init__()
+        self.name = name
+        self.spec = spec
+        self.options = options or dict()
+        self._rule = rule
+        self.runner = runner
+
+    def rule(self) -> dict:
+        rule = self.spec.rule()
+        return rule if self._rule is None else self._rule(rule)
+
+
+SCENARIOS = [
+    # the shape of rule_test002.json: the top groups have a similar item
+    Scenario("baseline", DatasetSpec()),
+    Scenario("wide", DatasetSpec(columns=100, selected_ratio=0.1)),
+    Scenario("deep", DatasetSpec(columns=16, cardinality=20, depth=6)),
+    Scenario("high_cardinality", DatasetSpec(cardinality=100000, depth=2)),
+    Scenario("similar_heavy", DatasetSpec(columns=16, similar_ratio=0.75)),
+    Scenario("compact_interned", DatasetSpec(), {"compact": True, "intern_leaves": True}),
+    Scenario("where", DatasetSpec(), rule=_with_where),
+    Scenario("aggregates_only", DatasetSpec(), rule=_aggregates_only),
+    Scenario("spill", DatasetSpec(), {"memory_budget": 8 * 1024 * 1024}),
+    Scenario("sorted_input", DatasetSpec(sorted_keys=True), {"sorted_input": True}),
+    Scenario("parallel", DatasetSpec(), {"workers": 2}),
+    # the per row dict renaming and utils.filter_dict of the original grouping
+    Scenario("dict_churn", DatasetSpec(), runner="dict_churn"),
+]
+
+
+def scenarios_by_name():
+    return {scenario.name: scenario for scenario in SCENARIOS}
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of its finished children (workers) in MB, None if it is unknown"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_grouper(scenario: Scenario, file_name: str) -> dict:
+    grouper = Grouper.csv_to_json_grouper(file_name, scenario.rule(), **scenario.options)
+    start = time.perf_counter()
+    result = grouper()
+    group_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    with JsonSink(os.devnull) as sink:
+        for key, group in result.items():
+            sink.write_group(key, group)
+    return {"group_seconds": group_seconds, "output_seconds": time.perf_counter() - start, "groups": len(result)}
+
+
+def _run_dict_churn(scenario: Scenario, file_name: str) -> dict:
+    with open(file_name, newline="") as f:
+        rows = list(csv.DictReader(f))
+    start = time.perf_counter()
+    dict_churn(GroupRule.from_raw(scenario.rule()), rows)
+    return {"group_seconds": time.perf_counter() - start, "output_seconds": None, "groups": None}
+
+
+RUNNERS = {
+    "grouper": _run_grouper,
+    "dict_churn": _run_dict_churn,
+}
+
+
+def run_scenario(name: str, file_name: str) -> dict:
+    """Runs the scenario once in this process (meant to be a fresh one)"""
+    scenario = scenarios_by_name()[name]
+    start_rss = peak_rss_mb()
+    measurement = RUNNERS[scenario.runner](scenario, file_name)
+    measurement["start_rss_mb"] = start_rss
+    measurement["peak_rss_mb"] = peak_rss_mb()
+    return measurement
+
+
+def measure(scenario: Scenario, file_name: str, scale: float, repeat: int) -> dict:
+    """Runs the scenario repeat times, each in a fresh process, and keeps the best times and the highest RSS"""
+    runs = []
+    for _ in range(repeat):
+        # not a multiprocessing pool, its daemon processes cannot start the workers of the parallel grouping
+        process = subprocess.run([sys.executable, "-m", "benchmarks.suite", "--run", scenario.name, file_name],
+                                 cwd=ROOT_DIRECTORY, stdout=subprocess.PIPE, check=True, universal_newlines=True)
+        runs.append(json.loads(process.stdout))
+    rows = scenario.spec.scaled(scale).rows
+    group_seconds = min(run["group_seconds"] for run in runs)
+    output_seconds = [run["output_seconds"] for run in runs if run["output_seconds"] is not None]
+    peak_rss = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+    start_rss = [run["start_rss_mb"] for run in runs if run["start_rss_mb"] is not None]
+    return {
+        "rows": rows,
+        "groups": runs[0]["groups"],
+        "rows_per_second": rows / group_seconds if group_seconds else None,
+        "group_seconds": group_seconds,
+        "output_seconds": min(output_seconds) if output_seconds else None,
+        "start_rss_mb": max(start_rss) if start_rss else None,
+        "peak_rss_mb": max(peak_rss) if peak_rss else None,
+        "spec": scenario.spec.scaled(scale).as_dict(),
+        "options": scenario.options,
+        "runner": scenario.runner,
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(names, scale: float = 1.0, repeat: int = 3, report=print) -> dict:
+    scenarios = scenarios_by_name()
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = dict()
+        for name in names:
+            scenario = scenarios[name]
+            spec = scenario.spec.scaled(scale)
+            key = json.dumps(spec.as_dict(), sort_keys=True)
+            if key not in files:
+                files[key] = os.path.join(tmp_dir, f"{len(files)}.csv")
+                generate_csv(files[key], spec)
+            results[name] = result = measure(scenario, files[key], scale, repeat)
+            report(format_result(name, result))
+    return {
+        "meta": {
+            "commit": current_commit(),
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scale": scale,
+            "repeat": repeat,
+        },
+        "scenarios": results,
+    }
+
+
+def _format(value, spec):
+    if value is None:
+        # the width of the spec, e.g. >7 of >7.3f
+        return format("-", spec.split(".")[0].replace(",", ""))
+    return format(value, spec)
+
+
+def format_result(name: str, result: dict) -> str:
+    return f"{name:<18} {result['rows']:>10,} rows {_format(result['rows_per_second'], '>12,.0f')} rows/s " \
+           f"group {_format(result['group_seconds'], '>7.3f')}s output {_format(result['output_seconds'], '>7.3f')}s " \
+           f"peak RSS {_format(result['peak_rss_mb'], '>8.1f')} MB"
+
+
+def compare(results: dict, baseline: dict, threshold: float, report=print) -> bool:
+    """
+    Reports the changes against the baseline results, returns True if a scenario of the same rows is slower
+    or takes more memory by more than threshold (a fraction)
+    """
+    regressed = False
+    for name, result in results["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if old is None or old["rows"] != result["rows"]:
+            report(f"{name:<18} not in the baseline or of different rows")
+            continue
+        changes = []
+        for metric, higher_is_better in (("rows_per_second", True), ("output_seconds", False),
+                                         ("peak_rss_mb", False)):
+            new_value, old_value = result.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+            change = new_value / old_value - 1
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                regressed = True
+                flag = " REGRESSION"
+            changes.append(f"{metric} {change:+.1%}{flag}")
+        report(f"{name:<18} " + ", ".join(changes))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the grouping benchmarks")
+    parser.add_argument("--scenario", action="append", choices=[scenario.name for scenario in SCENARIOS],
+                        help="Scenario to run, may be repeated (all by default)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier of the rows of every scenario")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Results file, benchmarks/results/<commit>.json by default")
+    parser.add_argument("--compare", help="Results file of another commit to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown or memory growth reported as a regression")
+    parser.add_argument("--run", nargs=2, metavar=("SCENARIO", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        print(json.dumps(run_scenario(*args.run)))
+        return
+    if args.repeat <= 0 or args.scale <= 0:
+        parser.error("Repeat and scale must be positive")
+    names = args.scenario or [scenario.name for scenario in SCENARIOS]
+    results = run_suite(names, args.scale, args.repeat)
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        output = os.path.join(RESULTS_DIRECTORY, f"{results['meta']['commit'] or 'local'}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results are saved to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+This module contains the aggregate functions of the groups. An aggregate is declared per group as
+"function(Column)" (or just "count") and computed by a running accumulator as the rows stream in,
+so the totals of a group do not require its items to be kept.
+Missing values (None or empty cells) are skipped as in SQL. sum and avg coerce the values to numbers,
+min and max compare the numeric cells of untyped columns as numbers as well, so "10" is more than "9".
+"""
+import re
+
+from typing import Optional
+
+from dyno_grp.errors import ClauseException, ProcessException
+from dyno_grp.where_clause_lang.functions import as_number
+
+_SPEC = re.compile(r"^\s*(\w+)\s*(?:\(\s*([^()]*?)\s*\))?\s*$")
+
+
+def _comparable(value):
+    """The number of a numeric cell, None of an empty one, any other value as it is"""
+    if not isinstance(value, str):
+        return value
+    try:
+        return as_number(value)
+    except ProcessException:
+        return value
+
+
+class Count:
+    """Number of the rows, or of the non missing values of the column"""
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def add(self, value):
+        if value is not None and value != "":
+            self.value += 1
+
+    def merge(self, other: "Count"):
+        self.value += other.value
+
+    def result(self):
+        return self.value
+
+
+class Sum:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = None
+
+    def add(self, value):
+        if value is not None:
+            value = as_number(value)
+            if value is not None:
+                self.value = value if self.value is None else self.value + value
+
+    def merge(self, other: "Sum"):
+        if other.value is not None:
+            self.add(other.value)
+
+    def result(self):
+        return self.value
+
+
+class Min:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = None
+
+    def add(self, value):
+        value = _comparable(value)
+        try:
+            if value is not None and (self.value is None or value < self.value):
+                self.value = value
+        except TypeError:
+            raise ProcessException(f"Cannot compare '{value}' with '{self.value}'") from None
+
+    def merge(self, other: "Min"):
+        self.add(other.value)
+
+    def result(self):
+        return self.value
+
+
+class Max(Min):
+    __slots__ = ()
+
+    def add(self, value):
+        value = _comparable(value)
+        try:
+            if value is not None and (self.value is None or value > self.value):
+                self.value = value
+        except TypeError:
+            raise ProcessException(f"Cannot compare '{value}' with '{self.value}'") from None
+
+
+class Avg:
+    __slots__ = ("total", "count")
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.count = 0
+
+    def add(self, value):
+        if value is not None:
+            value = as_number(value)
+            if value is not None:
+                self.total += value
+                self.count += 1
+
+    def merge(self, other: "Avg"):
+        self.total += other.total
+        self.count += other.count
+
+    def result(self):
+        return self.total / self.count if self.count else None
+
+
+class CountDistinct:
+    __slots__ = ("values",)
+
+    def __init__(self) -> None:
+        self.values = set()
+
+    def add(self, value):
+        if value is not None and value != "":
+            self.values.add(value)
+
+    def merge(self, other: "CountDistinct"):
+        self.values.update(other.values)
+
+    def result(self):
+        return len(self.values)
+
+
+ACCUMULATORS = {
+    "count": Count,
+    "sum": Sum,
+    "min": Min,
+    "max": Max,
+    "avg": Avg,
+    "count_distinct": CountDistinct,
+}
+
+
+class Aggregate:
+    """An aggregate of a group: the output name, the function and the column (alias) it is computed of"""
+    def __init__(self, name: str, function: str, column: Optional[str] = None) -> None:
+        super().__init__()
+        if not name or not isinstance(name, str):
+            raise ClauseException("Aggregate name must be non empty string")
+        if function not in ACCUMULATORS:
+            raise ClauseException(f"Unknown aggregate function {function} of {name}. "
+                                  f"Known functions: {', '.join(ACCUMULATORS)}")
+        if column is None and function != "count":
+            raise ClauseException(f"Aggregate {name}: {function} requires a column")
+        self._name = name
+        self._function = function
+        self._column = column
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def function(self) -> str:
+        return self._function
+
+    @property
+    def column(self) -> Optional[str]:
+        return self._column
+
+    @property
+    def accumulator(self):
+        """Factory of the accumulators of the aggregate"""
+        return ACCUMULATORS[self._function]
+
+    def __repr__(self):
+        if self._column is None:
+            return f"{self.__class__.__name__}({self._name}, {self._function})"
+        return f"{self.__class__.__name__}({self._name}, {self._function}({self._column}))"
+
+    @staticmethod
+    def parse(name: str, spec: str) -> "Aggregate":
+        """Parses a spec like 'sum(Qty)' or 'count'"""
+        match = _SPEC.match(spec) if isinstance(spec, str) else None
+        if not match:
+            raise ClauseException(f"Invalid aggregate {name}: {spec!r}. Expected function(Column) or count")
+        function, column = match.group(1).lower(), match.group(2) or None
+        return Aggregate(name, function, column)
@@ -0,0 +1,126 @@
+"""
+This module contains the asyncio grouping of async data sources. The rows are consumed in batches,
+every batch is grouped synchronously and then the control is given back to the event loop.
+"""
+import asyncio
+
+from collections.abc import Mapping
+from typing import Optional
+
+from dyno_grp.builder import HierarchyBuilder
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
+from dyno_grp.sinks import OutputSink
+
+DEFAULT_BATCH_SIZE = 1024
+
+
+async def _async_rows(data_stream):
+    if hasattr(data_stream, "__aiter__"):
+        async for row in data_stream:
+            yield row
+    else:
+        for row in data_stream:
+            yield row
+
+
+class AsyncGrouper:
+    """
+    Groups the rows of one or several data streams into one result of the GroupRule. A stream is an async
+    iterable (or a plain iterable) of rows, optionally an async (or a plain) context manager as well.
+    As for the Grouper, the streams of non mapping rows must define a header. The streams are consumed
+    concurrently, every batch_size rows of a stream the grouping gives the control back to the event loop.
+    Several streams are given as a list or a tuple (so a list of rows is not a stream, iter() of it is)
+    """
+    def __init__(self,
+                 data_streams,
+                 group_rule: GroupRule,
+                 compact_leaves: bool = False,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 intern_leaves: bool = False) -> None:
+        super().__init__()
+        if batch_size <= 0:
+            raise ProcessException("Batch size must be positive")
+        if not isinstance(data_streams, (list, tuple)):
+            data_streams = [data_streams]
+        self._data_streams = list(data_streams)
+        self._group_rule = group_rule
+        self._compact_leaves = compact_leaves
+        self._batch_size = batch_size
+        self._intern_leaves = intern_leaves
+        self._builder: Optional[HierarchyBuilder] = None
+        self._result: Optional[dict] = None
+
+    def _batch_grouper(self, row, data_stream):
+        """Compiles the grouping of the batches of the stream, the first row determines the kind of the rows"""
+        by_name = isinstance(row, Mapping)
+        header = list(row) if by_name else getattr(data_stream, "header", None)
+        if header is None:
+            raise ProcessException("Stream of non mapping rows must define a header")
+        projector = self._group_rule.compile_projector(header, by_name=by_name)
+        predicate = self._group_rule.compile_predicate(header, by_name=by_name)
+        if self._builder is None:
+            self._builder = HierarchyBuilder(self._group_rule, projector.aliases, compact_leaves=self._compact_leaves,
+                                             intern_leaves=self._intern_leaves)
+        project = projector.getter_for(self._builder.aliases)
+        add = self._builder.add
+
+        def group_batch(batch):
+            rows = batch if predicate is None else filter(predicate, batch)
+            for values in map(project, rows):
+                add(values)
+        return group_batch
+
+    async def _consume_rows(self, data_stream):
+        batch = []
+        group_batch = None
+        async for row in _async_rows(data_stream):
+            batch.append(row)
+            if len(batch) >= self._batch_size:
+                group_batch = group_batch or self._batch_grouper(batch[0], data_stream)
+                group_batch(batch)
+                batch = []
+                await asyncio.sleep(0)
+        if batch:
+            group_batch = group_batch or self._batch_grouper(batch[0], data_stream)
+            group_batch(batch)
+
+    async def _consume(self, data_stream):
+        if hasattr(data_stream, "__aenter__"):
+            async with data_stream:
+                await self._consume_rows(data_stream)
+        elif hasattr(data_stream, "__enter__"):
+            with data_stream:
+                await self._consume_rows(data_stream)
+        else:
+            await self._consume_rows(data_stream)
+
+    async def _consume_all(self):
+        """Consumes the streams concurrently, if one fails the others are cancelled before the error is raised"""
+        tasks = [asyncio.ensure_future(self._consume(data_stream)) for data_stream in self._data_streams]
+        if not tasks:
+            return
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for task in tasks:
+            if task in done and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    async def __call__(self, sink: Optional[OutputSink] = None):
+        """Groups the streams. Returns the result dict, or, if a sink is given, writes the groups to it"""
+        self._builder = None
+        self._result = None
+        await self._consume_all()
+        if self._builder is None:
+            raise ProcessException("There is no data in the stream")
+        if sink is not None:
+            with sink:
+                for key, group in self._builder.items():
+                    sink.write_group(key, group)
+            return None
+        self._result = dict(self._builder.items())
+        return self._result
@@ -0,0 +1,287 @@
+"""
+This module contains the binary output of the Grouper. The output is columnar: the values of the same place
+in the groups of a batch of top level groups are stored together as one column, so the leaf items are stored
+as a column per alias and the groups of every level as the columns of their keys and values.
+The strings (the aliases, the keys and the string values) are stored once in a dictionary shared
+by the whole output and the columns refer to them by their codes, so loading the output back
+neither parses the repeated text nor decodes it value by value.
+
+The output is the magic, the blocks of top level groups, the strings and the trailer (the number of the blocks
+and the offset of the strings). A block is the number of its groups, the column of their keys and the column
+of the groups. A column is its kind followed by its data, e.g. the codes of the strings, the numbers,
+the keys of the dicts and a column per key, or the lengths of the lists and the column of their items.
+The numbers are little endian.
+"""
+import datetime
+import struct
+import sys
+
+from array import array
+from decimal import Decimal
+from itertools import accumulate, chain, islice, repeat
+from operator import itemgetter
+
+from dyno_grp.encoding import ColumnDictionary
+from dyno_grp.errors import ProcessException
+from dyno_grp.sinks import OutputSink
+
+DEFAULT_BATCH_SIZE = 1024
+
+_WRITE_BUFFER_SIZE = 1 << 20
+_MAGIC = b"DGBIN\x00\x00\x01"
+_TRAILER = struct.Struct("<QQ")
+_UINT32 = struct.Struct("<I")
+_UINT32_MAX = (1 << 32) - 1
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+_CODES = "I" if array("I").itemsize == 4 else "L"
+_SWAP = sys.byteorder != "little"
+
+# the kinds of the columns
+_STR, _INT, _BIG_INT, _FLOAT, _BOOL, _NONE = b"sqBdbN"
+_DECIMAL, _DATE, _DATETIME, _TIME = b"Maet"
+# the dicts of the same keys (e.g. the leaf items), the other dicts, the lists, the values with None and the mixed
+_RECORD, _MAP, _LIST, _NULLABLE, _MIXED = b"rmlnv"
+
+# the kinds of the values stored as the codes of their text
+_TEXT_KINDS = {
+    _BIG_INT: (str, int),
+    _DECIMAL: (str, Decimal),
+    _DATE: (datetime.date.isoformat, datetime.date.fromisoformat),
+    _DATETIME: (datetime.datetime.isoformat, datetime.datetime.fromisoformat),
+    _TIME: (datetime.time.isoformat, datetime.time.fromisoformat),
+}
+
+
+def _kind(value_type) -> int:
+    # datetime is a date, bool is an int
+    for kind, kind_type in ((_STR, str), (_BOOL, bool), (_INT, int), (_FLOAT, float), (_RECORD, dict),
+                            (_LIST, (list, tuple)), (_DECIMAL, Decimal), (_DATETIME, datetime.datetime),
+                            (_DATE, datetime.date), (_TIME, datetime.time)):
+        if issubclass(value_type, kind_type):
+            return kind
+    if value_type is type(None):
+        return _NONE
+    raise ProcessException(f"Object of type {value_type.__name__} cannot be written in the binary output")
+
+
+def _array_bytes(values: array) -> bytes:
+    if _SWAP:
+        values.byteswap()
+    return values.tobytes()
+
+
+def _array_of(typecode: str, data) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if _SWAP:
+        values.byteswap()
+    return values
+
+
+class BinarySink(OutputSink):
+    """
+    Writes the result in the binary format, see load_binary. A target may be a file name or an already opened
+    binary stream. The top level groups are written in blocks of batch_size groups, which are kept until written
+    """
+    def __init__(self, target, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        super().__init__(target)
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        self._batch_size = batch_size
+        self._strings = ColumnDictionary(max_size=None)
+        self._keys = []
+        self._groups = []
+        self._blocks = 0
+        self._offset = 0
+
+    def open(self):
+        if isinstance(self._target, str):
+            self._fp = open(self._target, "wb", buffering=_WRITE_BUFFER_SIZE)
+            self._owns_fp = True
+        else:
+            self._fp = self._target
+            self._owns_fp = False
+        self._start()
+
+    def _start(self):
+        self._strings = ColumnDictionary(max_size=None)
+        self._keys, self._groups = [], []
+        self._blocks = 0
+        self._offset = 0
+        self._write(_MAGIC)
+
+    def _write(self, data):
+        self._fp.write(data)
+        self._offset += len(data)
+
+    def _write_group(self, key, group):
+        self._keys.append(key)
+        self._groups.append(group)
+        if len(self._groups) >= self._batch_size:
+            self._write_block()
+
+    def _write_block(self):
+        out = bytearray(_UINT32.pack(len(self._groups)))
+        self._encode(self._keys, out)
+        self._encode(self._groups, out)
+        self._keys, self._groups = [], []
+        self._write(out)
+        self._blocks += 1
+
+    def _finish(self):
+        if self._groups:
+            self._write_block()
+        strings_offset = self._offset
+        strings = self._strings.values
+        self._write(_UINT32.pack(len(strings)))
+        self._write(_array_bytes(array(_CODES, map(len, strings))))
+        self._write("".join(strings).encode("utf-8"))
+        self._write(_TRAILER.pack(self._blocks, strings_offset))
+
+    def _codes(self, strings, out: bytearray):
+        out += _array_bytes(array(_CODES, map(self._strings.encode, strings)))
+
+    @staticmethod
+    def _lengths(values, out: bytearray):
+        lengths = list(map(len, values))
+        if lengths and max(lengths) > _UINT32_MAX:
+            raise ProcessException("Collection is too large for the binary output")
+        out += _array_bytes(array(_CODES, lengths))
+
+    def _encode(self, values: list, out: bytearray):
+        """Encodes the column of the values"""
+        kinds = set(map(_kind, set(map(type, values))))
+        non_null = kinds - {_NONE}
+        if len(kinds) == 1:
+            kind = kinds.pop()
+        elif _NONE in kinds and len(non_null) == 1:
+            kind = _NULLABLE
+        else:
+            kind = _MIXED
+        if kind == _INT and not _INT64_MIN <= min(values) <= max(values) <= _INT64_MAX:
+            kind = _BIG_INT
+        if kind == _RECORD:
+            shapes = set(map(tuple, values))
+            keys = shapes.pop() if len(shapes) == 1 else None
+            # a column of a few dicts of many keys, e.g. of the children of a group, is not worth a column per key
+            if keys is None or len(keys) > len(values) or not all(type(key) is str for key in keys):
+                kind = _MAP
+        out.append(kind)
+        if kind == _STR:
+            self._codes(values, out)
+        elif kind == _RECORD:
+            out += _UINT32.pack(len(keys))
+            self._codes(keys, out)
+            for key in keys:
+                self._encode(list(map(itemgetter(key), values)), out)
+        elif kind == _MAP:
+            self._lengths(values, out)
+            self._encode(list(chain.from_iterable(values)), out)
+            self._encode(list(chain.from_iterable(map(dict.values, values))), out)
+        elif kind == _LIST:
+            self._lengths(values, out)
+            self._encode(list(chain.from_iterable(values)), out)
+        elif kind == _INT:
+            out += _array_bytes(array("q", values))
+        elif kind == _FLOAT:
+            out += _array_bytes(array("d", values))
+        elif kind == _BOOL:
+            out += bytes(values)
+        elif kind in _TEXT_KINDS:
+            self._codes(map(_TEXT_KINDS[kind][0], values), out)
+        elif kind == _NULLABLE:
+            out += bytes(value is not None for value in values)
+            self._encode([value for value in values if value is not None], out)
+        elif kind == _MIXED:
+            for value in values:
+                self._encode([value], out)
+
+
+class _Decoder:
+    def __init__(self, data, strings) -> None:
+        super().__init__()
+        self._data = data
+        self._strings = strings
+        self.position = 0
+
+    def uint32(self) -> int:
+        value = _UINT32.unpack_from(self._data, self.position)[0]
+        self.position += _UINT32.size
+        return value
+
+    def _take(self, size: int):
+        data = self._data[self.position:self.position + size]
+        self.position += size
+        return data
+
+    def _codes(self, count: int) -> array:
+        return _array_of(_CODES, self._take(4 * count))
+
+    def _strings_of(self, count: int) -> list:
+        return list(map(self._strings.__getitem__, self._codes(count)))
+
+    def decode(self, count: int) -> list:
+        """Decodes the column of count values"""
+        kind = self._data[self.position]
+        self.position += 1
+        if kind == _STR:
+            return self._strings_of(count)
+        if kind == _RECORD:
+            keys = self._strings_of(self.uint32())
+            columns = [self.decode(count) for _ in keys]
+            if not keys:
+                return [dict() for _ in range(count)]
+            return list(map(dict, map(zip, repeat(keys), zip(*columns))))
+        if kind == _MAP:
+            lengths = self._codes(count)
+            total = sum(lengths)
+            items = zip(self.decode(total), self.decode(total))
+            return [dict(islice(items, length)) for length in lengths]
+        if kind == _LIST:
+            lengths = self._codes(count)
+            items = iter(self.decode(sum(lengths)))
+            return [list(islice(items, length)) for length in lengths]
+        if kind == _INT:
+            return _array_of("q", self._take(8 * count)).tolist()
+        if kind == _FLOAT:
+            return _array_of("d", self._take(8 * count)).tolist()
+        if kind == _BOOL:
+            return list(map(bool, self._take(count)))
+        if kind == _NONE:
+            return [None] * count
+        if kind in _TEXT_KINDS:
+            return list(map(_TEXT_KINDS[kind][1], self._strings_of(count)))
+        if kind == _NULLABLE:
+            present = bytes(self._take(count))
+            values = iter(self.decode(sum(present)))
+            return [next(values) if is_present else None for is_present in present]
+        if kind == _MIXED:
+            return [self.decode(1)[0] for _ in range(count)]
+        raise ProcessException(f"Invalid column kind {kind} at {self.position - 1} of the binary output")
+
+
+def load_binary(source) -> dict:
+    """Loads the result written by BinarySink from a file name or a binary stream"""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source.read()
+    if len(data) < len(_MAGIC) + _TRAILER.size or not data.startswith(_MAGIC):
+        raise ProcessException("Not a binary output of the grouping")
+    data = memoryview(data)
+    blocks, strings_offset = _TRAILER.unpack_from(data, len(data) - _TRAILER.size)
+    count = _UINT32.unpack_from(data, strings_offset)[0]
+    lengths_offset = strings_offset + _UINT32.size
+    text_offset = lengths_offset + 4 * count
+    lengths = _array_of(_CODES, data[lengths_offset:text_offset])
+    text = bytes(data[text_offset:len(data) - _TRAILER.size]).decode("utf-8")
+    strings = [text[end - length:end] for end, length in zip(accumulate(lengths), lengths)]
+    decoder = _Decoder(data[:strings_offset], strings)
+    decoder.position = len(_MAGIC)
+    result = dict()
+    for _ in range(blocks):
+        groups = decoder.uint32()
+        keys = decoder.decode(groups)
+        result.update(zip(keys, decoder.decode(groups)))
+    return result
@@ -0,0 +1,274 @@
+"""
+This module contains the single pass hierarchy builder used by the Grouper.
+Every row is inserted directly to its final position in the nested groups hierarchy.
+"""
+from typing import Sequence
+
+from dyno_grp.definitions import GroupRule
+from dyno_grp.encoding import ColumnDictionary, interning_getter
+from dyno_grp.errors import ProcessException
+from dyno_grp.projection import tuple_getter
+
+
+class _Level:
+    __slots__ = ("group_name", "key_index", "aggregated_property", "similar_items", "similar_indices", "similar",
+                 "aggregates", "keep_items", "is_last")
+
+    def __init__(self, group_name, key_index, aggregated_property, similar_items, similar_indices, is_last,
+                 aggregates=(), keep_items=True) -> None:
+        super().__init__()
+        self.group_name = group_name
+        self.key_index = key_index
+        self.aggregated_property = aggregated_property
+        self.similar_items = similar_items
+        self.similar_indices = similar_indices
+        self.similar = tuple(zip(similar_items, similar_indices))
+        # (name, accumulator factory, index of the value or None for counting the rows)
+        self.aggregates = aggregates
+        self.keep_items = keep_items
+        self.is_last = is_last
+
+
+class HierarchyBuilder:
+    """
+    Builds the groups hierarchy from projected rows, i.e. tuples of values ordered as the given aliases.
+    If compact_leaves is True the leaf items are kept as tuples and turned into dicts only on output.
+    If intern_leaves is True the leaf values are dictionary encoded, so the items share one object
+    per distinct value of a column (the group keys and similar items are kept once per group anyway).
+    The aggregates of the groups are kept as running accumulators and turned into their results on output
+    """
+    def __init__(self,
+                 group_rule: GroupRule,
+                 aliases: Sequence[str],
+                 compact_leaves: bool = False,
+                 intern_leaves: bool = False) -> None:
+        super().__init__()
+        self._group_rule = group_rule
+        self._compact_leaves = compact_leaves
+        self._aliases = tuple(aliases)
+        self._levels = self._build_levels(group_rule, self._aliases)
+        # the internal hierarchy differs from the output one, so it is materialized group by group on output
+        self._materialize_output = compact_leaves or any(level.aggregates for level in self._levels)
+        self._keeps_leaves = self._levels[-1].keep_items
+        leaf_indices = self._leaf_indices(group_rule, self._aliases)
+        self._leaf_positions = leaf_indices
+        self._leaf_names = tuple(self._aliases[i] for i in leaf_indices)
+        self._intern_leaves = intern_leaves
+        self._leaf_getter = tuple_getter(leaf_indices)
+        if intern_leaves:
+            self._leaf_getter = interning_getter(self._leaf_getter, [ColumnDictionary() for _ in self._leaf_names])
+        self._result = dict()
+
+    @staticmethod
+    def _build_levels(group_rule: GroupRule, aliases: Sequence[str]):
+        groups = [group_def for _, group_def in group_rule.group_clause.items()]
+        consumed = set(group_def.group_name for group_def in groups)
+        levels = []
+        for i, group_def in enumerate(groups):
+            # similar items which were already lifted by an upper level do not reach lower levels anymore
+            similar_indices = tuple(j for j, alias in enumerate(aliases)
+                                    if alias in group_def.similar_items and alias not in consumed)
+            similar_items = tuple(aliases[j] for j in similar_indices)
+            consumed.update(similar_items)
+            levels.append(_Level(group_name=group_def.group_name,
+                                 key_index=aliases.index(group_def.group_name),
+                                 aggregated_property=group_def.aggregated_property,
+                                 similar_items=similar_items,
+                                 similar_indices=similar_indices,
+                                 is_last=i == len(groups) - 1,
+                                 aggregates=tuple((aggregate.name, aggregate.accumulator,
+                                                   aliases.index(aggregate.column) if aggregate.column else None)
+                                                  for aggregate in group_def.aggregates),
+                                 keep_items=group_def.keep_items))
+        return tuple(levels)
+
+    @staticmethod
+    def _leaf_indices(group_rule: GroupRule, aliases: Sequence[str]):
+        consumed = set()
+        for group_name, group_def in group_rule.group_clause.items():
+            consumed.add(group_name)
+            consumed.update(group_def.similar_items)
+        return tuple(i for i, alias in enumerate(aliases) if alias not in consumed)
+
+    @property
+    def group_rule(self) -> GroupRule:
+        return self._group_rule
+
+    @property
+    def aliases(self):
+        return self._aliases
+
+    @property
+    def leaf_names(self):
+        return self._leaf_names
+
+    @property
+    def leaf_indices(self):
+        """Indices of the leaf values in the added tuples, aligned to leaf_names"""
+        return self._leaf_positions
+
+    @property
+    def levels(self):
+        """Layout of the group levels as the rows are added, e.g. for the generated grouping (see codegen.py)"""
+        return self._levels
+
+    @property
+    def intern_leaves(self) -> bool:
+        return self._intern_leaves
+
+    @property
+    def compact_leaves(self) -> bool:
+        return self._compact_leaves
+
+    @property
+    def result(self) -> dict:
+        if not self._materialize_output:
+            return self._result
+        return dict(self.items())
+
+    @property
+    def state(self) -> dict:
+        """The hierarchy in the internal representation of the builder (e.g. with compact leaves)"""
+        return self._result
+
+    def merge(self, state: dict):
+        """
+        Merges a hierarchy built by another builder of the same rule and aliases into this one.
+        Groups which are new to this builder are appended, so the first seen order is kept
+        """
+        self._merge_level(self._result, state, 0)
+
+    def check_merge(self, state: dict):
+        """Raises ProcessException if the similar items of the state conflict with this builder, leaving it intact"""
+        self._check_level(self._result, state, 0)
+
+    @staticmethod
+    def _check_similar(level: _Level, child: dict, other_child: dict):
+        for k in level.similar_items:
+            if child[k] != other_child[k]:
+                raise ProcessException(f"Cannot combine similar items for Column Alias {k}. "
+                                       f"Found different values '{child[k]}' and '{other_child[k]}'")
+
+    def _check_level(self, node: dict, other: dict, depth: int):
+        level = self._levels[depth]
+        aggregated_property = level.aggregated_property
+        for key, other_child in other.items():
+            child = node.get(key)
+            if child is None:
+                continue
+            if aggregated_property is not None:
+                self._check_similar(level, child, other_child)
+                if not level.keep_items:
+                    continue
+                child, other_child = child[aggregated_property], other_child[aggregated_property]
+            if not level.is_last:
+                self._check_level(child, other_child, depth + 1)
+
+    def _merge_level(self, node: dict, other: dict, depth: int):
+        level = self._levels[depth]
+        aggregated_property = level.aggregated_property
+        for key, other_child in other.items():
+            child = node.get(key)
+            if child is None:
+                node[key] = other_child
+                continue
+            if aggregated_property is None:
+                children, other_children = child, other_child
+            else:
+                self._check_similar(level, child, other_child)
+                for name, _, _ in level.aggregates:
+                    child[name].merge(other_child[name])
+                if not level.keep_items:
+                    continue
+                children, other_children = child[aggregated_property], other_child[aggregated_property]
+            if level.is_last:
+                children.extend(other_children)
+            else:
+                self._merge_level(children, other_children, depth + 1)
+
+    def items(self):
+        """
+        Iterates over the top level groups as (key, group) pairs, materializing compact leaves group by group
+        """
+        return self._items(self._result)
+
+    def group(self, key):
+        """The top level group of the key, materialized as by items"""
+        node = self._result[key]
+        return self._materialize(node, 0) if self._materialize_output else node
+
+    def drain(self):
+        """Same as items, but the groups built so far are removed from the builder"""
+        result, self._result = self._result, dict()
+        return self._items(result)
+
+    def _items(self, result: dict):
+        if not self._materialize_output:
+            yield from result.items()
+            return
+        for key, node in result.items():
+            yield key, self._materialize(node, 0)
+
+    def _materialize(self, node, depth: int):
+        level = self._levels[depth]
+        aggregated_property = level.aggregated_property
+        if not level.keep_items:
+            leaves = None
+        elif level.is_last:
+            leaves = node[aggregated_property] if aggregated_property else node
+            if self._compact_leaves:
+                leaf_names = self._leaf_names
+                leaves = [dict(zip(leaf_names, leaf)) for leaf in leaves]
+        else:
+            children = node[aggregated_property] if aggregated_property else node
+            leaves = {key: self._materialize(child, depth + 1) for key, child in children.items()}
+        if not aggregated_property:
+            return leaves
+        group = dict(node)
+        if leaves is not None:
+            group[aggregated_property] = leaves
+        for name, _, _ in level.aggregates:
+            group[name] = node[name].result()
+        return group
+
+    def add(self, values: tuple):
+        leaf = None
+        if self._keeps_leaves:
+            leaf = self._leaf_getter(values)
+            if not self._compact_leaves:
+                leaf = dict(zip(self._leaf_names, leaf))
+        node = self._result
+        for level in self._levels:
+            key = values[level.key_index]
+            child = node.get(key)
+            aggregated_property = level.aggregated_property
+            if aggregated_property is None:
+                if level.is_last:
+                    if child is None:
+                        child = node[key] = []
+                    child.append(leaf)
+                    return
+                if child is None:
+                    child = node[key] = dict()
+                node = child
+                continue
+            if child is None:
+                child = node[key] = dict()
+                if level.keep_items:
+                    child[aggregated_property] = [] if level.is_last else dict()
+                for k, i in level.similar:
+                    child[k] = values[i]
+                for name, accumulator, _ in level.aggregates:
+                    child[name] = accumulator()
+            else:
+                for k, i in level.similar:
+                    v = values[i]
+                    if child[k] != v:
+                        raise ProcessException(f"Cannot combine similar items for Column Alias {k}. "
+                                               f"Found different values '{child[k]}' and '{v}'")
+            for name, _, i in level.aggregates:
+                child[name].add(True if i is None else values[i])
+            if not level.keep_items:
+                return
+            node = child[aggregated_property]
+        node.append(leaf)
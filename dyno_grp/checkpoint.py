@@ -0,0 +1,126 @@
+"""
+This module contains the checkpoints of the in memory grouping of a CSV file. A checkpoint holds
+the partial hierarchy of the builder and the byte offset of the stream up to which the rows were grouped,
+so a failed or killed run is resumed from the offset rather than regrouping the consumed part of the file.
+"""
+import os
+import pickle
+import zlib
+
+from typing import Optional
+
+from dyno_grp.errors import ProcessException
+
+_MAGIC = b"DGCKPT"
+_VERSION = 2
+_READ_SIZE = 1024 * 1024
+DEFAULT_INTERVAL = 256 * 1024 * 1024
+
+
+def _crc(file_name, start: int, end: int, crc: int = 0) -> int:
+    """Continues the CRC of the bytes of the file before start with the bytes from start to end"""
+    with open(file_name, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(remaining, _READ_SIZE))
+            if not data:
+                break
+            crc = zlib.crc32(data, crc)
+            remaining -= len(data)
+    return crc
+
+
+class Checkpoint:
+    """
+    A checkpoint file of the grouping. The state is saved every interval bytes of the stream
+    (at the end of a block of records), pickled with the highest protocol and replaced atomically.
+    A checkpoint is loaded only if it was saved for the same rule, the same builder settings
+    and the consumed part of the file did not change (its CRC is the same). The CRC is continued from save
+    to save, so every byte is read once more, rather than once per save
+    """
+    def __init__(self, path, interval: int = DEFAULT_INTERVAL) -> None:
+        super().__init__()
+        if interval <= 0:
+            raise ValueError("Checkpoint interval must be positive")
+        self._path = path
+        self._interval = interval
+        self._saved_offset = 0
+        self._crc = 0
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def interval(self) -> int:
+        return self._interval
+
+    def exists(self) -> bool:
+        return os.path.exists(self._path)
+
+    def _meta(self, file_name, builder) -> dict:
+        return {
+            "rule": builder.group_rule.fingerprint,
+            "file": os.path.abspath(file_name),
+            "aliases": builder.aliases,
+            "compact_leaves": builder.compact_leaves,
+        }
+
+    def save(self, file_name, offset: int, builder):
+        meta = self._meta(file_name, builder)
+        if offset < self._saved_offset:
+            self._saved_offset, self._crc = 0, 0
+        crc = _crc(file_name, self._saved_offset, offset, self._crc)
+        meta["offset"] = offset
+        meta["crc"] = crc
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_MAGIC)
+            pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickler.dump(_VERSION)
+            pickler.dump(meta)
+            pickler.dump(builder.state)
+        os.replace(tmp_path, self._path)
+        self._saved_offset = offset
+        self._crc = crc
+
+    def maybe_save(self, file_name, offset: int, builder) -> bool:
+        """Saves the state if at least interval bytes were grouped since the last save"""
+        if offset - self._saved_offset < self._interval:
+            return False
+        self.save(file_name, offset, builder)
+        return True
+
+    def load(self, file_name, builder) -> Optional[int]:
+        """
+        Merges the saved state into the (empty) builder and returns the offset to resume the stream from.
+        Returns None if there is no checkpoint. Raises ProcessException if the checkpoint does not match
+        """
+        self._saved_offset, self._crc = 0, 0
+        if not self.exists():
+            return None
+        with open(self._path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ProcessException(f"{self._path} is not a grouping checkpoint")
+            unpickler = pickle.Unpickler(f)
+            version = unpickler.load()
+            if version != _VERSION:
+                raise ProcessException(f"Unsupported checkpoint version {version}")
+            meta = unpickler.load()
+            offset = meta.pop("offset")
+            crc = meta.pop("crc")
+            if meta != self._meta(file_name, builder):
+                raise ProcessException(f"Checkpoint {self._path} was saved for another rule or file")
+            if os.path.getsize(file_name) < offset or _crc(file_name, 0, offset) != crc:
+                raise ProcessException(f"File {file_name} changed since checkpoint {self._path} was saved")
+            builder.merge(unpickler.load())
+        self._saved_offset = offset
+        self._crc = crc
+        return offset
+
+    def remove(self):
+        self._saved_offset = 0
+        self._crc = 0
+        if self.exists():
+            os.remove(self._path)
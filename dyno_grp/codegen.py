@@ -0,0 +1,221 @@
+"""
+This module contains the code generator of the grouping loop. A Group Rule and a stream header are turned into
+the source of a plain Python function which filters the raw rows, takes their values by literal keys and adds them
+to the hierarchy with the group levels unrolled, so no rule structure is looked up per row.
+The compiled code is cached on disk by the fingerprint of the rule and the layout of the rows.
+"""
+import hashlib
+import marshal
+import os
+import stat
+import sys
+
+from typing import Callable, Dict, Optional, Sequence
+
+from dyno_grp.builder import HierarchyBuilder
+from dyno_grp.errors import ProcessException
+
+# bumped whenever the generated code changes, so stale cached code is not loaded
+CODEGEN_VERSION = 1
+FUNCTION_NAME = "group_rows"
+
+
+def default_cache_directory() -> str:
+    """The per user cache directory, $XDG_CACHE_HOME/dyno_grp/codegen or ~/.cache/dyno_grp/codegen"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "dyno_grp", "codegen")
+
+
+def _trusted(st) -> bool:
+    """The file is owned by the current user and no one else can write to it"""
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        return False
+    return not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _similar_items_conflict(alias, value, other_value):
+    raise ProcessException(f"Cannot combine similar items for Column Alias {alias}. "
+                           f"Found different values '{value}' and '{other_value}'")
+
+
+def generate_source(builder: HierarchyBuilder,
+                    keys: Sequence,
+                    converters: Sequence[Optional[Callable]],
+                    has_predicate: bool) -> str:
+    """
+    Generates the source of group_rows(rows, result) which adds the raw rows to result, the internal hierarchy
+    of the builder, exactly as the builder does, and returns the number of the grouped rows.
+    keys are the keys of the values in the raw rows aligned to the aliases of the builder and converters are
+    aligned to them as well. The callables the code refers to are bound by compile_grouping
+    """
+    if builder.intern_leaves:
+        raise ProcessException("Interned leaves are not supported by the generated grouping")
+    value_names = [f"value{i}" for i in range(len(keys))]
+    arguments = ["predicate=predicate"] if has_predicate else []
+    arguments.append("conflict=conflict")
+    arguments.extend(f"convert{i}=convert{i}" for i, convert in enumerate(converters) if convert is not None)
+    for depth, level in enumerate(builder.levels):
+        arguments.extend(f"accumulator{depth}_{j}=accumulator{depth}_{j}" for j in range(len(level.aggregates)))
+    lines = [
+        f"def {FUNCTION_NAME}(rows, result, {', '.join(arguments)}):",
+        "    grouped = 0",
+        "    for row in rows:",
+    ]
+    if has_predicate:
+        lines.extend(["        if not predicate(row):", "            continue"])
+    lines.append("        grouped += 1")
+    for i, (key, convert) in enumerate(zip(keys, converters)):
+        value = f"row[{key!r}]"
+        lines.append(f"        {value_names[i]} = {f'convert{i}({value})' if convert is not None else value}")
+    leaf_values = [value_names[i] for i in builder.leaf_indices]
+    if builder.compact_leaves:
+        leaf = f"({', '.join(leaf_values)},)" if leaf_values else "()"
+    else:
+        leaf = "{" + ", ".join(f"{name!r}: {value}" for name, value in zip(builder.leaf_names, leaf_values)) + "}"
+    lines.append("        node = result")
+    for depth, level in enumerate(builder.levels):
+        key = value_names[level.key_index]
+        lines.append(f"        # {level.group_name!r}")
+        lines.append(f"        child = node.get({key})")
+        aggregated_property = level.aggregated_property
+        if aggregated_property is None:
+            if level.is_last:
+                lines.extend([
+                    "        if child is None:",
+                    f"            node[{key}] = [{leaf}]",
+                    "        else:",
+                    f"            child.append({leaf})",
+                ])
+            else:
+                lines.extend([
+                    "        if child is None:",
+                    f"            child = node[{key}] = {{}}",
+                    "        node = child",
+                ])
+            continue
+        items = []
+        if level.keep_items:
+            items.append(f"{aggregated_property!r}: {'[]' if level.is_last else '{}'}")
+        items.extend(f"{alias!r}: {value_names[i]}" for alias, i in level.similar)
+        items.extend(f"{name!r}: accumulator{depth}_{j}()" for j, (name, _, _) in enumerate(level.aggregates))
+        lines.extend([
+            "        if child is None:",
+            f"            child = node[{key}] = {{{', '.join(items)}}}",
+        ])
+        if level.similar:
+            lines.append("        else:")
+            for alias, i in level.similar:
+                lines.extend([
+                    f"            if child[{alias!r}] != {value_names[i]}:",
+                    f"                conflict({alias!r}, child[{alias!r}], {value_names[i]})",
+                ])
+        for name, _, i in level.aggregates:
+            lines.append(f"        child[{name!r}].add({'True' if i is None else value_names[i]})")
+        if not level.keep_items:
+            break
+        if level.is_last:
+            lines.append(f"        child[{aggregated_property!r}].append({leaf})")
+        else:
+            lines.append(f"        node = child[{aggregated_property!r}]")
+    lines.append("    return grouped")
+    return "\n".join(lines) + "\n"
+
+
+class CodeCache:
+    """
+    Cache of the generated grouping code. The code is compiled once and stored (marshalled, with its source
+    for reading) in the directory, by default in the per user cache directory, keyed by the fingerprint of the rule,
+    the layout of the rows and the Python version, so repeated jobs load the compiled code.
+    The loaded code is executed, so it is loaded only from a directory and files which are owned by the current user
+    and not writable by others, the directory is created accessible only to the user
+    """
+    def __init__(self, directory: Optional[str] = None) -> None:
+        super().__init__()
+        self._directory = directory or default_cache_directory()
+        self._codes: Dict[str, object] = dict()
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @staticmethod
+    def cache_key(builder: HierarchyBuilder, keys: Sequence, converters: Sequence, has_predicate: bool) -> str:
+        layout = (CODEGEN_VERSION, builder.group_rule.fingerprint, builder.aliases, tuple(keys),
+                  tuple(convert is not None for convert in converters), builder.compact_leaves, has_predicate)
+        return hashlib.sha1(repr(layout).encode("utf-8")).hexdigest()
+
+    def code(self, builder: HierarchyBuilder, keys: Sequence, converters: Sequence, has_predicate: bool):
+        """Returns the compiled code of the module defining group_rows, generating it if it is not cached"""
+        key = self.cache_key(builder, keys, converters, has_predicate)
+        code = self._codes.get(key)
+        if code is not None:
+            return code
+        tag = sys.implementation.cache_tag or "python"
+        code_path = os.path.join(self._directory, f"{key}.{tag}.bin")
+        source_path = os.path.join(self._directory, f"{key}.py")
+        try:
+            code = self._load(code_path)
+        except (OSError, EOFError, ValueError, TypeError):
+            code = None
+        if code is None:
+            source = generate_source(builder, keys, converters, has_predicate)
+            code = compile(source, source_path, "exec")
+            self._store(source_path, source.encode("utf-8"))
+            self._store(code_path, marshal.dumps(code))
+        self._codes[key] = code
+        return code
+
+    def _trusted_directory(self) -> bool:
+        try:
+            st = os.stat(self._directory)
+        except OSError:
+            return False
+        return stat.S_ISDIR(st.st_mode) and _trusted(st)
+
+    def _load(self, code_path):
+        """The cached code, None if it is not cached or the cache cannot be trusted"""
+        if not self._trusted_directory():
+            return None
+        fd = os.open(code_path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0) | getattr(os, "O_BINARY", 0))
+        with open(fd, "rb") as f:
+            st = os.fstat(f.fileno())
+            if not stat.S_ISREG(st.st_mode) or not _trusted(st):
+                return None
+            return marshal.load(f)
+
+    def _store(self, path, data: bytes):
+        # written to a temporary file and renamed, so concurrent jobs never read a partial file
+        try:
+            os.makedirs(self._directory, mode=0o700, exist_ok=True)
+            if not self._trusted_directory():
+                return
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o600)
+            with open(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # the cache is an optimization, the code is used even if it cannot be stored
+            pass
+
+
+def compile_grouping(builder: HierarchyBuilder,
+                     keys: Sequence,
+                     converters: Sequence[Optional[Callable]],
+                     predicate: Optional[Callable] = None,
+                     cache: Optional[CodeCache] = None):
+    """
+    Returns group_rows(rows) adding the raw rows to the builder by the generated code, it returns the number
+    of the grouped rows. keys and converters are the ones of the projector of the rows (see RowProjector)
+    """
+    cache = cache or CodeCache()
+    code = cache.code(builder, keys, converters, predicate is not None)
+    namespace = {"predicate": predicate, "conflict": _similar_items_conflict}
+    namespace.update((f"convert{i}", convert) for i, convert in enumerate(converters) if convert is not None)
+    for depth, level in enumerate(builder.levels):
+        namespace.update((f"accumulator{depth}_{j}", accumulator)
+                         for j, (_, accumulator, _) in enumerate(level.aggregates))
+    exec(code, namespace)
+    group_rows = namespace[FUNCTION_NAME]
+    state = builder.state
+    return lambda rows: group_rows(rows, state)
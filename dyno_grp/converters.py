@@ -0,0 +1,65 @@
+"""
+Converters of the raw (string) values of the typed columns. A converter is compiled once per column
+and memoizes the converted values, so the values repeated in a column are parsed only once.
+"""
+import datetime
+
+from decimal import Decimal, InvalidOperation
+
+from dyno_grp.errors import ClauseException, ProcessException
+
+# number of distinct raw values memoized per column, the cache is reset when it is full
+CACHE_SIZE = 64 * 1024
+
+_TRUE = frozenset(("true", "t", "yes", "y", "1"))
+_FALSE = frozenset(("false", "f", "no", "n", "0"))
+_MISSING = object()
+
+
+def parse_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in _TRUE:
+        return True
+    if lowered in _FALSE:
+        return False
+    raise ValueError(f"Invalid bool {value}")
+
+
+COLUMN_TYPES = {
+    "int": int,
+    "float": float,
+    "decimal": Decimal,
+    "date": datetime.date.fromisoformat,
+    "bool": parse_bool,
+}
+
+
+def converter(column_type: str, column_name: str = "", cache_size: int = CACHE_SIZE):
+    """
+    Compiles a memoized converter of the raw values of a column to the column type.
+    Empty values are converted to None, the values which are not strings are left as they are
+    """
+    parse = COLUMN_TYPES.get(column_type)
+    if parse is None:
+        raise ClauseException(f"Unknown column type {column_type}. Known types: {', '.join(COLUMN_TYPES)}")
+    cache = dict()
+
+    def convert(raw):
+        value = cache.get(raw, _MISSING)
+        if value is not _MISSING:
+            return value
+        if not isinstance(raw, str):
+            return raw
+        if not raw:
+            value = None
+        else:
+            try:
+                value = parse(raw)
+            except (ValueError, InvalidOperation):
+                raise ProcessException(f"Value '{raw}' of column {column_name} is not of type {column_type}") \
+                    from None
+        if len(cache) >= cache_size:
+            cache.clear()
+        cache[raw] = value
+        return value
+    return convert
@@ -1,22 +1,36 @@
 """
 This module aggregates the "grammar" definitions for the clauses of a definition for grouper
 """
+import datetime
+import hashlib
+
 from collections import OrderedDict
-from typing import Optional, Dict
+from copy import copy
+from decimal import Decimal
+from operator import itemgetter
+from typing import Callable, Optional, Dict, List
 from collections.abc import Iterable
 
+from dyno_grp.aggregates import Aggregate
+from dyno_grp.converters import COLUMN_TYPES, converter
 from dyno_grp.errors import ClauseException, ProcessException
+from dyno_grp.where_clause_lang.compiler import compile_conjunction, estimate_cost, split_conjunction
+from dyno_grp.where_clause_lang.parser import Binary, Call, ColumnRef, Expr, Literal, Logical, Not, Unary, parse
 
 
 class Column:
-    def __init__(self, name, alias=None) -> None:
+    def __init__(self, name, alias=None, column_type: Optional[str] = None) -> None:
         super().__init__()
         if not isinstance(name, str) or not name:
             raise ClauseException("Column Name should be non-empty string")
         if alias and not isinstance(alias, str):
             raise ClauseException("If Column Alias is defined it should be non-empty string")
+        if column_type is not None and column_type not in COLUMN_TYPES:
+            raise ClauseException(f"Unknown type {column_type} of column {name}. "
+                                  f"Known types: {', '.join(COLUMN_TYPES)}")
         self._column_name: str = name
         self._column_alias: Optional[str] = alias
+        self._column_type: Optional[str] = column_type
 
     @property
     def name(self):
@@ -29,7 +43,14 @@ class Column:
         else:
             return self._column_name
 
+    @property
+    def column_type(self) -> Optional[str]:
+        """Type the raw values are converted to (see converters.COLUMN_TYPES), None for the raw strings"""
+        return self._column_type
+
     def __repr__(self):
+        if self._column_type:
+            return f"Column('{self._column_name}', '{self._column_alias}', '{self._column_type}')"
         return f"Column('{self._column_name}', '{self._column_alias}')"
 
 
@@ -71,6 +92,10 @@ class SelectClause:
     def alias_set(self):
         return self._alias_set
 
+    def converters(self) -> Dict[str, Callable]:
+        """Compiles the memoized converters of the typed columns, by the column names"""
+        return {col.name: converter(col.column_type, col.name) for col in self._columns if col.column_type}
+
     def validate_correlation(self, columns: set):
         diff = self._columns_cache_set - columns
         if diff:
@@ -104,15 +129,85 @@ class SelectClause:
 
 
 class WhereClause:
-    def __init__(self) -> None:
+    """
+    Named where rules (see tests/where_rules_examples.txt for the language). A row passes the clause
+    only if all the rules are true for it. The identifiers in the rules refer to the aliases of the selected columns
+    """
+    def __init__(self, rules: Dict[str, str]) -> None:
         super().__init__()
+        if not rules or not isinstance(rules, dict):
+            raise ClauseException("Where rules must be a non-empty dict of rule names to rules")
+        self._rules: Dict[str, str] = OrderedDict()
+        self._expressions: Dict[str, Expr] = OrderedDict()
+        for name, rule in rules.items():
+            if not isinstance(rule, str) or not rule.strip():
+                raise ClauseException(f"Where rule {name} must be a non-empty string")
+            self._rules[name] = rule
+            self._expressions[name] = parse(rule)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __iter__(self):
+        return self._rules.__iter__()
+
+    def __getitem__(self, item) -> Expr:
+        return self._expressions[item]
+
+    def items(self):
+        return self._expressions.items()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({dict(self._rules)})"
+
+    @property
+    def rules(self) -> Dict[str, str]:
+        return self._rules
+
+    @property
+    def columns(self) -> set:
+        """Names (aliases) of the columns referenced by the rules"""
+        columns = set()
+        for expr in self._expressions.values():
+            columns.update(expr.columns())
+        return columns
+
+    def conjuncts(self) -> List[Expr]:
+        """
+        The rules split to the terms of their top level 'and', ordered by the estimated cost of evaluation,
+        so the cheap (and usually selective) comparisons short circuit the expensive like and function calls
+        """
+        conjuncts = []
+        for expr in self._expressions.values():
+            conjuncts.extend(split_conjunction(expr))
+        return sorted(conjuncts, key=estimate_cost)
+
+    def compile(self, resolve):
+        """
+        Compiles the rules to one predicate. resolve maps a column alias to a callable
+        which extracts the value of the column from a row
+        """
+        return compile_conjunction(self.conjuncts(), resolve)
+
+    @staticmethod
+    def from_raw(where_definition: Optional[dict]):
+        if not where_definition:
+            return None
+        return WhereClause(where_definition)
 
 
 class GroupDef:
+    """
+    A group level. aggregates are the names of the aggregates to their specs, e.g. {"total": "sum(Qty)"},
+    computed per group (see aggregates.py). If keep_items is False the items of the group are not kept,
+    only its similar items and aggregates, which is allowed for the last group only
+    """
     def __init__(self,
                  group_name: str,
                  similar_items: Optional[list] = None,
-                 aggregated_property: str = None) -> None:
+                 aggregated_property: str = None,
+                 aggregates: Optional[Dict[str, str]] = None,
+                 keep_items: bool = True) -> None:
         super().__init__()
         if not similar_items:
             similar_items = set()
@@ -122,11 +217,26 @@ class GroupDef:
             raise ClauseException("Collect Similar must be iterable")
         if similar_items and not aggregated_property:
             raise ClauseException("IF similar items are defined THEN aggregate_property must be defined")
+        if aggregates is not None and not isinstance(aggregates, dict):
+            raise ClauseException("Aggregates must be a dict of aggregate names to aggregate functions")
+        if aggregates and not aggregated_property:
+            raise ClauseException("IF aggregates are defined THEN aggregate_property must be defined")
+        if not keep_items and not aggregates:
+            raise ClauseException(f"Items of group {group_name} can be dropped only if aggregates are defined")
         self._group_name = group_name
         self._similar_items = set(similar_items)
         self._aggregated_property = aggregated_property
+        self._aggregates: List[Aggregate] = [Aggregate.parse(name, spec) for name, spec in (aggregates or {}).items()]
+        self._keep_items = keep_items
+        colliding_names = set(self.aggregate_names).intersection(self._similar_items | {aggregated_property})
+        if colliding_names:
+            raise ClauseException(f"Aggregates {colliding_names} of group {group_name} collide with "
+                                  f"similar items or aggregated property")
 
     def __repr__(self):
+        if self._aggregates:
+            return f"{self.__class__.__name__}({self._group_name}, {self._similar_items}, " \
+                   f"{self._aggregated_property}, {self._aggregates}, {self._keep_items})"
         return f"{self.__class__.__name__}({self._group_name}, {self._similar_items}, {self._aggregated_property})"
 
     @property
@@ -141,6 +251,18 @@ class GroupDef:
     def aggregated_property(self):
         return self._aggregated_property
 
+    @property
+    def aggregates(self) -> List[Aggregate]:
+        return self._aggregates
+
+    @property
+    def aggregate_names(self) -> List[str]:
+        return [aggregate.name for aggregate in self._aggregates]
+
+    @property
+    def keep_items(self) -> bool:
+        return self._keep_items
+
 
 GroupName = str
 
@@ -171,11 +293,13 @@ class GroupsClause:
             raise ClauseException("Groups must be an OrderedDict (explicitly!)")
 
         group_names = groups.keys()
-        for group_name, group_def in groups.items():
+        for i, (group_name, group_def) in enumerate(groups.items()):
             if not isinstance(group_name, str):
                 raise ClauseException("Group Key must be only string")
             if not isinstance(group_def, GroupDef):
                 raise ClauseException("Group Definition must be of type GroupDef")
+            if not group_def.keep_items and i != len(groups) - 1:
+                raise ClauseException(f"Items can be dropped only in the last group, not in {group_name}")
             invalid_similar_items = group_def.similar_items.intersection(group_names)
             if invalid_similar_items:
                 raise ClauseException(f"Similar items {invalid_similar_items} in group {group_name} "
@@ -192,6 +316,73 @@ class GroupsClause:
         return GroupsClause(groups)
 
 
+def _typed_literals(expr: Expr, converters: Dict[str, Callable]) -> Expr:
+    """
+    Converts the string literals compared to the typed columns to the types of the columns,
+    e.g. "Shipped > '2021-01-01'" compares dates when Shipped is a date column
+    """
+    if isinstance(expr, (Logical, Not)):
+        expr = copy(expr)
+        if isinstance(expr, Not):
+            expr.operand = _typed_literals(expr.operand, converters)
+        else:
+            expr.left = _typed_literals(expr.left, converters)
+            expr.right = _typed_literals(expr.right, converters)
+        return expr
+    if isinstance(expr, Binary) and expr.operator in Binary.COMPARISON:
+        for column, literal in ((expr.left, expr.right), (expr.right, expr.left)):
+            if isinstance(column, ColumnRef) and isinstance(literal, Literal) and isinstance(literal.value, str):
+                convert = converters.get(column.name)
+                if convert is not None:
+                    expr = copy(expr)
+                    converted = Literal(convert(literal.value))
+                    if literal is expr.left:
+                        expr.left = converted
+                    else:
+                        expr.right = converted
+                    return expr
+    return expr
+
+
+# families of the values which can be compared with each other, the raw values of the untyped columns are strings
+_VALUE_FAMILIES = {"int": "number", "float": "number", "decimal": "number", "bool": "number", "date": "date"}
+
+
+def _value_family(expr: Expr, column_types: Dict[str, str]) -> Optional[str]:
+    """The family of the values of the expression, None if it is not known before the rows are read"""
+    if isinstance(expr, ColumnRef):
+        return _VALUE_FAMILIES.get(column_types.get(expr.name), "str")
+    if isinstance(expr, Literal):
+        value = expr.value
+        if isinstance(value, str):
+            return "str"
+        if isinstance(value, (int, float, Decimal)):
+            return "number"
+        return "date" if isinstance(value, datetime.date) else None
+    if isinstance(expr, Call):
+        return "number" if expr.numeric else "str"
+    if isinstance(expr, (Binary, Unary)) and expr.numeric:
+        return "number"
+    return None
+
+
+def _check_typed_comparisons(expr: Expr, column_types: Dict[str, str]):
+    """
+    Checks that the values of the typed columns are compared with the values of the same family,
+    the strings are compared with the numbers only if they are coerced (the comparison is numeric)
+    """
+    for child in expr.children():
+        _check_typed_comparisons(child, column_types)
+    if not isinstance(expr, Binary) or expr.operator not in Binary.COMPARISON:
+        return
+    families = {_value_family(expr.left, column_types), _value_family(expr.right, column_types)}
+    if None in families or len(families) == 1:
+        return
+    if families == {"number", "str"} and (expr.left.numeric or expr.right.numeric):
+        return
+    raise ClauseException(f"Cannot compare {' with '.join(sorted(families))} values in where rule: {expr}")
+
+
 class GroupRule:
     def __init__(self,
                  select_clause: SelectClause,
@@ -204,6 +395,13 @@ class GroupRule:
         self._select_clause = select_clause
         self._where_clause = where_clause
         self._group_clause = groups_clause
+        self._compiled = dict()
+
+    def __getstate__(self):
+        # compiled projectors and predicates are cheap to rebuild and hold closures which cannot be pickled
+        state = self.__dict__.copy()
+        state["_compiled"] = dict()
+        return state
 
     @property
     def select_clause(self) -> SelectClause:
@@ -217,6 +415,94 @@ class GroupRule:
     def group_clause(self) -> GroupsClause:
         return self._group_clause
 
+    @property
+    def fingerprint(self) -> str:
+        """Digest of the rule definition, equal for the equal rules regardless of the process"""
+        where_rules = sorted(self._where_clause.rules.items()) if self._where_clause is not None else None
+        definition = (
+            [(col.name, col.alias, col.column_type) for col in self._select_clause],
+            where_rules,
+            [(name, sorted(group_def.similar_items), group_def.aggregated_property, repr(group_def.aggregates),
+              group_def.keep_items) for name, group_def in self._group_clause.items()],
+        )
+        return hashlib.sha1(repr(definition).encode("utf-8")).hexdigest()
+
+    @property
+    def required_columns(self) -> frozenset:
+        """
+        Names of the source columns the rule reads: the selected columns, which include the columns
+        referenced by the where rules (those refer to the aliases of the selected columns)
+        """
+        source_names = {col.alias: col.name for col in self._select_clause}
+        where_columns = self._where_clause.columns if self._where_clause is not None else set()
+        return frozenset(self._select_clause.columns_set).union(source_names[alias] for alias in where_columns)
+
+    def compile_projector(self, header, by_name: bool = True):
+        """
+        Compiles (once per header) a projector of raw rows to tuples of the selected values.
+        If by_name is True the rows are expected to be mappings, otherwise sequences in the header order
+        """
+        key = ("projector", tuple(header), by_name)
+        projector = self._compiled.get(key)
+        if projector is None:
+            from dyno_grp.projection import RowProjector
+            projector = self._compiled[key] = RowProjector(self._select_clause, header, by_name, self.converters)
+        return projector
+
+    @property
+    def converters(self) -> Dict[str, Callable]:
+        """
+        Converters of the typed columns by the column names. They are compiled once and shared
+        by the projectors and the predicates, so a repeated raw value is converted once
+        """
+        converters = self._compiled.get("converters")
+        if converters is None:
+            converters = self._compiled["converters"] = self._select_clause.converters()
+        return converters
+
+    def compile_predicate(self, header, by_name: bool = True, vectorized: bool = False):
+        """
+        Compiles (once per header) the where clause to a predicate of the raw rows, so the rows can be filtered
+        before they are projected. The aliases in the rules are mapped back to the source columns.
+        If vectorized is True the predicate is compiled to NumPy expressions returning the mask
+        of a ColumnBatch of raw rows. Returns None if there is no where clause
+        """
+        if self._where_clause is None:
+            return None
+        key = ("predicate", tuple(header), by_name, vectorized)
+        predicate = self._compiled.get(key)
+        if predicate is None:
+            positions = {name: i for i, name in enumerate(header)}
+            source_names = {col.alias: col.name for col in self._select_clause}
+            converters = self.converters
+            alias_converters = {alias: converters[name] for alias, name in source_names.items() if name in converters}
+            conjuncts = [_typed_literals(expr, alias_converters) for expr in self._where_clause.conjuncts()]
+            column_types = {col.alias: col.column_type for col in self._select_clause if col.column_type}
+            for expr in conjuncts:
+                _check_typed_comparisons(expr, column_types)
+
+            def source_key(alias):
+                name = source_names[alias]
+                return name if by_name else positions[name]
+            if vectorized:
+                from dyno_grp.where_clause_lang.vectorized import compile_vectorized
+
+                def resolve_column(alias):
+                    key_in_row = source_key(alias)
+                    convert = alias_converters.get(alias)
+                    return lambda batch: batch.column(key_in_row, convert)
+                predicate = compile_vectorized(conjuncts, resolve_column)
+            else:
+                def resolve_value(alias):
+                    getter = itemgetter(source_key(alias))
+                    convert = alias_converters.get(alias)
+                    if convert is None:
+                        return getter
+                    return lambda row: convert(getter(row))
+                predicate = compile_conjunction(conjuncts, resolve_value)
+            self._compiled[key] = predicate
+        return predicate
+
     @staticmethod
     def _validate_group_relations(select_clause: SelectClause,
                                   where_clause: WhereClause,
@@ -228,6 +514,17 @@ class GroupRule:
             similar_items_not_in_select = group_def.similar_items - select_clause_aliases
             if similar_items_not_in_select:
                 raise ClauseException(f"Group {group} has similar items which are not defined in select")
+            aggregated_columns = set(aggregate.column for aggregate in group_def.aggregates if aggregate.column)
+            if aggregated_columns - select_clause_aliases:
+                raise ClauseException(f"Group {group} has aggregates of columns "
+                                      f"{aggregated_columns - select_clause_aliases} which are not defined in select")
+        if where_clause is not None:
+            if not isinstance(where_clause, WhereClause):
+                raise ClauseException("Where Clause must be of type WhereClause")
+            where_columns_not_in_select = where_clause.columns - select_clause_aliases
+            if where_columns_not_in_select:
+                raise ClauseException(f"Where rules refer to columns {where_columns_not_in_select} "
+                                      f"which are not defined in select")
 
 
     @staticmethod
@@ -242,19 +539,20 @@ class GroupRule:
                     raise ClauseException(f"Column at index {i} must contain only one column definition")
                 column_name = next(iter(column))
                 alias = column[column_name].get("as")
-                if not alias:
-                    raise ClauseException(f"Alias must be defined for column name {column_name} at index {i}")
-                column_def = Column(column_name, alias)
+                column_type = column[column_name].get("type")
+                if not alias and not column_type:
+                    raise ClauseException(f"Alias or type must be defined for column name {column_name} at index {i}")
+                column_def = Column(column_name, alias, column_type)
             else:
                 raise ClauseException(f"Unknown column definition at index {i}")
             columns.append(column_def)
         select_clause = SelectClause(columns)
-        where = rule_definition["where"]
+        where_clause = WhereClause.from_raw(rule_definition.get("where"))
         groups = OrderedDict(rule_definition["groups"])
         groups_clause = GroupsClause.from_raw(groups)
         return GroupRule(
             select_clause=select_clause,
-            where_clause=None,
+            where_clause=where_clause,
             groups_clause=groups_clause
         )
 
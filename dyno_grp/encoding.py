@@ -0,0 +1,93 @@
+"""
+This module contains the dictionary encoding of the column values. Every column has a dictionary
+of its distinct values, the rows share one canonical object per distinct value instead of a copy per row.
+"""
+from typing import Callable, Hashable, List, Optional, Sequence
+
+# distinct values of a column kept in its dictionary, the columns with more values are left as they are
+DEFAULT_MAX_SIZE = 64 * 1024
+
+_MISSING = object()
+
+
+class ColumnDictionary:
+    """
+    Distinct values of a column with their integer codes (in the first seen order).
+    If the column has more than max_size distinct values it is considered not worth encoding:
+    the dictionary stops growing and intern returns the new values as they are
+    """
+    def __init__(self, max_size: Optional[int] = DEFAULT_MAX_SIZE) -> None:
+        super().__init__()
+        self._codes = dict()
+        self._canonical = dict()
+        self._values: List[Hashable] = []
+        self._max_size = max_size
+        self._overflowed = False
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, value):
+        return value in self._codes
+
+    @property
+    def values(self) -> List[Hashable]:
+        return self._values
+
+    @property
+    def overflowed(self) -> bool:
+        return self._overflowed
+
+    @property
+    def canonical_get(self) -> Callable:
+        """dict.get of the canonical objects by the values, meant to be bound locally in the hot loops"""
+        return self._canonical.get
+
+    def encode(self, value) -> int:
+        """Returns the code of the value, the new values are added regardless of max_size"""
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._values)
+            self._canonical[value] = value
+            self._values.append(value)
+        return code
+
+    def decode(self, code: int):
+        return self._values[code]
+
+    def intern(self, value):
+        """Returns the canonical object equal to the value"""
+        canonical = self._canonical.get(value, _MISSING)
+        if canonical is not _MISSING:
+            return canonical
+        if self._overflowed:
+            return value
+        if self._max_size is not None and len(self._values) >= self._max_size:
+            self._overflowed = True
+            return value
+        self.encode(value)
+        return value
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._values)} values)"
+
+
+def interning_getter(getter, dictionaries: Sequence[Optional[ColumnDictionary]]) -> Callable:
+    """
+    Wraps the tuple getter, so the values are replaced by the canonical objects of the dictionaries
+    aligned to the tuple (None for the values which are left as they are)
+    """
+    encoded = [(i, dictionary.canonical_get, dictionary.intern) for i, dictionary in enumerate(dictionaries)
+               if dictionary is not None]
+    if not encoded:
+        return getter
+
+    def intern_values(row):
+        values = list(getter(row))
+        for i, canonical_get, intern in encoded:
+            value = values[i]
+            # the known values are looked up by C level dict.get, only the new ones get to intern
+            canonical = canonical_get(value, _MISSING)
+            values[i] = intern(value) if canonical is _MISSING else canonical
+        return tuple(values)
+    return intern_values
@@ -1,107 +1,372 @@
+from collections.abc import Mapping
+from contextlib import nullcontext
+from itertools import chain
 from typing import Optional
 
-import dyno_grp.utils as utils
-
-from dyno_grp.streams import CsvDictStream
+from dyno_grp.builder import HierarchyBuilder
+from dyno_grp.checkpoint import Checkpoint
+from dyno_grp.codegen import CodeCache, compile_grouping
+from dyno_grp.streams import csv_stream
 from dyno_grp.definitions import GroupRule
 from dyno_grp.errors import ProcessException
+from dyno_grp.parallel import group_file_in_parallel, group_files_in_parallel
+from dyno_grp.projection import RowProjector
+from dyno_grp.sinks import OutputSink
+from dyno_grp.spill import SpillPartitions, estimate_partitions
+from dyno_grp.stats import GroupingStats
+from dyno_grp.where_clause_lang.vectorized import HAS_NUMPY, filter_batches
 
 
 class Grouper:
-    def __init__(self, data_stream, group_rule: GroupRule) -> None:
+    """
+    Groups the rows of a data stream according to a GroupRule.
+    If memory_budget (in bytes) is defined the rows are spilled to temporary partition files
+    and the groups are built and emitted one partition at a time.
+    If sorted_input is True the stream must be ordered by the first group, then every top level group
+    is emitted as soon as its key changes and only one top level group is kept in memory.
+    If workers is defined the CSV file of the stream is split into byte ranges which are grouped
+    by that many worker processes.
+    If batch_size is defined and NumPy is installed the where clause is evaluated as vectorized masks
+    over batches of that many rows, otherwise row by row.
+    If intern_leaves is True the values of the leaf items are dictionary encoded per column, so the equal values
+    of millions of items share one object (less memory, a bit more time per row).
+    If checkpoint is defined the partial hierarchy is saved with the offset of the stream (e.g. MmapCsvStream)
+    at intervals, a next run resumes from the saved offset. The checkpoint is removed when the grouping completes.
+    If stats are defined the time per stage, the rows and groups counters and the memory high-water
+    of the grouping are collected to them (see GroupingStats).
+    If code_cache is defined the in memory grouping runs the code generated for the rule and the stream header
+    (cached by the code_cache, see codegen.py) rather than the generic projection and builder
+    """
+    def __init__(self,
+                 data_stream,
+                 group_rule: GroupRule,
+                 compact_leaves: bool = False,
+                 memory_budget: Optional[int] = None,
+                 spill_partitions: Optional[int] = None,
+                 spill_directory: Optional[str] = None,
+                 sorted_input: bool = False,
+                 workers: Optional[int] = None,
+                 batch_size: Optional[int] = None,
+                 intern_leaves: bool = False,
+                 checkpoint: Optional[Checkpoint] = None,
+                 stats: Optional[GroupingStats] = None,
+                 code_cache: Optional[CodeCache] = None) -> None:
         super().__init__()
+        if memory_budget is not None and memory_budget <= 0:
+            raise ProcessException("Memory budget must be positive")
+        if memory_budget is not None and sorted_input:
+            raise ProcessException("Sorted input is grouped in constant memory and cannot be spilled")
+        if workers is not None and (memory_budget is not None or sorted_input):
+            raise ProcessException("Parallel grouping cannot be combined with spilling or sorted input")
+        if checkpoint is not None and (memory_budget is not None or sorted_input or workers is not None):
+            raise ProcessException("Only in memory grouping can be checkpointed")
+        if code_cache is not None and (memory_budget is not None or sorted_input or workers is not None
+                                       or checkpoint is not None or intern_leaves):
+            raise ProcessException("Only in memory grouping without interned leaves can run the generated code")
         self._data_stream = data_stream
         self._group_rule: GroupRule = group_rule
+        self._compact_leaves = compact_leaves
+        self._memory_budget = memory_budget
+        self._spill_partitions = spill_partitions
+        self._spill_directory = spill_directory
+        self._sorted_input = sorted_input
+        self._workers = workers
+        self._batch_size = batch_size
+        self._intern_leaves = intern_leaves
+        self._checkpoint = checkpoint
+        self._stats = stats
+        self._code_cache = code_cache
+        self._projector: Optional[RowProjector] = None
+        self._predicate = None
+        self._vectorized_predicate = None
+        self._builder: Optional[HierarchyBuilder] = None
         self._result: Optional[dict] = None
 
-    def _validate_row_correlation(self, row: dict):
-        self._group_rule.select_clause.validate_correlation(row.keys())
-
-    def _filter_row(self, row):
-        return row
-
-    def _rename_row_keys(self, row:dict):
-        renamed_row = dict()
-        for k, v in row.items():
-            column = self._group_rule.select_clause.get(k)
-            k = column.alias if column else k
-            renamed_row[k] = v
-        return renamed_row
-
-    def _group_by(self, item, item_key, receiver):
-        result_columns = self._group_rule.select_clause.alias_set - {item_key}
-        group_key = item[item_key]
-        if receiver.get(group_key, None) is None:
-            receiver[group_key] = []
-        receiver[group_key].append(utils.filter_dict(item, *result_columns, include=True))
-
-    def _process_row_first_pass(self, row: dict):
-        first_group, first_group_def = next(iter(self._group_rule.group_clause.items()))
-        row = self._rename_row_keys(row)
-        self._group_by(row, first_group, self._result)
-
-    def _process_group(self, level, groups, bucket_path):
-        items_in_group = None
-        upset_group = None
-        for i, bucket in enumerate(bucket_path):
-            upset_group = self._result if i == 0 else items_in_group
-            items_in_group = upset_group[bucket]
-        upset_group_rules = groups[level - 1]
-        if level == len(groups) and not upset_group_rules.aggregated_property:
+    @property
+    def stats(self) -> Optional[GroupingStats]:
+        return self._stats
+
+    @property
+    def result(self) -> Optional[dict]:
+        """
+        The whole result of the in memory grouping (e.g. after updates), None before the grouping.
+        If the groups were returned lazily or written to a sink, it is materialized on the first access
+        """
+        if self._result is None and self._updatable():
+            self._result = dict(self._builder.items())
+        return self._result
+
+    def _updatable(self) -> bool:
+        return self._builder is not None and self._memory_budget is None and not self._sorted_input
+
+    def _stage(self, stage: str):
+        return nullcontext() if self._stats is None else self._stats.timer(stage)
+
+    def _track_position(self, data_stream):
+        if self._stats is not None:
+            self._stats.track_position(lambda: getattr(data_stream, "position", None))
+
+    def _row_header(self, row, data_stream=None):
+        if isinstance(row, Mapping):
+            return list(row)
+        header = getattr(data_stream or self._data_stream, "header", None)
+        if header is None:
+            raise ProcessException("Stream of non mapping rows must define a header")
+        return header
+
+    def _validate_row_correlation(self, row, data_stream=None):
+        self._group_rule.select_clause.validate_correlation(set(self._row_header(row, data_stream)))
+
+    def _prepare(self, header, by_name: bool):
+        self._projector = self._group_rule.compile_projector(header, by_name=by_name)
+        self._predicate = self._group_rule.compile_predicate(header, by_name=by_name)
+        self._vectorized_predicate = None
+        if self._batch_size and HAS_NUMPY:
+            self._vectorized_predicate = self._group_rule.compile_predicate(header, by_name=by_name,
+                                                                            vectorized=True)
+        return self._projector.getter
+
+    def _new_builder(self) -> HierarchyBuilder:
+        return HierarchyBuilder(self._group_rule, self._projector.aliases, compact_leaves=self._compact_leaves,
+                                intern_leaves=self._intern_leaves)
+
+    def _projected_rows(self, data_stream=None, aliases=None):
+        """
+        Generates the projected rows of the stream (the stream of the Grouper by default).
+        If aliases are given, the values are reordered to them (e.g. to the aliases of an existing builder)
+        """
+        data_stream = data_stream or self._data_stream
+        self._track_position(data_stream)
+        with data_stream:
+            data_stream_iter = iter(data_stream)
+            row = next(data_stream_iter, None)
+            if row is None:
+                if aliases is not None:
+                    return
+                raise ProcessException("There is no data in the stream")
+            self._validate_row_correlation(row, data_stream)
+            project = self._prepare(self._row_header(row, data_stream), isinstance(row, Mapping))
+            if aliases is not None:
+                project = self._projector.getter_for(aliases)
+            yield from self._filtered(chain((row,), data_stream_iter), project)
+
+    def _filtered(self, rows, project):
+        """Filters the raw rows by the where clause, the rejected rows are never projected"""
+        stats = self._stats
+        if stats is not None:
+            rows = stats.timed(rows, "read", counter="read")
+        if self._vectorized_predicate is not None:
+            rows = filter_batches(rows, self._vectorized_predicate, self._batch_size)
+        elif self._predicate is not None:
+            rows = filter(self._predicate, rows)
+        if stats is None:
+            return map(project, rows)
+        rows = stats.timed(rows, "filter", inner="read", counter="grouped")
+        return stats.timed(map(project, rows), "project", inner="filter", consumer="group")
+
+    def _checkpointed_groups(self):
+        stream, checkpoint = self._data_stream, self._checkpoint
+        file_name = getattr(stream, "file_name", None)
+        if file_name is None or not hasattr(stream, "blocks"):
+            raise ProcessException("Checkpoints require a stream of blocks with byte offsets, e.g. MmapCsvStream")
+        self._track_position(stream)
+        with stream:
+            if stream.header is None:
+                raise ProcessException("There is no data in the stream")
+            project = self._prepare(stream.header, by_name=False)
+            self._builder = self._new_builder()
+            offset = checkpoint.load(file_name, self._builder)
+            add = self._builder.add
+            blocks = stream.blocks(offset)
+            if self._stats is not None:
+                # the blocks are decoded before their rows are parsed
+                blocks = self._stats.timed(blocks, "read", batch_size=1)
+            for end, rows in blocks:
+                for values in self._filtered(rows, project):
+                    add(values)
+                checkpoint.maybe_save(file_name, end, self._builder)
+        checkpoint.remove()
+        yield from self._builder.items()
+
+    def _in_memory_groups(self):
+        rows = self._projected_rows()
+        first_row = next(rows, None)
+        if first_row is None:
             return
-        upset_group[bucket_path[-1]] = dict()
-        new_group = upset_group[bucket_path[-1]]
-        if upset_group_rules.aggregated_property:
-            non_similar_items = new_group[upset_group_rules.aggregated_property] = list()
-            for item_idx, item in enumerate(items_in_group):
-                aggregated_property_item = dict()
-                for k, v in item.items():
-                    if k in upset_group_rules.similar_items:
-                        if item_idx == 0:
-                            new_group[k] = v
-                        elif new_group[k] != v:
-                            raise ProcessException(f"Cannot combine similar items for Column Alias {k}. "
-                                                   f"Found different values '{new_group[k]}' and '{v}'")
-                    else:
-                        aggregated_property_item[k] = v
-                non_similar_items.append(aggregated_property_item)
-            if level == len(groups):
-                return
-            bucket_path += [upset_group_rules.aggregated_property]
-            items_in_group = new_group[upset_group_rules.aggregated_property]
-            new_group[upset_group_rules.aggregated_property] = dict()
-            new_group = new_group[upset_group_rules.aggregated_property]
-        group_name = groups[level].group_name
-        for item in items_in_group:
-            self._group_by(item, group_name, new_group)
-        for group in new_group:
-            self._process_group(level + 1, groups, bucket_path + [group])
-
-    def _process_non_first_passes(self):
-        groups = [group for _, group in self._group_rule.group_clause.items()]
-        for bucket_path in self._result:
-            self._process_group(1, groups, [bucket_path])
-
-    def __call__(self, *args, **kwargs):
-        self._result = dict()
-        with self._data_stream:
-            data_stream_iter = iter(self._data_stream)
+        self._builder = self._new_builder()
+        add = self._builder.add
+        add(first_row)
+        for values in rows:
+            add(values)
+        yield from self._builder.items()
+
+    def _generated_groups(self):
+        data_stream, stats = self._data_stream, self._stats
+        self._track_position(data_stream)
+        with data_stream:
+            data_stream_iter = iter(data_stream)
             row = next(data_stream_iter, None)
             if row is None:
                 raise ProcessException("There is no data in the stream")
             self._validate_row_correlation(row)
-            self._process_row_first_pass(row)
-            while True:
-                try:
-                    row = next(data_stream_iter)
-                    self._process_row_first_pass(row)
-                except StopIteration:
-                    break
-        self._process_non_first_passes()
-        print(self._result)
+            self._prepare(self._row_header(row), isinstance(row, Mapping))
+            self._builder = self._new_builder()
+            predicate = self._predicate
+            rows = chain((row,), data_stream_iter)
+            if stats is not None:
+                # the filtering and the projection are a part of the generated grouping
+                rows = stats.timed(rows, "read", consumer="group", counter="read")
+            if self._vectorized_predicate is not None:
+                rows = filter_batches(rows, self._vectorized_predicate, self._batch_size)
+                predicate = None
+            group_rows = compile_grouping(self._builder, self._projector.keys, self._projector.converters,
+                                          predicate, self._code_cache)
+            grouped = group_rows(rows)
+            if stats is not None:
+                stats.count_grouped(grouped)
+        yield from self._builder.items()
+
+    def _spilled_groups(self):
+        rows = self._projected_rows()
+        first_row = next(rows, None)
+        if first_row is None:
+            return
+        key_index = self._projector.aliases.index(next(iter(self._group_rule.group_clause)))
+        partitions = self._spill_partitions or estimate_partitions(getattr(self._data_stream, "size", None),
+                                                                   self._memory_budget)
+        with SpillPartitions(partitions, self._memory_budget, self._spill_directory) as spill:
+            spill.add(first_row[key_index], first_row)
+            add = spill.add
+            for values in rows:
+                add(values[key_index], values)
+            for partition in range(len(spill)):
+                self._builder = self._new_builder()
+                add = self._builder.add
+                rows = spill.partition_rows(partition)
+                if self._stats is not None:
+                    rows = self._stats.timed(rows, "spill", consumer="group")
+                for values in rows:
+                    add(values)
+                yield from self._builder.items()
+                self._builder = None
+
+    def _sorted_groups(self):
+        rows = self._projected_rows()
+        first_row = next(rows, None)
+        if first_row is None:
+            return
+        first_group = next(iter(self._group_rule.group_clause))
+        key_index = self._projector.aliases.index(first_group)
+        self._builder = self._new_builder()
+        add = self._builder.add
+        add(first_row)
+        current_key = first_row[key_index]
+        emitted_keys = set()
+        for values in rows:
+            key = values[key_index]
+            if key != current_key:
+                yield from self._builder.drain()
+                emitted_keys.add(current_key)
+                if key in emitted_keys:
+                    raise ProcessException(f"Input is not sorted by group {first_group}. "
+                                           f"Group '{key}' appears again after other groups")
+                current_key = key
+            add(values)
+        yield from self._builder.drain()
+
+    def _parallel_groups(self):
+        file_names = getattr(self._data_stream, "file_names", None)
+        file_name = getattr(self._data_stream, "file_name", None)
+        with self._stage("group"):
+            if file_names is not None:
+                self._builder = group_files_in_parallel(file_names, self._group_rule, self._workers,
+                                                        intern_leaves=self._intern_leaves)
+            elif file_name is not None:
+                self._builder = group_file_in_parallel(file_name, self._group_rule, self._workers,
+                                                       intern_leaves=self._intern_leaves)
+            else:
+                raise ProcessException("Parallel grouping requires a stream of CSV files")
+        yield from self._builder.items()
+
+    def _groups(self):
+        """Generates the top level groups as (key, group) pairs"""
+        self._builder = None
+        self._result = None
+        if self._memory_budget is not None:
+            return self._spilled_groups()
+        if self._sorted_input:
+            return self._sorted_groups()
+        if self._workers is not None:
+            return self._parallel_groups()
+        if self._checkpoint is not None:
+            return self._checkpointed_groups()
+        if self._code_cache is not None:
+            return self._generated_groups()
+        return self._in_memory_groups()
+
+    def __call__(self, sink: Optional[OutputSink] = None, lazy: bool = False):
+        """
+        Groups the stream. Returns the result dict, or, if lazy is True, a generator of the top level
+        groups as (key, group) pairs. If a sink is given the groups are written to it and nothing is returned
+        """
+        groups = self._groups()
+        stats = self._stats
+        if stats is not None:
+            if lazy and sink is None:
+                return stats.observe_lazily(groups, self._group_rule)
+            groups = stats.observe(groups, self._group_rule)
+        with nullcontext() if stats is None else stats.tracking():
+            if sink is not None:
+                with sink:
+                    for key, group in groups:
+                        sink.write_group(key, group)
+                return None
+            if lazy:
+                return groups
+            self._result = dict(groups)
+        return self._result
+
+    def update(self, data_stream) -> dict:
+        """
+        Groups the rows of another stream (e.g. a new CSV file or the tail of an appended one, see MmapCsvStream)
+        into the existing result of in memory grouping. Only the groups of the new rows are touched
+        and the similar items are checked only for them. The rows are grouped apart and merged only if all of them
+        are grouped, so a failed update leaves the result as it was.
+        Returns the top level groups the rows were added to (new or updated ones),
+        the whole updated result is the result property
+        """
+        if not self._updatable():
+            raise ProcessException("Only an existing result of in memory grouping can be updated")
+        builder = self._builder
+        update = HierarchyBuilder(self._group_rule, builder.aliases, compact_leaves=builder.compact_leaves,
+                                  intern_leaves=builder.intern_leaves)
+        add = update.add
+        for values in self._projected_rows(data_stream, aliases=builder.aliases):
+            add(values)
+        builder.check_merge(update.state)
+        builder.merge(update.state)
+        changed = {key: builder.group(key) for key in update.state}
+        if self._result is not None:
+            # the new groups are appended, as they are to the builder
+            self._result.update(changed)
+        return changed
 
     @staticmethod
-    def csv_to_json_grouper(csv_file, definitions):
-        stream = CsvDictStream(csv_file)
+    def csv_to_json_grouper(csv_file,
+                            definitions,
+                            compact: bool = False,
+                            memory_budget: Optional[int] = None,
+                            sorted_input: bool = False,
+                            workers: Optional[int] = None,
+                            intern_leaves: bool = False,
+                            stats: Optional[GroupingStats] = None,
+                            code_cache: Optional[CodeCache] = None):
+        """
+        Groups a CSV file by the raw definitions. csv_file may be a list of files or a glob as well,
+        then the files are streamed as shards of one dataset (see MultiCsvStream)
+        """
         group_rule = GroupRule.from_raw(definitions)
-        return Grouper(stream, group_rule)
+        stream = csv_stream(csv_file, compact=compact, columns=group_rule.required_columns)
+        return Grouper(stream, group_rule, compact_leaves=compact, memory_budget=memory_budget,
+                       sorted_input=sorted_input, workers=workers, intern_leaves=intern_leaves, stats=stats,
+                       code_cache=code_cache)
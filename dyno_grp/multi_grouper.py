@@ -0,0 +1,90 @@
+"""
+This module contains the grouping of one data stream by many GroupRules in a single scan.
+The stream is read and parsed once, every row is projected once per distinct select clause
+and fanned out to the builders of all the rules.
+"""
+from collections.abc import Mapping
+from itertools import chain
+from typing import Dict, Optional
+
+from dyno_grp.builder import HierarchyBuilder
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
+from dyno_grp.streams import csv_stream
+
+
+def _required_columns(group_rules: Dict[str, GroupRule]) -> frozenset:
+    return frozenset().union(*(group_rule.required_columns for group_rule in group_rules.values()))
+
+
+class MultiGrouper:
+    """
+    Groups the rows of a data stream by several GroupRules at once, named by the keys of group_rules.
+    Returns the results by the same names. The stream is best pruned to required_columns, the union
+    of the columns of all the rules (as csv_to_json_groupers does)
+    """
+    def __init__(self,
+                 data_stream,
+                 group_rules: Dict[str, GroupRule],
+                 compact_leaves: bool = False,
+                 intern_leaves: bool = False) -> None:
+        super().__init__()
+        if not group_rules or not isinstance(group_rules, Mapping):
+            raise ProcessException("Group rules must be a non-empty mapping of names to rules")
+        self._data_stream = data_stream
+        self._group_rules: Dict[str, GroupRule] = dict(group_rules)
+        self._compact_leaves = compact_leaves
+        self._intern_leaves = intern_leaves
+        self._builders: Optional[Dict[str, HierarchyBuilder]] = None
+
+    @property
+    def required_columns(self) -> frozenset:
+        return _required_columns(self._group_rules)
+
+    def _header(self, row):
+        if isinstance(row, Mapping):
+            return list(row)
+        header = getattr(self._data_stream, "header", None)
+        if header is None:
+            raise ProcessException("Stream of non mapping rows must define a header")
+        return header
+
+    def __call__(self) -> Dict[str, dict]:
+        with self._data_stream:
+            data_stream_iter = iter(self._data_stream)
+            row = next(data_stream_iter, None)
+            if row is None:
+                raise ProcessException("There is no data in the stream")
+            header = self._header(row)
+            by_name = isinstance(row, Mapping)
+            self._builders = dict()
+            # the rules of the same select clause share one projection of a row
+            projections = dict()
+            for name, group_rule in self._group_rules.items():
+                projector = group_rule.compile_projector(header, by_name=by_name)
+                builder = self._builders[name] = HierarchyBuilder(group_rule, projector.aliases,
+                                                                  compact_leaves=self._compact_leaves,
+                                                                  intern_leaves=self._intern_leaves)
+                select_key = tuple((col.name, col.alias, col.column_type) for col in group_rule.select_clause)
+                project, targets = projections.setdefault(select_key, (projector.getter, []))
+                targets.append((group_rule.compile_predicate(header, by_name=by_name), builder.add))
+            fan_out = tuple((project, tuple(targets)) for project, targets in projections.values())
+            for row in chain((row,), data_stream_iter):
+                for project, targets in fan_out:
+                    values = None
+                    for predicate, add in targets:
+                        if predicate is None or predicate(row):
+                            if values is None:
+                                values = project(row)
+                            add(values)
+        return {name: dict(builder.items()) for name, builder in self._builders.items()}
+
+    @staticmethod
+    def csv_to_json_groupers(csv_file, definitions: Dict[str, dict], compact: bool = False):
+        """
+        Groups a CSV file (a list of files or a glob, see Grouper.csv_to_json_grouper)
+        by the raw definitions of the rules by their names
+        """
+        group_rules = {name: GroupRule.from_raw(definition) for name, definition in definitions.items()}
+        columns = _required_columns(group_rules)
+        return MultiGrouper(csv_stream(csv_file, compact=compact, columns=columns), group_rules, compact_leaves=compact)
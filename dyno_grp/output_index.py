@@ -0,0 +1,305 @@
+"""
+This module contains the indexed JSON output of the Grouper: the sink writing the output with a sidecar index
+and the reader of the output.
+The index is an on disk hash table of the group keys to the byte offsets and lengths of their JSON values
+in the output, so the reader memory maps both files and decodes only the requested group, in O(1)
+regardless of the size of the output.
+
+The index file is a header (magic, number of slots, number of entries), the slots and the keys.
+A slot is (hash, key offset, key length, value offset, value length), an empty slot has no key.
+A key is the JSON list of the group keys of its path, e.g. ["Alpha"] or ["Alpha", "New York"].
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from typing import Iterable, List, Optional, Tuple
+
+from dyno_grp.errors import ProcessException
+from dyno_grp.sinks import OutputSink, json_default, json_key
+
+_WRITE_BUFFER_SIZE = 1 << 20
+_MAGIC = b"DGIDX\x00\x00\x01"
+_HEADER = struct.Struct("<8sQQ")
+_SLOT = struct.Struct("<QQQQQ")
+_MISSING = object()
+_KEY_ENCODER = json.JSONEncoder(ensure_ascii=False)
+
+IndexEntry = Tuple[bytes, int, int]
+
+
+def index_key(path: Iterable[str]) -> bytes:
+    """The key of the path of group keys, which are already JSON object keys (see sinks.json_key)"""
+    # as a JSON list, the keys are strings which the encoder encodes right away
+    return ("[" + ",".join(map(_KEY_ENCODER.encode, path)) + "]").encode("utf-8")
+
+
+def _hash(key: bytes) -> int:
+    # stable across processes, unlike hash() of str
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def write_index(index_path, entries: List[IndexEntry]):
+    """Writes the index of the entries (key, value offset, value length), linearly probed at most half full"""
+    slot_count = 1
+    while slot_count < 2 * len(entries):
+        slot_count *= 2
+    slots = [None] * slot_count
+    mask = slot_count - 1
+    keys_offset = _HEADER.size + slot_count * _SLOT.size
+    key_offset = keys_offset
+    for key, offset, length in entries:
+        key_hash = _hash(key)
+        slot = key_hash & mask
+        while slots[slot] is not None:
+            if slots[slot][0] == key_hash and slots[slot][5] == key:
+                raise ProcessException(f"Group {key.decode('utf-8')} is written twice")
+            slot = (slot + 1) & mask
+        slots[slot] = (key_hash, key_offset, len(key), offset, length, key)
+        key_offset += len(key)
+    # written to a temporary file and renamed, so readers never see a partial index
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, slot_count, len(entries)))
+            empty = _SLOT.pack(0, 0, 0, 0, 0)
+            f.write(b"".join(empty if slot is None else _SLOT.pack(*slot[:5]) for slot in slots))
+            for key, _, _ in entries:
+                f.write(key)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class IndexedJsonReader:
+    """
+    Reads the groups of an output written by IndexedJsonSink one by one. The output and its index
+    (the output file name + ".idx" by default) are memory mapped, only the requested group is decoded
+    """
+    def __init__(self, file_name, index_path: Optional[str] = None) -> None:
+        super().__init__()
+        self._file_name = file_name
+        self._index_path = index_path or f"{file_name}.idx"
+        self._files = []
+        self._data: Optional[mmap.mmap] = None
+        self._index: Optional[mmap.mmap] = None
+        self._slot_count = 0
+        self._entry_count = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        try:
+            for path in (self._file_name, self._index_path):
+                self._files.append(open(path, "rb"))
+            self._data, self._index = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) for f in self._files)
+        except (OSError, ValueError):
+            self.close()
+            raise
+        if len(self._index) < _HEADER.size:
+            self.close()
+            raise ProcessException(f"{self._index_path} is not an index of grouped output")
+        magic, self._slot_count, self._entry_count = _HEADER.unpack_from(self._index, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ProcessException(f"{self._index_path} is not an index of grouped output")
+
+    def close(self):
+        for mm in (self._data, self._index):
+            if mm is not None:
+                mm.close()
+        self._data = self._index = None
+        for f in self._files:
+            f.close()
+        self._files = []
+
+    def __len__(self):
+        """Number of the indexed groups (of all the indexed levels)"""
+        return self._entry_count
+
+    def __contains__(self, path):
+        return self._find(self._path(path)) is not None
+
+    @staticmethod
+    def _path(keys) -> tuple:
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        return tuple(json_key(key) for key in keys)
+
+    def _find(self, path) -> Optional[Tuple[int, int]]:
+        if self._index is None:
+            raise ProcessException(f"{self.__class__.__name__} is not opened")
+        if not self._slot_count:
+            return None
+        key = index_key(path)
+        key_hash = _hash(key)
+        mask = self._slot_count - 1
+        slot = key_hash & mask
+        index = self._index
+        while True:
+            slot_hash, key_offset, key_length, offset, length = self._slot(slot)
+            if not key_length:
+                return None
+            if slot_hash == key_hash and index[key_offset:key_offset + key_length] == key:
+                return offset, length
+            slot = (slot + 1) & mask
+
+    def raw(self, *keys) -> Optional[bytes]:
+        """The JSON text of the group of the path of keys (a top level key, optionally with a child key)"""
+        found = self._find(self._path(keys))
+        if found is None:
+            return None
+        offset, length = found
+        return self._data[offset:offset + length]
+
+    def get(self, *keys, default=None):
+        """The group of the path of keys, e.g. get("Alpha") or get("Alpha", "New York"), default if it is missing"""
+        raw = self.raw(*keys)
+        return default if raw is None else json.loads(raw.decode("utf-8"))
+
+    def __getitem__(self, keys):
+        group = self.get(*self._path(keys), default=_MISSING)
+        if group is _MISSING:
+            raise KeyError(keys)
+        return group
+
+    def _slot(self, slot: int):
+        return _SLOT.unpack_from(self._index, _HEADER.size + slot * _SLOT.size)
+
+    def paths(self) -> List[tuple]:
+        """Paths of the indexed groups in the order of the output"""
+        index = self._index
+        if index is None:
+            raise ProcessException(f"{self.__class__.__name__} is not opened")
+        entries = []
+        for slot in range(self._slot_count):
+            _, key_offset, key_length, offset, _ = self._slot(slot)
+            if key_length:
+                path = json.loads(index[key_offset:key_offset + key_length].decode("utf-8"))
+                entries.append((offset, tuple(path)))
+        return [path for _, path in sorted(entries)]
+
+
+class IndexedJsonSink(OutputSink):
+    """
+    Writes the result as one JSON object (as JsonSink) to the file and the index of the top level groups
+    to the sidecar index file (the file name + ".idx" by default), see IndexedJsonReader.
+    If index_children is True the children of the top level groups are indexed as well, they are the items of
+    nested_property of a group (the aggregated_property of the first group, see for_rule) or the group itself
+    """
+    def __init__(self,
+                 target: str,
+                 index_path: Optional[str] = None,
+                 index_children: bool = False,
+                 nested_property: Optional[str] = None) -> None:
+        if not isinstance(target, str):
+            raise ProcessException("Indexed output must be written to a file")
+        super().__init__(target)
+        self._index_path = index_path or f"{target}.idx"
+        self._index_children = index_children
+        self._nested_property = nested_property
+        self._encoder = json.JSONEncoder(ensure_ascii=False, default=json_default)
+        self._entries: List[IndexEntry] = []
+        self._offset = 0
+        self._first = True
+
+    @staticmethod
+    def for_rule(target: str, group_rule, index_path: Optional[str] = None,
+                 index_children: bool = True) -> "IndexedJsonSink":
+        """The sink indexing the children of the first group of the rule"""
+        _, first_group = next(iter(group_rule.group_clause.items()))
+        return IndexedJsonSink(target, index_path, index_children, first_group.aggregated_property)
+
+    @property
+    def index_path(self) -> str:
+        return self._index_path
+
+    def open(self):
+        # the index of a previous output would not match the new one, it is written again once the output is complete
+        if os.path.exists(self._index_path):
+            os.remove(self._index_path)
+        self._fp = open(self._target, "wb", buffering=_WRITE_BUFFER_SIZE)
+        self._owns_fp = True
+        self._start()
+
+    def close(self, completed: bool = True):
+        """Closes the output, the index is written (after the output) only if the output is completed"""
+        if self._fp is None:
+            return
+        super().close(completed)
+        if completed:
+            write_index(self._index_path, self._entries)
+
+    def _write(self, data: bytes):
+        self._fp.write(data)
+        self._offset += len(data)
+
+    def _write_key(self, key):
+        self._write(self._encoder.encode(json_key(key)).encode("utf-8"))
+        self._write(b": ")
+
+    def _write_value(self, path: tuple, value):
+        data = self._encoder.encode(value).encode("utf-8")
+        self._entries.append((index_key(path), self._offset, len(data)))
+        self._write(data)
+
+    def _start(self):
+        self._entries = []
+        self._offset = 0
+        self._first = True
+        self._write(b"{")
+
+    def _write_group(self, key, group):
+        if not self._first:
+            self._write(b", ")
+        self._first = False
+        self._write_key(key)
+        path = (json_key(key),)
+        nested_property = self._nested_property
+        children = group.get(nested_property) if nested_property and isinstance(group, dict) else group
+        if not self._index_children or not isinstance(children, dict):
+            self._write_value(path, group)
+            return
+        start = self._offset
+        if children is group:
+            self._write_children(path, children)
+        else:
+            self._write(b"{")
+            for i, (k, value) in enumerate(group.items()):
+                if i:
+                    self._write(b", ")
+                self._write_key(k)
+                if k == nested_property:
+                    self._write_children(path, value)
+                else:
+                    self._write(self._encoder.encode(value).encode("utf-8"))
+            self._write(b"}")
+        self._entries.append((index_key(path), start, self._offset - start))
+
+    def _write_children(self, path: tuple, children: dict):
+        # the children are many and small, so they are written at once
+        encode, entries = self._encoder.encode, self._entries
+        offset = self._offset + 1
+        chunks = [b"{"]
+        for i, (key, child) in enumerate(children.items()):
+            key = json_key(key)
+            head = f"{', ' if i else ''}{encode(key)}: ".encode("utf-8")
+            data = encode(child).encode("utf-8")
+            offset += len(head)
+            entries.append((index_key(path + (key,)), offset, len(data)))
+            offset += len(data)
+            chunks.append(head)
+            chunks.append(data)
+        chunks.append(b"}")
+        self._write(b"".join(chunks))
+
+    def _finish(self):
+        self._write(b"}")
@@ -0,0 +1,142 @@
+"""
+This module contains the multi-process grouping of a single CSV file or of several CSV files (shards).
+A file is split into byte ranges aligned to record boundaries (shards are taken as a whole), every range
+is grouped by a worker process and the partial hierarchies are merged in the file order.
+"""
+import csv
+import os
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+from dyno_grp.builder import HierarchyBuilder
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
+from dyno_grp.projection import tuple_getter
+from dyno_grp.records import column_positions, padded_rows, parse_block, parse_header, record_ranges
+from dyno_grp.streams import is_compressed, open_csv_file
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def group_range(file_name,
+                start: int,
+                end: int,
+                header: list,
+                group_rule: GroupRule,
+                encoding: str = "utf-8",
+                positions: Optional[list] = None,
+                intern_leaves: bool = False):
+    """
+    Groups the records in the byte range. If positions are given the records are pruned to those columns
+    and header is the pruned header. Returns the state of the compact hierarchy builder
+    """
+    with open(file_name, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    projector = group_rule.compile_projector(header, by_name=False)
+    builder = HierarchyBuilder(group_rule, projector.aliases, compact_leaves=True, intern_leaves=intern_leaves)
+    rows = parse_block(data.decode(encoding), positions, len(header) if positions is None else 0)
+    predicate = group_rule.compile_predicate(header, by_name=False)
+    if predicate is not None:
+        rows = filter(predicate, rows)
+    add = builder.add
+    for values in map(projector.getter, rows):
+        add(values)
+    return builder.state
+
+
+def group_file_in_parallel(file_name,
+                           group_rule: GroupRule,
+                           workers: Optional[int] = None,
+                           chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           encoding: str = "utf-8",
+                           intern_leaves: bool = False) -> HierarchyBuilder:
+    """
+    Groups the CSV file in worker processes. The partial hierarchies are merged in the order of the ranges,
+    so the first seen order of the groups and the similar items consistency are the same as of a single pass.
+    If intern_leaves is True the workers intern the leaf values, which also makes the pickled states smaller
+    """
+    if is_compressed(file_name):
+        raise ProcessException(f"Compressed file {file_name} cannot be split into ranges, "
+                               "pass it in a list to group it as a shard")
+    raw_header, ranges = record_ranges(file_name, chunk_size)
+    header = parse_header(raw_header, encoding)
+    if not header or not ranges:
+        raise ProcessException("There is no data in the stream")
+    group_rule.select_clause.validate_correlation(set(header))
+    # only the columns of the rule are split and sent to the workers
+    positions = column_positions(header, group_rule.required_columns)
+    header = [header[i] for i in positions]
+    projector = group_rule.compile_projector(header, by_name=False)
+    builder = HierarchyBuilder(group_rule, projector.aliases, compact_leaves=True)
+    tasks = ((group_range, file_name, start, end, header, group_rule, encoding, positions, intern_leaves)
+             for start, end in ranges)
+    _merge_in_order(builder, tasks, workers)
+    return builder
+
+
+def _merge_in_order(builder: HierarchyBuilder, tasks, workers: Optional[int]):
+    """Runs the tasks (a function and its arguments) in worker processes and merges their states in order"""
+    # bounded number of tasks in flight, so the partial hierarchies waiting for the merge do not pile up
+    window = 2 * (workers or os.cpu_count() or 1)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for task in tasks:
+            pending.append(executor.submit(*task))
+            if len(pending) >= window:
+                state = pending.popleft().result()
+                if state:
+                    builder.merge(state)
+        while pending:
+            state = pending.popleft().result()
+            if state:
+                builder.merge(state)
+
+
+def group_shard(file_name, group_rule: GroupRule, aliases: Sequence[str], intern_leaves: bool = False,
+                encoding: Optional[str] = None):
+    """
+    Groups a whole (possibly compressed) CSV file. The header is checked against the select clause once
+    and the values are projected in the order of aliases, which are the same for all the shards.
+    Returns the state of the compact hierarchy builder (None for an empty file)
+    """
+    with open_csv_file(file_name, encoding) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return None
+        try:
+            group_rule.select_clause.validate_correlation(set(header))
+        except ProcessException as e:
+            raise ProcessException(f"Shard {file_name}: {e}") from None
+        positions = column_positions(header, group_rule.required_columns)
+        header = [header[i] for i in positions]
+        projector = group_rule.compile_projector(header, by_name=False)
+        project = projector.getter_for(aliases)
+        rows = map(tuple_getter(positions), padded_rows(filter(None, reader), positions[-1] + 1 if positions else 0))
+        predicate = group_rule.compile_predicate(header, by_name=False)
+        if predicate is not None:
+            rows = filter(predicate, rows)
+        builder = HierarchyBuilder(group_rule, aliases, compact_leaves=True, intern_leaves=intern_leaves)
+        add = builder.add
+        for values in map(project, rows):
+            add(values)
+        return builder.state
+
+
+def group_files_in_parallel(file_names: List[str],
+                            group_rule: GroupRule,
+                            workers: Optional[int] = None,
+                            intern_leaves: bool = False,
+                            encoding: Optional[str] = None) -> HierarchyBuilder:
+    """
+    Groups the CSV files (shards) in worker processes, a shard per task. The states are merged
+    in the order of the files, so the result is the same as of grouping the files one after another
+    """
+    aliases = tuple(col.alias for col in group_rule.select_clause)
+    builder = HierarchyBuilder(group_rule, aliases, compact_leaves=True)
+    tasks = ((group_shard, file_name, group_rule, aliases, intern_leaves, encoding) for file_name in file_names)
+    _merge_in_order(builder, tasks, workers)
+    return builder
@@ -0,0 +1,103 @@
+"""
+This module contains the row projector which is compiled once per Group Rule and stream header.
+It replaces per row renaming and filtering of the rows' dicts by precomputed item getters.
+"""
+from operator import itemgetter
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from dyno_grp.definitions import SelectClause
+
+
+def tuple_getter(keys: Sequence):
+    """
+    Returns a callable which extracts the keys from a row and always returns a tuple
+    (operator.itemgetter returns a scalar for a single key)
+    """
+    if not keys:
+        return lambda row: ()
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda row: (row[key],)
+    return itemgetter(*keys)
+
+
+def converting_getter(getter, converters: Sequence[Optional[Callable]]):
+    """
+    Wraps the tuple getter, so the values are converted by the converters aligned to the tuple
+    (None for the values which are left as they are)
+    """
+    typed = [(i, convert) for i, convert in enumerate(converters) if convert is not None]
+    if not typed:
+        return getter
+
+    def convert_values(row):
+        values = list(getter(row))
+        for i, convert in typed:
+            values[i] = convert(values[i])
+        return tuple(values)
+    return convert_values
+
+
+class RowProjector:
+    """
+    Projects the raw rows to tuples of the selected values. The values of the typed columns are converted
+    by converters (by the column names), compiled from the select clause if they are not given
+    """
+    def __init__(self,
+                 select_clause: SelectClause,
+                 header: Sequence[str],
+                 by_name: bool = True,
+                 converters: Optional[Dict[str, Callable]] = None) -> None:
+        super().__init__()
+        select_clause.validate_correlation(set(header))
+        selected = [(i, name) for i, name in enumerate(header) if select_clause.get(name) is not None]
+        if converters is None:
+            converters = select_clause.converters()
+        self._header = tuple(header)
+        self._aliases: Tuple[str, ...] = tuple(select_clause[name].alias for _, name in selected)
+        self._by_name = by_name
+        self._keys = tuple(name if by_name else i for i, name in selected)
+        self._converters = tuple(converters.get(name) for _, name in selected)
+        self._getter = converting_getter(tuple_getter(self._keys), self._converters)
+
+    @property
+    def header(self) -> Tuple[str, ...]:
+        return self._header
+
+    @property
+    def aliases(self) -> Tuple[str, ...]:
+        """Aliases of the projected values in the order they appear in the projected tuple"""
+        return self._aliases
+
+    @property
+    def by_name(self) -> bool:
+        return self._by_name
+
+    @property
+    def keys(self) -> tuple:
+        """Keys of the projected values in the raw rows (names or positions), aligned to aliases"""
+        return self._keys
+
+    @property
+    def converters(self) -> tuple:
+        """Converters of the projected values aligned to aliases, None for the values left as they are"""
+        return self._converters
+
+    @property
+    def getter(self):
+        """The underlying item getter, meant to be bound locally in the hot loops"""
+        return self._getter
+
+    def getter_for(self, aliases: Sequence[str]):
+        """The getter projecting the values in the order of the aliases, e.g. of an existing builder"""
+        getter = self._getter
+        if tuple(aliases) == self._aliases:
+            return getter
+        reorder = tuple_getter([self._aliases.index(alias) for alias in aliases])
+        return lambda row: reorder(getter(row))
+
+    def __call__(self, row) -> tuple:
+        return self._getter(row)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self._aliases})"
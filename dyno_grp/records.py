@@ -0,0 +1,133 @@
+"""
+This module contains the low level scanning of CSV records in bytes: finding record boundaries
+(honoring new lines inside of quoted fields) and parsing blocks of whole records.
+"""
+import csv
+import io
+import mmap
+import os
+
+from itertools import islice, repeat
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from dyno_grp.projection import tuple_getter
+
+_QUOTE = ord('"')
+_COUNT_STEP = 16 * 1024 * 1024
+_PAD_BATCH_SIZE = 4096
+
+
+def count_quotes(buffer, start: int, end: int) -> int:
+    quotes = 0
+    for step_start in range(start, end, _COUNT_STEP):
+        quotes += buffer[step_start:min(end, step_start + _COUNT_STEP)].count(_QUOTE)
+    return quotes
+
+
+def record_end(buffer, pos: int, in_quotes: bool) -> int:
+    """
+    Returns the position right after the end of the record containing pos.
+    in_quotes tells whether pos is inside of a quoted field
+    """
+    while True:
+        new_line = buffer.find(b"\n", pos)
+        if new_line == -1:
+            return len(buffer)
+        in_quotes ^= count_quotes(buffer, pos, new_line) % 2 == 1
+        if not in_quotes:
+            return new_line + 1
+        pos = new_line + 1
+
+
+def complete_end(buffer, start: int, end: int) -> int:
+    """
+    Returns the position right after the last complete (new line terminated) record between start and end,
+    start being a record boundary. A record which is still being appended to the file is left out
+    """
+    quotes = count_quotes(buffer, start, end)
+    pos = end
+    while True:
+        new_line = buffer.rfind(b"\n", start, pos)
+        if new_line == -1:
+            return start
+        quotes -= count_quotes(buffer, new_line + 1, pos)
+        if quotes % 2 == 0:
+            return new_line + 1
+        pos = new_line
+
+
+def split_ranges(buffer, start: int, chunk_size: int, end: Optional[int] = None):
+    """
+    Generates the byte ranges of about chunk_size bytes from start to end (the end of the buffer by default).
+    Every range starts and ends at a record boundary, the quoted new lines are detected by the parity
+    of the quotes (start and end must be record boundaries)
+    """
+    if chunk_size <= 0:
+        raise ValueError("Chunk size must be positive")
+    size = len(buffer) if end is None else end
+    while start < size:
+        target = start + chunk_size
+        if target >= size:
+            yield start, size
+            return
+        in_quotes = count_quotes(buffer, start, target) % 2 == 1
+        range_end = min(record_end(buffer, target, in_quotes), size)
+        yield start, range_end
+        start = range_end
+
+
+def record_ranges(file_name, chunk_size: int) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """Splits the CSV file to ranges (see split_ranges). Returns the raw header record and the ranges of the data"""
+    with open(file_name, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b"", []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header_end = record_end(mm, 0, False)
+            return mm[:header_end], list(split_ranges(mm, header_end, chunk_size))
+
+
+def parse_header(raw_header: bytes, encoding: str = "utf-8") -> Optional[list]:
+    return next(csv.reader(io.StringIO(raw_header.decode(encoding), newline="")), None)
+
+
+def column_positions(header: Sequence[str], columns: Iterable[str]) -> List[int]:
+    """Positions of the columns in the header, in the header order. The columns missing in the header are ignored"""
+    columns = set(columns)
+    return [i for i, name in enumerate(header) if name in columns]
+
+
+def padded_rows(rows, width: int):
+    """
+    Pads the rows shorter than width with None, as csv.DictReader does with the missing trailing values.
+    The lengths are checked by batches, so the rows of the regular files are passed as they are
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, _PAD_BATCH_SIZE))
+        if not batch:
+            return
+        if min(map(len, batch)) < width:
+            batch = [row if len(row) >= width else list(row) + [None] * (width - len(row)) for row in batch]
+        yield from batch
+
+
+def parse_block(text: str, positions: Optional[Sequence[int]] = None, width: int = 0):
+    """
+    Parses a block of whole records to lists of fields. Blocks without quotes are split by C level
+    str.split calls, the others are parsed by the csv module. Empty lines are skipped as csv.reader does.
+    If positions are given, the records are pruned to tuples of the fields at those positions and
+    the fields after the last position are not split at all.
+    The records shorter than width (or than the last position) are padded with None, see padded_rows
+    """
+    if '"' in text:
+        rows = filter(None, csv.reader(io.StringIO(text, newline="")))
+    else:
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+        lines = filter(None, text.split("\n"))
+        if positions is None:
+            return padded_rows(map(str.split, lines, repeat(",")), width)
+        rows = map(str.split, lines, repeat(","), repeat(positions[-1] + 1 if positions else 0))
+    if positions is None:
+        return padded_rows(rows, width)
+    return map(tuple_getter(positions), padded_rows(rows, positions[-1] + 1 if positions else 0))
@@ -0,0 +1,134 @@
+"""
+This module contains the output sinks of the Grouper. A sink receives the grouped result
+top level group by top level group, so the whole output is never built as one string.
+"""
+import datetime
+import json
+
+from decimal import Decimal
+from typing import Optional
+
+from dyno_grp.errors import ProcessException
+
+_WRITE_BUFFER_SIZE = 1 << 20
+
+
+def json_key(key) -> str:
+    """Converts a group key to a JSON object key the same way json.dumps does for dict keys"""
+    if isinstance(key, str):
+        return key
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    if isinstance(key, (int, float)):
+        return json.dumps(key)
+    return str(key)
+
+
+def json_default(value):
+    """Encodes the values of the typed columns which json does not know"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+class OutputSink:
+    """
+    Base class of the sinks. A target may be a file name (opened and closed by the sink)
+    or an already opened text stream (left open). If the sink is exited by an exception the output
+    is not finished, so a failed run is not mistaken for a complete one
+    """
+    def __init__(self, target) -> None:
+        super().__init__()
+        self._target = target
+        self._fp = None
+        self._owns_fp = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(completed=exc_type is None)
+
+    def open(self):
+        if isinstance(self._target, str):
+            self._fp = open(self._target, "w", encoding="utf-8", buffering=_WRITE_BUFFER_SIZE)
+            self._owns_fp = True
+        else:
+            self._fp = self._target
+            self._owns_fp = False
+        self._start()
+
+    def close(self, completed: bool = True):
+        """Closes the sink, the output is finished (e.g. the JSON object is closed) only if completed is True"""
+        fp = self._fp
+        if fp is None:
+            return
+        try:
+            if completed:
+                self._finish()
+        finally:
+            self._fp = None
+            if self._owns_fp:
+                fp.close()
+            else:
+                fp.flush()
+
+    def write_group(self, key, group):
+        if self._fp is None:
+            raise ProcessException(f"{self.__class__.__name__} is not opened")
+        self._write_group(key, group)
+
+    def _start(self):
+        pass
+
+    def _finish(self):
+        pass
+
+    def _write_group(self, key, group):
+        raise NotImplementedError()
+
+
+class JsonSink(OutputSink):
+    """
+    Writes the result as one JSON object. Every top level group is encoded at once (by the C encoder)
+    and written separately, so only one group at a time is held as a string
+    """
+    def __init__(self, target, indent: Optional[int] = None) -> None:
+        super().__init__(target)
+        self._encoder = json.JSONEncoder(indent=indent, ensure_ascii=False, default=json_default)
+        self._first = True
+
+    def _start(self):
+        self._first = True
+        self._fp.write("{")
+
+    def _write_group(self, key, group):
+        fp = self._fp
+        if not self._first:
+            fp.write(", ")
+        self._first = False
+        fp.write(self._encoder.encode(json_key(key)))
+        fp.write(": ")
+        fp.write(self._encoder.encode(group))
+
+    def _finish(self):
+        self._fp.write("}")
+
+
+class NdjsonSink(OutputSink):
+    """Writes every top level group as a separate JSON object {key: group} per line"""
+    def __init__(self, target) -> None:
+        super().__init__(target)
+        self._encoder = json.JSONEncoder(ensure_ascii=False, default=json_default)
+
+    def _write_group(self, key, group):
+        fp = self._fp
+        fp.write(self._encoder.encode({json_key(key): group}))
+        fp.write("\n")
@@ -0,0 +1,109 @@
+"""
+This module contains the external memory (spill to disk) partitioning used by the Grouper
+when a dataset does not fit into memory. Projected rows are partitioned by a hash of the first group key
+into temporary run files, so every partition holds all the rows of its top level groups.
+"""
+import math
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import zlib
+
+from typing import List, Optional
+
+# Rough ratio between the size of the CSV data and the size of the same data as Python objects
+IN_MEMORY_EXPANSION = 8
+DEFAULT_PARTITIONS = 16
+_SIZE_SAMPLE_RATE = 1024
+
+
+def partition_of(key, partitions: int) -> int:
+    """Deterministic (unlike hash() of str) partition of a group key"""
+    if not isinstance(key, str):
+        key = repr(key)
+    return zlib.crc32(key.encode("utf-8", "surrogatepass")) % partitions
+
+
+def estimate_partitions(data_size: Optional[int], memory_budget: int) -> int:
+    if not data_size:
+        return DEFAULT_PARTITIONS
+    return max(1, math.ceil(data_size * IN_MEMORY_EXPANSION / memory_budget))
+
+
+def _estimate_row_size(values: tuple) -> int:
+    return sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+
+
+class SpillPartitions:
+    """
+    Buffers rows per partition in memory and appends the buffers as pickled runs to temporary files
+    whenever the estimated size of the buffered rows exceeds the memory budget
+    """
+    def __init__(self, partitions: int, memory_budget: int, directory: Optional[str] = None) -> None:
+        super().__init__()
+        if partitions < 1:
+            raise ValueError("Number of partitions must be positive")
+        self._partitions = partitions
+        self._memory_budget = memory_budget
+        self._directory = directory
+        self._tmp_dir: Optional[str] = None
+        self._buffers: List[list] = [[] for _ in range(partitions)]
+        self._buffered_rows = 0
+        self._rows_seen = 0
+        self._row_size = 0
+        self._spilled = [False] * partitions
+
+    def __enter__(self):
+        self._tmp_dir = tempfile.mkdtemp(prefix="dyno_grp_spill_", dir=self._directory)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._partitions
+
+    def _file_name(self, partition: int):
+        return os.path.join(self._tmp_dir, f"partition_{partition:05d}.run")
+
+    def add(self, key, values: tuple):
+        if self._rows_seen % _SIZE_SAMPLE_RATE == 0:
+            row_size = _estimate_row_size(values)
+            self._row_size = max(self._row_size, row_size) if self._rows_seen else row_size
+        self._rows_seen += 1
+        self._buffers[partition_of(key, self._partitions)].append(values)
+        self._buffered_rows += 1
+        if self._buffered_rows * self._row_size > self._memory_budget:
+            self.flush()
+
+    def flush(self):
+        for partition, buffer in enumerate(self._buffers):
+            if not buffer:
+                continue
+            with open(self._file_name(partition), "ab") as f:
+                pickle.dump(buffer, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._spilled[partition] = True
+            self._buffers[partition] = []
+        self._buffered_rows = 0
+
+    def partition_rows(self, partition: int):
+        """Iterates over the rows of a partition in the order they were added"""
+        if self._spilled[partition]:
+            with open(self._file_name(partition), "rb") as f:
+                while True:
+                    try:
+                        run = pickle.load(f)
+                    except EOFError:
+                        break
+                    yield from run
+        yield from self._buffers[partition]
+
+    def close(self):
+        tmp_dir = self._tmp_dir
+        self._tmp_dir = None
+        self._buffers = [[] for _ in range(self._partitions)]
+        self._buffered_rows = 0
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
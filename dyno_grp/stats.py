@@ -0,0 +1,254 @@
+"""
+This module contains the optional instrumentation of the Grouper: the time spent per stage of the grouping,
+the rows and groups counters, the memory high-water and a throttled progress callback.
+The rows are timed in batches as they pass from stage to stage, so the overhead is small when collecting
+and there is none at all when the Grouper has no stats.
+"""
+import sys
+import time
+import tracemalloc
+
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # e.g. on Windows
+    resource = None
+
+STAGES = ("read", "filter", "project", "group", "spill", "output")
+DEFAULT_BATCH_SIZE = 1024
+
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of the process in bytes, None if it is unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class GroupingStats:
+    """
+    Collects the stats of the Grouper it is given to. The stages are
+        read - parsing of the stream, filter - the where clause, project - the projection of the rows,
+        group - adding the rows to the hierarchy (or to the spill partitions), spill - reading the partitions back,
+        output - materializing and emitting the groups (with the sink writes).
+    With sorted input the groups are emitted while grouping, so their output is counted in group.
+    The counters of the rows are not collected by the worker processes of the parallel grouping.
+    progress is called with the rows read and the bytes consumed (None if the stream does not tell)
+    at most once per progress_interval seconds and once at the end.
+    If trace_memory is True the Python allocations are traced by tracemalloc, which reports the peak
+    of the allocated memory, but slows the grouping down a few times
+    """
+    def __init__(self,
+                 progress: Optional[ProgressCallback] = None,
+                 progress_interval: float = 1.0,
+                 trace_memory: bool = False,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        super().__init__()
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        self._progress = progress
+        self._progress_interval = progress_interval
+        self._trace_memory = trace_memory
+        self._batch_size = batch_size
+        self._seconds: Dict[str, float] = defaultdict(float)
+        self._inclusive: Dict[str, float] = defaultdict(float)
+        self._total_seconds = 0.0
+        self._rows_read = 0
+        self._rows_grouped = 0
+        self._bytes_read: Optional[int] = None
+        self._position: Optional[Callable[[], Optional[int]]] = None
+        self._next_progress = 0.0
+        self._groups_per_level: List[int] = []
+        self._largest_group = 0
+        self._traced_memory_peak: Optional[int] = None
+        self._peak_rss: Optional[int] = None
+
+    @property
+    def stage_seconds(self) -> Dict[str, float]:
+        """Seconds spent in every stage (the stages which did not run are left out)"""
+        stages = {stage: self._seconds[stage] for stage in STAGES if stage in self._seconds and stage != "output"}
+        stages["output"] = max(0.0, self._total_seconds - sum(stages.values()))
+        return stages
+
+    @property
+    def total_seconds(self) -> float:
+        return self._total_seconds
+
+    @property
+    def rows_read(self) -> int:
+        return self._rows_read
+
+    @property
+    def rows_filtered(self) -> int:
+        """Rows rejected by the where clause"""
+        return self._rows_read - self._rows_grouped
+
+    @property
+    def rows_grouped(self) -> int:
+        return self._rows_grouped
+
+    @property
+    def bytes_read(self) -> Optional[int]:
+        return self._bytes_read
+
+    @property
+    def groups_per_level(self) -> List[int]:
+        """Number of the emitted groups of every level"""
+        return self._groups_per_level
+
+    @property
+    def largest_group(self) -> int:
+        """Number of the items of the largest group of the last level"""
+        return self._largest_group
+
+    @property
+    def traced_memory_peak(self) -> Optional[int]:
+        """Peak of the memory allocated by Python in bytes, only if trace_memory is True"""
+        return self._traced_memory_peak
+
+    @property
+    def peak_rss(self) -> Optional[int]:
+        """Peak resident set size of the process in bytes (since it started)"""
+        return self._peak_rss
+
+    def as_dict(self) -> dict:
+        return {
+            "stage_seconds": self.stage_seconds,
+            "total_seconds": self._total_seconds,
+            "rows_read": self._rows_read,
+            "rows_filtered": self.rows_filtered,
+            "rows_grouped": self._rows_grouped,
+            "bytes_read": self._bytes_read,
+            "groups_per_level": self._groups_per_level,
+            "largest_group": self._largest_group,
+            "traced_memory_peak": self._traced_memory_peak,
+            "peak_rss": self._peak_rss,
+        }
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.as_dict()})"
+
+    def track_position(self, position: Optional[Callable[[], Optional[int]]]):
+        """Sets the callable which tells the bytes consumed from the stream"""
+        self._position = position
+
+    def count_grouped(self, rows: int):
+        """Counts the rows grouped by a loop which is not timed in stages (e.g. the generated grouping)"""
+        self._rows_grouped += rows
+
+    def _report_progress(self, force: bool = False):
+        now = time.perf_counter()
+        if not force and now < self._next_progress:
+            return
+        self._next_progress = now + self._progress_interval
+        position = self._position() if self._position is not None else None
+        if position is not None:
+            # the last known position is kept once the stream is closed
+            self._bytes_read = position
+        if self._progress is not None:
+            self._progress(self._rows_read, self._bytes_read)
+
+    def timed(self, items, stage: str, inner: Optional[str] = None, consumer: Optional[str] = None,
+              counter: Optional[str] = None, batch_size: Optional[int] = None):
+        """
+        Generates the items timing their production in batches as the stage, less the time of the inner stage
+        spent meanwhile. The time the consumer spends on the batches is counted as the consumer stage.
+        counter is "read" or "grouped", the counted rows
+        """
+        items = iter(items)
+        batch_size = batch_size or self._batch_size
+        seconds, inclusive = self._seconds, self._inclusive
+        perf_counter = time.perf_counter
+        while True:
+            inner_before = inclusive[inner] if inner else 0.0
+            start = perf_counter()
+            batch = list(islice(items, batch_size))
+            produced = perf_counter()
+            elapsed = produced - start
+            inclusive[stage] += elapsed
+            seconds[stage] += elapsed - (inclusive[inner] - inner_before if inner else 0.0)
+            if counter == "read":
+                self._rows_read += len(batch)
+                self._report_progress()
+            elif counter == "grouped":
+                self._rows_grouped += len(batch)
+            if not batch:
+                return
+            yield from batch
+            if consumer:
+                seconds[consumer] += perf_counter() - produced
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._seconds[stage] += time.perf_counter() - start
+
+    @contextmanager
+    def tracking(self, timed: bool = True):
+        """
+        Tracks the memory of the enclosed grouping and its total time unless timed is False
+        (the memory traced by tracemalloc is tracked only if trace_memory is True)
+        """
+        started_tracing = self._trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if timed:
+                self._total_seconds += time.perf_counter() - start
+            if self._trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                self._traced_memory_peak = max(self._traced_memory_peak or 0, peak)
+            if started_tracing:
+                tracemalloc.stop()
+            self._peak_rss = peak_rss()
+            self._report_progress(force=True)
+
+    def observe(self, groups, group_rule):
+        """Counts the groups of every level of the emitted top level groups"""
+        levels = [(group_def.aggregated_property, group_def.keep_items)
+                  for _, group_def in group_rule.group_clause.items()]
+        if len(self._groups_per_level) < len(levels):
+            self._groups_per_level.extend([0] * (len(levels) - len(self._groups_per_level)))
+        for key, group in groups:
+            self._count_groups(group, levels, 0)
+            yield key, group
+
+    def observe_lazily(self, groups, group_rule):
+        """Same as observe, for the groups consumed lazily, only the time to produce the groups is tracked"""
+        with self.tracking(timed=False):
+            groups = iter(groups)
+            perf_counter = time.perf_counter
+            start = perf_counter()
+            for key, group in self.observe(groups, group_rule):
+                # the consumer's time is not the output of the Grouper
+                self._total_seconds += perf_counter() - start
+                yield key, group
+                start = perf_counter()
+            self._total_seconds += perf_counter() - start
+
+    def _count_groups(self, group, levels, depth: int):
+        self._groups_per_level[depth] += 1
+        aggregated_property, keep_items = levels[depth]
+        if not keep_items:
+            return
+        children = group[aggregated_property] if aggregated_property else group
+        if depth == len(levels) - 1:
+            if len(children) > self._largest_group:
+                self._largest_group = len(children)
+            return
+        for child in children.values():
+            self._count_groups(child, levels, depth + 1)
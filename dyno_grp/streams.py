@@ -1,19 +1,123 @@
+import bz2
 import csv
+import glob
+import gzip
 import io
+import lzma
+import mmap
+import os
 
-from typing import Optional
+from typing import Iterable, List, Optional, Sequence, Union
+
+from dyno_grp.errors import ProcessException
+from dyno_grp.projection import tuple_getter
+from dyno_grp.records import (column_positions, complete_end, padded_rows, parse_block, parse_header, record_end,
+                              split_ranges)
+
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+
+_COMPRESSED_OPENERS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+    ".lzma": lzma.open,
+}
+_GLOB_CHARS = frozenset("*?[")
+
+
+def _opener(file_name):
+    return _COMPRESSED_OPENERS.get(os.path.splitext(os.fspath(file_name))[1].lower())
+
+
+def is_compressed(file_name) -> bool:
+    """True if the file is compressed by gzip, bz2 or xz (by the extension), so it can be read only sequentially"""
+    return _opener(file_name) is not None
+
+
+def open_csv_file(file_name, encoding: Optional[str] = None):
+    """Opens a CSV file for reading as text, the files compressed by gzip, bz2 or xz are decompressed on the fly"""
+    opener = _opener(file_name)
+    if opener is None:
+        return open(file_name, newline="", encoding=encoding)
+    return opener(file_name, "rt", newline="", encoding=encoding)
+
+
+def is_glob(source) -> bool:
+    """True if the source has the glob characters and is not an existing file (e.g. "sales [2021].csv")"""
+    source = os.fspath(source)
+    return bool(_GLOB_CHARS.intersection(source)) and not os.path.exists(source)
+
+
+def expand_sources(sources: Union[str, Sequence[str]]) -> List[str]:
+    """Expands a file name, a glob or a list of them to the file names (the matches of a glob are sorted)"""
+    if isinstance(sources, (str, os.PathLike)):
+        sources = [sources]
+    file_names = []
+    for source in sources:
+        source = os.fspath(source)
+        if is_glob(source):
+            matches = sorted(glob.glob(source))
+            if not matches:
+                raise ProcessException(f"No files match {source}")
+            file_names.extend(matches)
+        else:
+            file_names.append(source)
+    if not file_names:
+        raise ProcessException("No files to stream")
+    return file_names
+
+
+def _buffer_position(fp) -> Optional[int]:
+    """Position of the binary buffer of a text file, None for the decompressing files"""
+    buffer = getattr(fp, "buffer", None)
+    if not isinstance(buffer, io.BufferedReader) or buffer.closed:
+        return None
+    return buffer.tell()
+
+
+def _selected_rows(rows, positions: Sequence[int], header: Sequence[str], compact: bool):
+    """Selects the values at the positions of the raw rows, as tuples or as dicts of the header"""
+    select = tuple_getter(positions)
+    # as csv.DictReader, the missing trailing values are None
+    rows = padded_rows(rows, max(positions) + 1 if positions else 0)
+    if compact:
+        yield from map(select, rows)
+        return
+    for row in rows:
+        yield dict(zip(header, select(row)))
 
 
 class CsvDictStream:
-    def __init__(self, file_name) -> None:
+    """
+    Streams the rows of a CSV file as dicts, the file may be compressed (see open_csv_file).
+    If compact is True the rows are streamed as lists of values ordered as the header, which avoids building
+    a dict per row.
+    If columns are given, only those columns are streamed (the header is pruned as well),
+    e.g. GroupRule.required_columns, so the unused columns of wide files never reach the grouping
+    """
+    def __init__(self, file_name, compact: bool = False, columns: Optional[Iterable[str]] = None) -> None:
         super().__init__()
         self._file_name = file_name
+        self._compact = compact
+        self._columns = None if columns is None else frozenset(columns)
         self._fp: Optional[io.TextIOWrapper] = None
         self._csv_dict_reader: Optional[csv.DictReader] = None
+        self._csv_reader = None
+        self._header: Optional[list] = None
+        self._positions: Optional[list] = None
 
     def __enter__(self):
-        self._fp = open(self._file_name)
-        self._csv_dict_reader = csv.DictReader(self._fp)
+        self._fp = open_csv_file(self._file_name)
+        if self._compact or self._columns is not None:
+            self._csv_reader = csv.reader(self._fp)
+            self._header = next(self._csv_reader, None)
+        else:
+            self._csv_dict_reader = csv.DictReader(self._fp)
+            self._header = self._csv_dict_reader.fieldnames
+        if self._columns is not None and self._header is not None:
+            self._positions = column_positions(self._header, self._columns)
+            self._header = [self._header[i] for i in self._positions]
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
@@ -21,13 +125,277 @@ class CsvDictStream:
     def __iter__(self):
         return self._data()
 
+    @property
+    def file_name(self):
+        return self._file_name
+
+    @property
+    def compact(self) -> bool:
+        return self._compact
+
+    @property
+    def columns(self) -> Optional[frozenset]:
+        return self._columns
+
+    @property
+    def header(self) -> Optional[list]:
+        return self._header
+
+    @property
+    def size(self) -> int:
+        """Size of the CSV file in bytes"""
+        return os.path.getsize(self._file_name)
+
+    @property
+    def position(self) -> Optional[int]:
+        """Bytes read from the file so far (by buffers, so a bit ahead of the rows), None if it is not open"""
+        return _buffer_position(self._fp)
+
     def _data(self):
-        for row in self._csv_dict_reader:
-            yield row
+        if self._csv_dict_reader is not None:
+            yield from self._csv_dict_reader
+            return
+        if self._header is None:
+            return
+        # csv.DictReader skips the empty lines as well
+        rows = filter(None, self._csv_reader)
+        if self._positions is None:
+            yield from padded_rows(rows, len(self._header))
+            return
+        yield from _selected_rows(rows, self._positions, self._header, self._compact)
 
     def close(self):
         fp = self._fp
         self._fp = None
         self._csv_dict_reader = None
+        self._csv_reader = None
+        self._positions = None
         if fp:
             fp.close()
+
+
+class MmapCsvStream:
+    """
+    Streams the rows of a CSV file as lists of values ordered as the header (as the compact CsvDictStream).
+    The file is memory mapped and read in blocks of whole records, every block is decoded at once and blocks
+    without quoted fields are split to values by str.split rather than by the csv module.
+    If columns are given, the rows are pruned to tuples of those columns (see CsvDictStream).
+    To follow a file which is being appended to, start_offset is the end_offset of the previous read
+    and complete_records leaves out the last record if it is not terminated by a new line yet
+    """
+    def __init__(self,
+                 file_name,
+                 encoding: str = "utf-8",
+                 block_size: int = DEFAULT_BLOCK_SIZE,
+                 columns: Optional[Iterable[str]] = None,
+                 start_offset: Optional[int] = None,
+                 complete_records: bool = False) -> None:
+        super().__init__()
+        if block_size <= 0:
+            raise ValueError("Block size must be positive")
+        if start_offset is not None and start_offset < 0:
+            raise ValueError("Start offset must not be negative")
+        self._file_name = file_name
+        self._encoding = encoding
+        self._block_size = block_size
+        self._columns = None if columns is None else frozenset(columns)
+        self._fp = None
+        self._mm: Optional[mmap.mmap] = None
+        self._header: Optional[list] = None
+        self._positions: Optional[list] = None
+        self._start_offset = start_offset
+        self._complete_records = complete_records
+        self._data_start = 0
+        self._data_end = 0
+        self._position: Optional[int] = None
+
+    def __enter__(self):
+        self._fp = open(self._file_name, "rb")
+        self._data_start = self._data_end = 0
+        if os.fstat(self._fp.fileno()).st_size:
+            mm = self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+            header_end = record_end(mm, 0, False)
+            self._header = parse_header(mm[:header_end], self._encoding)
+            self._data_start = min(max(header_end, self._start_offset or 0), len(mm))
+            self._data_end = len(mm)
+            if self._complete_records:
+                self._data_end = complete_end(mm, self._data_start, len(mm))
+        self._position = self._data_start
+        if self._columns is not None and self._header is not None:
+            self._positions = column_positions(self._header, self._columns)
+            self._header = [self._header[i] for i in self._positions]
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        return self._data()
+
+    @property
+    def file_name(self):
+        return self._file_name
+
+    @property
+    def compact(self) -> bool:
+        return True
+
+    @property
+    def columns(self) -> Optional[frozenset]:
+        return self._columns
+
+    @property
+    def header(self) -> Optional[list]:
+        return self._header
+
+    @property
+    def size(self) -> int:
+        """Size of the CSV file in bytes"""
+        return os.path.getsize(self._file_name)
+
+    @property
+    def end_offset(self) -> int:
+        """Offset right after the last record the stream reads, the start_offset of the next read of the file"""
+        return self._data_end
+
+    @property
+    def position(self) -> Optional[int]:
+        """Offset of the end of the block being read"""
+        return self._position
+
+    def _data(self):
+        for _, rows in self.blocks():
+            yield from rows
+
+    def blocks(self, start_offset: Optional[int] = None):
+        """
+        Generates the blocks of the stream as (end offset, rows of the block) pairs, the rows of a block
+        must be consumed before the next block. start_offset (a record boundary, e.g. an end offset of a block)
+        overrides the start offset of the stream
+        """
+        mm = self._mm
+        if mm is None or self._header is None:
+            return
+        start = self._data_start if start_offset is None else min(max(start_offset, self._data_start), self._data_end)
+        encoding, positions = self._encoding, self._positions
+        width = len(self._header) if positions is None else 0
+        for start, end in split_ranges(mm, start, self._block_size, self._data_end):
+            self._position = end
+            yield end, parse_block(mm[start:end].decode(encoding), positions, width)
+
+    def close(self):
+        mm, fp = self._mm, self._fp
+        self._mm = None
+        self._fp = None
+        if mm:
+            mm.close()
+        if fp:
+            fp.close()
+
+
+class MultiCsvStream:
+    """
+    Streams the rows of several CSV files (shards) one after another, as one CsvDictStream would.
+    sources are file names or globs, the files may be compressed (see open_csv_file).
+    The header of the stream is the header of the first shard (pruned to columns if they are given),
+    the header of every other shard is checked and mapped to it once, so the shards may order
+    their columns differently
+    """
+    def __init__(self,
+                 sources: Union[str, Sequence[str]],
+                 compact: bool = False,
+                 columns: Optional[Iterable[str]] = None,
+                 encoding: Optional[str] = None) -> None:
+        super().__init__()
+        self._file_names = expand_sources(sources)
+        self._compact = compact
+        self._columns = None if columns is None else frozenset(columns)
+        self._encoding = encoding
+        self._header: Optional[list] = None
+        self._fp = None
+        self._consumed = 0
+
+    def __enter__(self):
+        self._header = None
+        self._consumed = 0
+        for file_name in self._file_names:
+            with open_csv_file(file_name, self._encoding) as f:
+                header = next(csv.reader(f), None)
+            if header is not None:
+                if self._columns is not None:
+                    header = [header[i] for i in column_positions(header, self._columns)]
+                self._header = header
+                break
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        return self._data()
+
+    @property
+    def file_names(self) -> List[str]:
+        return self._file_names
+
+    @property
+    def compact(self) -> bool:
+        return self._compact
+
+    @property
+    def columns(self) -> Optional[frozenset]:
+        return self._columns
+
+    @property
+    def header(self) -> Optional[list]:
+        return self._header
+
+    @property
+    def size(self) -> int:
+        """Size of the files in bytes (as stored, i.e. compressed)"""
+        return sum(os.path.getsize(file_name) for file_name in self._file_names)
+
+    @property
+    def position(self) -> int:
+        """Bytes read so far, the compressed shards are counted when they are read completely"""
+        return self._consumed + (_buffer_position(self._fp) or 0)
+
+    def _data(self):
+        if self._header is None:
+            return
+        header = self._header
+        for file_name in self._file_names:
+            self._fp = open_csv_file(file_name, self._encoding)
+            try:
+                reader = csv.reader(self._fp)
+                shard_header = next(reader, None)
+                if shard_header is None:
+                    continue
+                missing = set(header) - set(shard_header)
+                if missing:
+                    raise ProcessException(f"Shard {file_name} misses columns {missing}")
+                positions = {name: i for i, name in enumerate(shard_header)}
+                rows = filter(None, reader)
+                if self._compact and shard_header == header:
+                    yield from padded_rows(rows, len(header))
+                else:
+                    yield from _selected_rows(rows, [positions[name] for name in header], header, self._compact)
+            finally:
+                self.close()
+                self._consumed += os.path.getsize(file_name)
+
+    def close(self):
+        fp = self._fp
+        self._fp = None
+        if fp:
+            fp.close()
+
+
+def csv_stream(csv_file, compact: bool = False, columns: Optional[Iterable[str]] = None):
+    """
+    The stream of a CSV file, or of the shards if csv_file is a list of files or a glob (see MultiCsvStream).
+    The files may be compressed
+    """
+    if isinstance(csv_file, (list, tuple)) or is_glob(csv_file):
+        return MultiCsvStream(csv_file, compact=compact, columns=columns)
+    return CsvDictStream(csv_file, compact=compact, columns=columns)
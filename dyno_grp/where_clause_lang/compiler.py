@@ -0,0 +1,235 @@
+"""
+Compiles the parsed where rules to Python closures. Every rule is compiled once,
+so evaluating it for a row costs a few function calls rather than interpreting the syntax tree.
+Missing values (None, or empty cells where numbers are expected) behave as SQL NULL: comparisons with them are false
+and arithmetic results in None.
+"""
+import operator
+import re
+
+from functools import lru_cache, reduce
+from typing import Callable, Iterable, List
+
+from dyno_grp.errors import ClauseException, ProcessException
+from dyno_grp.where_clause_lang.functions import FUNCTIONS, as_number
+from dyno_grp.where_clause_lang.lexer import TokenType
+from dyno_grp.where_clause_lang.parser import Binary, Call, ColumnRef, Expr, Like, Literal, Logical, Not, Unary
+
+# resolves a column name to a callable which extracts the value of the column from a row
+Resolver = Callable[[str], Callable]
+
+COMPARATORS = {
+    TokenType.EQUAL: operator.eq,
+    TokenType.EXCLAMATION_EQ: operator.ne,
+    TokenType.LESS_MORE: operator.ne,
+    TokenType.LESS: operator.lt,
+    TokenType.GREATER: operator.gt,
+    TokenType.LESS_EQ: operator.le,
+    TokenType.MORE_EQ: operator.ge,
+}
+
+ARITHMETIC = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.SLASH: operator.truediv,
+    TokenType.PERCENT: operator.mod,
+}
+
+
+@lru_cache(maxsize=1024)
+def like_pattern(pattern: str):
+    """Translates a like pattern ('*' - any sequence, '?' - any character) to a compiled regular expression"""
+    regex = "".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern)
+    return re.compile(regex, re.DOTALL)
+
+
+def _numeric(func):
+    def numeric(row):
+        return as_number(func(row))
+    return numeric
+
+
+def numeric_literal(value: str, expr: Binary):
+    """A string literal compared with a numeric expression must be a number"""
+    try:
+        number = as_number(value)
+    except ProcessException:
+        number = None
+    if number is None:
+        raise ClauseException(f"Cannot compare a numeric expression with '{value}' in where rule: {expr}")
+    return number
+
+
+def _constant(value):
+    def constant(row):
+        return value
+    return constant
+
+
+def _compile_comparison(expr: Binary, resolve: Resolver):
+    compare = COMPARATORS[expr.operator]
+    coerce = expr.left.numeric or expr.right.numeric
+    left, right = expr.left, expr.right
+    if isinstance(right, Literal) or isinstance(left, Literal):
+        if isinstance(left, Literal):
+            # a <op> b == b <swapped op> a, so the value is always compared on the left side
+            compare = {operator.lt: operator.gt, operator.gt: operator.lt,
+                       operator.le: operator.ge, operator.ge: operator.le}.get(compare, compare)
+            left, right = right, left
+        value = compile_expression(left, resolve)
+        constant = right.value
+        if coerce:
+            value = _numeric(value)
+            if isinstance(constant, str):
+                constant = numeric_literal(constant, expr)
+        if constant is None:
+            return _constant(False)
+
+        def compare_constant(row):
+            v = value(row)
+            return v is not None and compare(v, constant)
+        return compare_constant
+    left = compile_expression(left, resolve)
+    right = compile_expression(right, resolve)
+    if coerce:
+        left, right = _numeric(left), _numeric(right)
+
+    def compare_values(row):
+        lv = left(row)
+        if lv is None:
+            return False
+        rv = right(row)
+        return rv is not None and compare(lv, rv)
+    return compare_values
+
+
+def _compile_arithmetic(expr: Binary, resolve: Resolver):
+    apply = ARITHMETIC[expr.operator]
+    left = _numeric(compile_expression(expr.left, resolve))
+    right = _numeric(compile_expression(expr.right, resolve))
+
+    def arithmetic(row):
+        lv = left(row)
+        rv = right(row)
+        if lv is None or rv is None:
+            return None
+        try:
+            return apply(lv, rv)
+        except ZeroDivisionError:
+            raise ProcessException(f"Division by zero in where rule: {lv} {expr.operator.name} {rv}") from None
+    return arithmetic
+
+
+def _compile_like(expr: Like, resolve: Resolver):
+    value = compile_expression(expr.operand, resolve)
+    negated = expr.negated
+    if isinstance(expr.pattern, Literal):
+        match = like_pattern(str(expr.pattern.value)).fullmatch
+
+        def like(row):
+            v = value(row)
+            if v is None:
+                return False
+            return (match(v if isinstance(v, str) else str(v)) is None) is negated
+        return like
+    pattern = compile_expression(expr.pattern, resolve)
+
+    def like_dynamic(row):
+        v = value(row)
+        p = pattern(row)
+        if v is None or p is None:
+            return False
+        return (like_pattern(str(p)).fullmatch(str(v)) is None) is negated
+    return like_dynamic
+
+
+def _compile_call(expr: Call, resolve: Resolver):
+    impl = FUNCTIONS[expr.name].impl
+    argument = compile_expression(expr.arguments[0], resolve)
+
+    def call(row):
+        v = argument(row)
+        return None if v is None else impl(v)
+    return call
+
+
+def compile_expression(expr: Expr, resolve: Resolver) -> Callable:
+    if isinstance(expr, Literal):
+        return _constant(expr.value)
+    if isinstance(expr, ColumnRef):
+        return resolve(expr.name)
+    if isinstance(expr, Binary):
+        if expr.operator in Binary.COMPARISON:
+            return _compile_comparison(expr, resolve)
+        return _compile_arithmetic(expr, resolve)
+    if isinstance(expr, Like):
+        return _compile_like(expr, resolve)
+    if isinstance(expr, Logical):
+        left = compile_expression(expr.left, resolve)
+        right = compile_expression(expr.right, resolve)
+        if expr.operator == TokenType.AND:
+            return lambda row: bool(left(row)) and bool(right(row))
+        return lambda row: bool(left(row)) or bool(right(row))
+    if isinstance(expr, Not):
+        operand = compile_expression(expr.operand, resolve)
+        return lambda row: not operand(row)
+    if isinstance(expr, Unary):
+        operand = _numeric(compile_expression(expr.operand, resolve))
+
+        def negate(row):
+            v = operand(row)
+            return None if v is None else -v
+        return negate
+    if isinstance(expr, Call):
+        return _compile_call(expr, resolve)
+    raise ClauseException(f"Cannot compile {expr!r}")
+
+
+# rough relative costs of evaluation of the nodes, a comparison of a column with a constant being the unit
+_COSTS = {
+    Literal: 0,
+    ColumnRef: 0,
+    Binary: 1,
+    Logical: 0,
+    Not: 0,
+    Unary: 1,
+    Like: 8,
+    Call: 4,
+}
+_EQUALITY_DISCOUNT = 0.5
+
+
+def estimate_cost(expr: Expr) -> float:
+    """
+    Estimates the cost of evaluation of the expression. Equality comparisons get a small discount
+    as they are usually more selective than the other comparisons
+    """
+    cost = _COSTS.get(type(expr), 1) + sum(estimate_cost(child) for child in expr.children())
+    if isinstance(expr, Binary):
+        if expr.operator in Binary.ARITHMETIC:
+            cost += 1
+        elif expr.operator == TokenType.EQUAL:
+            cost -= _EQUALITY_DISCOUNT
+    return cost
+
+
+def split_conjunction(expr: Expr) -> List[Expr]:
+    """Splits the expression to the terms of its top level 'and'"""
+    if isinstance(expr, Logical) and expr.operator == TokenType.AND:
+        return split_conjunction(expr.left) + split_conjunction(expr.right)
+    return [expr]
+
+
+def compile_conjunction(expressions: Iterable[Expr], resolve: Resolver) -> Callable:
+    """
+    Compiles the expressions to a single predicate which is true only if all of them are true.
+    The expressions are evaluated in the given order and the evaluation stops at the first false one
+    """
+    predicates = [compile_expression(expr, resolve) for expr in expressions]
+    if not predicates:
+        return _constant(True)
+
+    def conjunction(left, right):
+        return lambda row: bool(left(row)) and bool(right(row))
+    return reduce(conjunction, predicates)
@@ -0,0 +1,58 @@
+"""
+Functions which may be called from the where rules
+"""
+from decimal import Decimal
+
+from dyno_grp.errors import ProcessException
+
+
+def as_number(value):
+    """
+    Coerces a value of a column (a string unless the column is typed) to a number.
+    An empty (or blank) cell is a missing value, None
+    """
+    if isinstance(value, (int, float, Decimal)) or value is None:
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        if isinstance(value, str) and not value.strip():
+            return None
+        raise ProcessException(f"Value '{value}' is not a number") from None
+
+
+class Function:
+    def __init__(self, name: str, impl, arity: int, numeric: bool) -> None:
+        super().__init__()
+        self.name = name
+        self.impl = impl
+        self.arity = arity
+        self.numeric = numeric
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name})"
+
+
+def _abs(value):
+    number = as_number(value)
+    return None if number is None else abs(number)
+
+
+def _text(func):
+    """Wraps a function of a string, so the values of the typed columns are applied as strings (as of like)"""
+    def text(value):
+        return func(value if isinstance(value, str) else str(value))
+    return text
+
+
+FUNCTIONS = {
+    "len": Function("len", _text(len), 1, numeric=True),
+    "abs": Function("abs", _abs, 1, numeric=True),
+    "lower": Function("lower", _text(str.lower), 1, numeric=False),
+    "upper": Function("upper", _text(str.upper), 1, numeric=False),
+    "trim": Function("trim", _text(str.strip), 1, numeric=False),
+}
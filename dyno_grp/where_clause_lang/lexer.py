@@ -1,4 +1,7 @@
 from enum import Enum
+from typing import List, Optional
+
+from dyno_grp.errors import ClauseException
 
 
 class TokenType(Enum):
@@ -17,6 +20,7 @@ class TokenType(Enum):
     PERCENT = 110
     GREATER = 120
     LESS = 130
+    EQUAL = 135
 
     # Two char tokens
     EXCLAMATION_EQ = 140
@@ -35,10 +39,148 @@ class TokenType(Enum):
     STRING = 230
     NUMBER = 240
 
+    EOF = 250
 
-class Scanner:
 
-    def __init__(self) -> None:
+class Token:
+    def __init__(self, token_type: TokenType, lexeme: str, literal=None, position: int = 0) -> None:
         super().__init__()
+        self.token_type = token_type
+        self.lexeme = lexeme
+        self.literal = literal
+        self.position = position
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.token_type.name}, '{self.lexeme}', {self.literal!r})"
+
+
+_SINGLE_CHAR_TOKENS = {
+    "(": TokenType.LEFT_PAREN,
+    ")": TokenType.RIGHT_PAREN,
+    "{": TokenType.LEFT_BRACE,
+    "}": TokenType.RIGHT_BRACE,
+    ",": TokenType.COMMA,
+    ".": TokenType.DOT,
+    "-": TokenType.MINUS,
+    "+": TokenType.PLUS,
+    ";": TokenType.SEMICOLON,
+    "/": TokenType.SLASH,
+    "*": TokenType.STAR,
+    "%": TokenType.PERCENT,
+    ">": TokenType.GREATER,
+    "<": TokenType.LESS,
+    "=": TokenType.EQUAL,
+}
+
+_TWO_CHAR_TOKENS = {
+    "!=": TokenType.EXCLAMATION_EQ,
+    "<>": TokenType.LESS_MORE,
+    "<=": TokenType.LESS_EQ,
+    ">=": TokenType.MORE_EQ,
+}
+
+_KEYWORDS = {
+    "and": TokenType.AND,
+    "or": TokenType.OR,
+    "not": TokenType.NOT,
+    "like": TokenType.LIKE,
+}
+
+
+class Scanner:
+    """
+    Scans a where rule to tokens. Strings are quoted by single quotes, identifiers which are not
+    plain words (e.g. contain spaces) may be quoted by double quotes. Keywords are case insensitive
+    """
+    def __init__(self, source: str) -> None:
+        super().__init__()
+        if not isinstance(source, str):
+            raise ClauseException("Where rule must be a string")
+        self._source = source
+        self._tokens: Optional[List[Token]] = None
+        self._start = 0
+        self._current = 0
+
+    def scan_tokens(self) -> List[Token]:
+        if self._tokens is not None:
+            return self._tokens
+        self._tokens = []
+        while not self._is_at_end():
+            self._start = self._current
+            self._scan_token()
+        self._tokens.append(Token(TokenType.EOF, "", position=self._current))
+        return self._tokens
+
+    def _is_at_end(self):
+        return self._current >= len(self._source)
+
+    def _advance(self):
+        c = self._source[self._current]
+        self._current += 1
+        return c
+
+    def _peek(self):
+        return "" if self._is_at_end() else self._source[self._current]
+
+    def _add_token(self, token_type: TokenType, literal=None):
+        self._tokens.append(Token(token_type, self._source[self._start:self._current], literal, self._start))
+
+    def _error(self, message):
+        return ClauseException(f"{message} at position {self._start} of where rule '{self._source}'")
+
+    def _scan_token(self):
+        c = self._advance()
+        if c.isspace():
+            return
+        two_chars = c + self._peek()
+        if two_chars in _TWO_CHAR_TOKENS:
+            self._current += 1
+            self._add_token(_TWO_CHAR_TOKENS[two_chars])
+        elif c in _SINGLE_CHAR_TOKENS:
+            self._add_token(_SINGLE_CHAR_TOKENS[c])
+        elif c == "'":
+            self._add_token(TokenType.STRING, self._quoted("'"))
+        elif c == '"':
+            self._add_token(TokenType.IDENTIFIER, self._quoted('"'))
+        elif c.isdigit():
+            self._number()
+        elif c.isalpha() or c == "_":
+            self._identifier()
+        else:
+            raise self._error(f"Unexpected character '{c}'")
+
+    def _quoted(self, quote):
+        # doubled quote inside of a quoted literal stands for the quote itself
+        chars = []
+        while True:
+            if self._is_at_end():
+                raise self._error("Unterminated quoted literal")
+            c = self._advance()
+            if c == quote:
+                if self._peek() != quote:
+                    return "".join(chars)
+                self._advance()
+            chars.append(c)
 
+    def _number(self):
+        while self._peek().isdigit():
+            self._advance()
+        is_float = False
+        if self._peek() == "." and self._current + 1 < len(self._source) and \
+                self._source[self._current + 1].isdigit():
+            is_float = True
+            self._advance()
+            while self._peek().isdigit():
+                self._advance()
+        lexeme = self._source[self._start:self._current]
+        self._add_token(TokenType.NUMBER, float(lexeme) if is_float else int(lexeme))
 
+    def _identifier(self):
+        while self._peek().isalnum() or self._peek() == "_":
+            self._advance()
+        lexeme = self._source[self._start:self._current]
+        keyword = _KEYWORDS.get(lexeme.lower())
+        if keyword:
+            self._add_token(keyword)
+        else:
+            self._add_token(TokenType.IDENTIFIER, lexeme)
@@ -0,0 +1,288 @@
+"""
+Recursive descent parser of the where rules. The grammar (from the lowest precedence):
+
+    expression -> disjunction
+    disjunction -> conjunction ( "or" conjunction )*
+    conjunction -> negation ( "and" negation )*
+    negation -> "not" negation | comparison
+    comparison -> term ( ( "=" | "!=" | "<>" | "<" | ">" | "<=" | ">=" ) term | "not"? "like" term )?
+    term -> factor ( ( "+" | "-" ) factor )*
+    factor -> unary ( ( "*" | "/" | "%" ) unary )*
+    unary -> "-" unary | primary
+    primary -> NUMBER | STRING | IDENTIFIER ( "(" arguments? ")" )? | "(" expression ")"
+"""
+from typing import List, Set
+
+from dyno_grp.errors import ClauseException
+from dyno_grp.where_clause_lang.functions import FUNCTIONS
+from dyno_grp.where_clause_lang.lexer import Scanner, Token, TokenType
+
+
+class Expr:
+    def children(self) -> tuple:
+        return ()
+
+    def columns(self) -> Set[str]:
+        """Names of the columns referenced by the expression"""
+        columns = set()
+        for child in self.children():
+            columns.update(child.columns())
+        return columns
+
+    @property
+    def numeric(self) -> bool:
+        """True if the expression is known to produce a number regardless of the columns types"""
+        return False
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.__dict__ == other.__dict__
+
+    def __hash__(self):
+        return hash(repr(self))
+
+
+class Literal(Expr):
+    def __init__(self, value) -> None:
+        super().__init__()
+        self.value = value
+
+    @property
+    def numeric(self) -> bool:
+        return isinstance(self.value, (int, float))
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.value!r})"
+
+
+class ColumnRef(Expr):
+    def __init__(self, name: str) -> None:
+        super().__init__()
+        self.name = name
+
+    def columns(self) -> Set[str]:
+        return {self.name}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name!r})"
+
+
+class Unary(Expr):
+    def __init__(self, operator: TokenType, operand: Expr) -> None:
+        super().__init__()
+        self.operator = operator
+        self.operand = operand
+
+    def children(self) -> tuple:
+        return self.operand,
+
+    @property
+    def numeric(self) -> bool:
+        return self.operator == TokenType.MINUS
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.operator.name}, {self.operand!r})"
+
+
+class Binary(Expr):
+    """Arithmetic and comparison operators"""
+    ARITHMETIC = frozenset((TokenType.PLUS, TokenType.MINUS, TokenType.STAR, TokenType.SLASH, TokenType.PERCENT))
+    COMPARISON = frozenset((TokenType.EQUAL, TokenType.EXCLAMATION_EQ, TokenType.LESS_MORE, TokenType.LESS,
+                            TokenType.GREATER, TokenType.LESS_EQ, TokenType.MORE_EQ))
+
+    def __init__(self, operator: TokenType, left: Expr, right: Expr) -> None:
+        super().__init__()
+        self.operator = operator
+        self.left = left
+        self.right = right
+
+    def children(self) -> tuple:
+        return self.left, self.right
+
+    @property
+    def numeric(self) -> bool:
+        return self.operator in self.ARITHMETIC
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.operator.name}, {self.left!r}, {self.right!r})"
+
+
+class Like(Expr):
+    def __init__(self, operand: Expr, pattern: Expr, negated: bool = False) -> None:
+        super().__init__()
+        self.operand = operand
+        self.pattern = pattern
+        self.negated = negated
+
+    def children(self) -> tuple:
+        return self.operand, self.pattern
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.operand!r}, {self.pattern!r}, {self.negated})"
+
+
+class Logical(Expr):
+    def __init__(self, operator: TokenType, left: Expr, right: Expr) -> None:
+        super().__init__()
+        self.operator = operator
+        self.left = left
+        self.right = right
+
+    def children(self) -> tuple:
+        return self.left, self.right
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.operator.name}, {self.left!r}, {self.right!r})"
+
+
+class Not(Expr):
+    def __init__(self, operand: Expr) -> None:
+        super().__init__()
+        self.operand = operand
+
+    def children(self) -> tuple:
+        return self.operand,
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.operand!r})"
+
+
+class Call(Expr):
+    def __init__(self, name: str, arguments: List[Expr]) -> None:
+        super().__init__()
+        self.name = name
+        self.arguments = list(arguments)
+
+    def children(self) -> tuple:
+        return tuple(self.arguments)
+
+    @property
+    def numeric(self) -> bool:
+        return FUNCTIONS[self.name].numeric
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name!r}, {self.arguments!r})"
+
+
+class Parser:
+    def __init__(self, source: str) -> None:
+        super().__init__()
+        self._source = source
+        self._tokens: List[Token] = Scanner(source).scan_tokens()
+        self._current = 0
+
+    def parse(self) -> Expr:
+        expr = self._disjunction()
+        if not self._check(TokenType.EOF):
+            raise self._error(self._peek(), "Unexpected token")
+        return expr
+
+    def _peek(self) -> Token:
+        return self._tokens[self._current]
+
+    def _check(self, *token_types: TokenType) -> bool:
+        return self._peek().token_type in token_types
+
+    def _advance(self) -> Token:
+        token = self._tokens[self._current]
+        if token.token_type != TokenType.EOF:
+            self._current += 1
+        return token
+
+    def _match(self, *token_types: TokenType) -> bool:
+        if self._check(*token_types):
+            self._advance()
+            return True
+        return False
+
+    def _consume(self, token_type: TokenType, message: str) -> Token:
+        if self._check(token_type):
+            return self._advance()
+        raise self._error(self._peek(), message)
+
+    def _error(self, token: Token, message: str):
+        found = token.lexeme if token.token_type != TokenType.EOF else "end of rule"
+        return ClauseException(f"{message} at position {token.position} ('{found}') of where rule '{self._source}'")
+
+    def _disjunction(self) -> Expr:
+        expr = self._conjunction()
+        while self._match(TokenType.OR):
+            expr = Logical(TokenType.OR, expr, self._conjunction())
+        return expr
+
+    def _conjunction(self) -> Expr:
+        expr = self._negation()
+        while self._match(TokenType.AND):
+            expr = Logical(TokenType.AND, expr, self._negation())
+        return expr
+
+    def _negation(self) -> Expr:
+        if self._match(TokenType.NOT):
+            return Not(self._negation())
+        return self._comparison()
+
+    def _comparison(self) -> Expr:
+        expr = self._term()
+        if self._check(*Binary.COMPARISON):
+            operator = self._advance().token_type
+            return Binary(operator, expr, self._term())
+        if self._match(TokenType.LIKE):
+            return Like(expr, self._term())
+        if self._check(TokenType.NOT) and self._tokens[self._current + 1].token_type == TokenType.LIKE:
+            self._current += 2
+            return Like(expr, self._term(), negated=True)
+        return expr
+
+    def _term(self) -> Expr:
+        expr = self._factor()
+        while self._check(TokenType.PLUS, TokenType.MINUS):
+            operator = self._advance().token_type
+            expr = Binary(operator, expr, self._factor())
+        return expr
+
+    def _factor(self) -> Expr:
+        expr = self._unary()
+        while self._check(TokenType.STAR, TokenType.SLASH, TokenType.PERCENT):
+            operator = self._advance().token_type
+            expr = Binary(operator, expr, self._unary())
+        return expr
+
+    def _unary(self) -> Expr:
+        if self._match(TokenType.MINUS):
+            operand = self._unary()
+            if isinstance(operand, Literal) and operand.numeric:
+                return Literal(-operand.value)
+            return Unary(TokenType.MINUS, operand)
+        return self._primary()
+
+    def _primary(self) -> Expr:
+        token = self._peek()
+        if self._match(TokenType.NUMBER, TokenType.STRING):
+            return Literal(token.literal)
+        if self._match(TokenType.IDENTIFIER):
+            if self._match(TokenType.LEFT_PAREN):
+                return self._call(token)
+            return ColumnRef(token.literal)
+        if self._match(TokenType.LEFT_PAREN):
+            expr = self._disjunction()
+            self._consume(TokenType.RIGHT_PAREN, "Expected ')'")
+            return expr
+        raise self._error(token, "Expected expression")
+
+    def _call(self, name_token: Token) -> Expr:
+        name = name_token.literal.lower()
+        function = FUNCTIONS.get(name)
+        if function is None:
+            raise self._error(name_token, f"Unknown function {name_token.literal}")
+        arguments = []
+        if not self._check(TokenType.RIGHT_PAREN):
+            arguments.append(self._disjunction())
+            while self._match(TokenType.COMMA):
+                arguments.append(self._disjunction())
+        self._consume(TokenType.RIGHT_PAREN, "Expected ')' after function arguments")
+        if len(arguments) != function.arity:
+            raise self._error(name_token, f"Function {name} expects {function.arity} argument(s)")
+        return Call(name, arguments)
+
+
+def parse(source: str) -> Expr:
+    return Parser(source).parse()
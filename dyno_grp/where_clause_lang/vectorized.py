@@ -0,0 +1,301 @@
+"""
+Compiles the parsed where rules to vectorized NumPy expressions evaluated over batches of rows.
+NumPy is optional, if it is not installed HAS_NUMPY is False and the rows are filtered by the row closures.
+The semantics are the same as of the row closures (see compiler.py), missing values behave as SQL NULL.
+"""
+import operator
+
+from itertools import compress, islice
+from typing import Callable, List, Optional, Sequence
+
+from dyno_grp.errors import ClauseException, ProcessException
+from dyno_grp.where_clause_lang.compiler import COMPARATORS, Resolver, like_pattern, numeric_literal
+from dyno_grp.where_clause_lang.functions import FUNCTIONS, as_number
+from dyno_grp.where_clause_lang.lexer import TokenType
+from dyno_grp.where_clause_lang.parser import Binary, Call, ColumnRef, Expr, Like, Literal, Logical, Not, Unary
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+DEFAULT_BATCH_SIZE = 64 * 1024
+
+_ARITHMETIC = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.SLASH: operator.truediv,
+    TokenType.PERCENT: operator.mod,
+}
+
+
+class ColumnBatch:
+    """A batch of raw rows, the columns are turned into object arrays on the first access"""
+    def __init__(self, rows: List) -> None:
+        super().__init__()
+        self.rows = rows
+        self._columns = dict()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, key, convert: Optional[Callable] = None):
+        """The column of the key, if convert is given (a converter of a typed column) the values are converted"""
+        column = self._columns.get(key)
+        if column is None:
+            values = map(operator.itemgetter(key), self.rows)
+            if convert is not None:
+                values = map(convert, values)
+            column = self._columns[key] = np.fromiter(values, dtype=object, count=len(self.rows))
+        return column
+
+
+class _Vector:
+    """Result of a vectorized sub expression: the values and the mask of the missing (NULL) values"""
+    __slots__ = ("values", "nulls", "numeric")
+
+    def __init__(self, values, nulls, numeric: bool) -> None:
+        self.values = values
+        self.nulls = nulls
+        self.numeric = numeric
+
+
+def _nulls_of(values):
+    return np.equal(values, None)
+
+
+def _to_numeric(vector: _Vector) -> _Vector:
+    if vector.numeric:
+        return vector
+    values = vector.values
+    if vector.nulls.any():
+        values = np.where(vector.nulls, np.nan, values)
+    try:
+        values = values.astype(np.float64)
+    except (TypeError, ValueError):
+        # the same error as of the row evaluation, the empty cells are missing values
+        numbers = [as_number(value) for value in values]
+        blanks = _nulls_of(numbers)
+        values = np.where(blanks, np.nan, numbers).astype(np.float64)
+        return _Vector(values, vector.nulls | blanks, True)
+    return _Vector(values, vector.nulls, True)
+
+
+def _map(func, vector: _Vector, dtype) -> _Vector:
+    values = vector.values
+    count = len(values)
+    if vector.nulls.any():
+        valid = ~vector.nulls
+        result = np.zeros(count, dtype=dtype) if dtype is not object else np.full(count, None, dtype=object)
+        result[valid] = np.fromiter(map(func, values[valid]), dtype=dtype, count=int(valid.sum()))
+        return _Vector(result, vector.nulls, dtype is not object)
+    return _Vector(np.fromiter(map(func, values), dtype=dtype, count=count), vector.nulls, dtype is not object)
+
+
+def _compile(expr: Expr, resolve: Resolver) -> Callable:
+    if isinstance(expr, Literal):
+        value = expr.value
+        return lambda batch: value
+    if isinstance(expr, ColumnRef):
+        column = resolve(expr.name)
+
+        def column_vector(batch):
+            values = column(batch)
+            return _Vector(values, _nulls_of(values), False)
+        return column_vector
+    if isinstance(expr, Binary):
+        if expr.operator in Binary.COMPARISON:
+            return _compile_comparison(expr, resolve)
+        return _compile_arithmetic(expr, resolve)
+    if isinstance(expr, Like):
+        return _compile_like(expr, resolve)
+    if isinstance(expr, Logical):
+        left = _compile_mask(expr.left, resolve)
+        right = _compile_mask(expr.right, resolve)
+        combine = np.logical_and if expr.operator == TokenType.AND else np.logical_or
+        return lambda batch: combine(left(batch), right(batch))
+    if isinstance(expr, Not):
+        operand = _compile_mask(expr.operand, resolve)
+        return lambda batch: ~operand(batch)
+    if isinstance(expr, Unary):
+        operand = _compile(expr.operand, resolve)
+
+        def negate(batch):
+            vector = _to_numeric(operand(batch))
+            return _Vector(-vector.values, vector.nulls, True)
+        return negate
+    if isinstance(expr, Call):
+        return _compile_call(expr, resolve)
+    raise ClauseException(f"Cannot compile {expr!r}")
+
+
+def _compile_mask(expr: Expr, resolve: Resolver) -> Callable:
+    """Compiles an expression which is used as a condition to a boolean mask of the batch"""
+    compiled = _compile(expr, resolve)
+
+    def mask(batch):
+        result = compiled(batch)
+        if isinstance(result, _Vector):
+            values = result.values if result.numeric else np.fromiter(map(bool, result.values), dtype=bool,
+                                                                      count=len(result.values))
+            return np.asarray(values, dtype=bool) & ~result.nulls
+        if isinstance(result, np.ndarray):
+            return result
+        return np.full(len(batch), bool(result), dtype=bool)
+    return mask
+
+
+def _numeric_side(side: Expr, expr: Binary, compiled: Callable) -> Callable:
+    """A string literal compared with a numeric expression is a number, as of the row closures"""
+    if isinstance(side, Literal) and isinstance(side.value, str):
+        number = numeric_literal(side.value, expr)
+        return lambda batch: number
+    return compiled
+
+
+def _compile_comparison(expr: Binary, resolve: Resolver):
+    compare = COMPARATORS[expr.operator]
+    coerce = expr.left.numeric or expr.right.numeric
+    left = _compile(expr.left, resolve)
+    right = _compile(expr.right, resolve)
+    if coerce:
+        left = _numeric_side(expr.left, expr, left)
+        right = _numeric_side(expr.right, expr, right)
+
+    def comparison(batch):
+        lv, rv = left(batch), right(batch)
+        nulls = None
+        for side in (lv, rv):
+            if isinstance(side, _Vector):
+                nulls = side.nulls if nulls is None else nulls | side.nulls
+        if nulls is None:
+            return np.full(len(batch), lv is not None and rv is not None and compare(lv, rv), dtype=bool)
+        # as of the row closures, only the values of the columns are coerced, not the constants
+        if coerce:
+            lv = _to_numeric(lv).values if isinstance(lv, _Vector) else lv
+            rv = _to_numeric(rv).values if isinstance(rv, _Vector) else rv
+        else:
+            lv = lv.values if isinstance(lv, _Vector) else lv
+            rv = rv.values if isinstance(rv, _Vector) else rv
+        if lv is None or rv is None:
+            return np.zeros(len(batch), dtype=bool)
+        result = np.zeros(len(batch), dtype=bool)
+        valid = ~nulls
+        if valid.all():
+            result[:] = compare(lv, rv)
+        else:
+            result[valid] = compare(lv[valid] if isinstance(lv, np.ndarray) else lv,
+                                    rv[valid] if isinstance(rv, np.ndarray) else rv)
+        return result
+    return comparison
+
+
+def _compile_arithmetic(expr: Binary, resolve: Resolver):
+    apply = _ARITHMETIC[expr.operator]
+    left = _compile(expr.left, resolve)
+    right = _compile(expr.right, resolve)
+
+    def arithmetic(batch):
+        lv, rv = left(batch), right(batch)
+        nulls = np.zeros(len(batch), dtype=bool)
+        operands = []
+        for side in (lv, rv):
+            if isinstance(side, _Vector):
+                side = _to_numeric(side)
+                nulls = nulls | side.nulls
+                operands.append(side.values)
+            else:
+                side = as_number(side)
+                if side is None:
+                    nulls[:] = True
+                    side = np.nan
+                operands.append(side)
+        if expr.operator in (TokenType.SLASH, TokenType.PERCENT):
+            divisor = operands[1]
+            if np.any((np.asarray(divisor) == 0) & ~nulls):
+                raise ProcessException(f"Division by zero in where rule: {expr!r}")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = apply(operands[0], operands[1])
+        return _Vector(np.broadcast_to(values, len(batch)), nulls, True)
+    return arithmetic
+
+
+def _compile_like(expr: Like, resolve: Resolver):
+    operand = _compile(expr.operand, resolve)
+    pattern = _compile(expr.pattern, resolve)
+    negated = expr.negated
+
+    def like(batch):
+        vector = operand(batch)
+        pattern_value = pattern(batch)
+        if not isinstance(vector, _Vector):
+            vector = _Vector(np.full(len(batch), vector, dtype=object), np.full(len(batch), vector is None), False)
+        if isinstance(pattern_value, _Vector):
+            patterns = pattern_value.values
+            nulls = vector.nulls | pattern_value.nulls
+            matches = np.fromiter((p is not None and v is not None and
+                                   like_pattern(str(p)).fullmatch(str(v)) is not None
+                                   for v, p in zip(vector.values, patterns)), dtype=bool, count=len(batch))
+        else:
+            if pattern_value is None:
+                return np.zeros(len(batch), dtype=bool)
+            match = like_pattern(str(pattern_value)).fullmatch
+            nulls = vector.nulls
+            matches = _map(lambda v: match(v if isinstance(v, str) else str(v)) is not None, vector, bool).values
+        return (matches ^ negated) & ~nulls
+    return like
+
+
+def _compile_call(expr: Call, resolve: Resolver):
+    function = FUNCTIONS[expr.name]
+    argument = _compile(expr.arguments[0], resolve)
+    dtype = np.float64 if function.numeric else object
+    impl = function.impl
+
+    def call(batch):
+        vector = argument(batch)
+        if not isinstance(vector, _Vector):
+            return None if vector is None else impl(vector)
+        try:
+            result = _map(impl, vector, dtype)
+        except TypeError:
+            # a numeric function of the empty cells (e.g. abs) results in missing values
+            result = _map(impl, vector, object)
+            nulls = vector.nulls | _nulls_of(result.values)
+            return _Vector(np.where(nulls, np.nan, result.values).astype(np.float64), nulls, True)
+        if function.numeric and vector.nulls.any():
+            result.values[vector.nulls] = np.nan
+        return result
+    return call
+
+
+def compile_vectorized(expressions: Sequence[Expr], resolve: Resolver) -> Callable:
+    """
+    Compiles the expressions to a function of a ColumnBatch which returns the mask of the rows
+    for which all the expressions are true. resolve maps a column alias to a callable returning the column array
+    """
+    if not HAS_NUMPY:
+        raise ClauseException("Vectorized where clause requires numpy")
+    masks = [_compile_mask(expr, resolve) for expr in expressions]
+
+    def conjunction(batch):
+        mask = masks[0](batch)
+        for next_mask in masks[1:]:
+            if not mask.any():
+                break
+            mask = mask & next_mask(batch)
+        return mask
+    return conjunction
+
+
+def filter_batches(rows, vectorized_predicate: Callable, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Filters the raw rows batch by batch with the vectorized predicate"""
+    rows = iter(rows)
+    while True:
+        batch = ColumnBatch(list(islice(rows, batch_size)))
+        if not len(batch):
+            return
+        yield from compress(batch.rows, vectorized_predicate(batch))
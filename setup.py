@@ -32,6 +32,9 @@ setuptools.setup(
     # package_data={'core.containers': ['*.yaml'], 'core.impls.handlers.deployment.templates': ['*.j2']},
     install_requires=[
     ],
+    extras_require={
+        "numpy": ["numpy"],
+    },
     include_package_data=True,
     classifiers=[
         "Programming Language :: Python :: 3",
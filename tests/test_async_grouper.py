@@ -0,0 +1,84 @@
+import asyncio
+import csv
+import json
+import unittest
+
+from dyno_grp.async_grouper import AsyncGrouper
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
+from dyno_grp.grouper import Grouper
+from dyno_grp.streams import CsvDictStream
+
+
+class AsyncRows:
+    """Async stream of list rows with a header, as an async producer would feed them"""
+    def __init__(self, header, rows) -> None:
+        super().__init__()
+        self.header = header
+        self._rows = rows
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def __aiter__(self):
+        for row in self._rows:
+            await asyncio.sleep(0)
+            yield row
+
+
+class TestAsyncGrouper(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test002.json") as f:
+            self.group_rule = GroupRule.from_raw(json.load(f))
+        with open("test_data002.csv", newline="") as f:
+            reader = csv.reader(f)
+            self.header = next(reader)
+            self.rows = list(reader)
+        self.expected = Grouper(CsvDictStream("test_data002.csv"), self.group_rule)()
+
+    def test_single_async_stream(self):
+        stream = AsyncRows(self.header, self.rows)
+        result = asyncio.run(AsyncGrouper(stream, self.group_rule, batch_size=3)())
+        self.assertEqual(list(self.expected.items()), list(result.items()))
+
+    def test_fan_in_of_streams(self):
+        # every supplier comes from one stream, so the order of the items within the groups is kept
+        clothes = [row for row in self.rows if row[3] == "Clothes"]
+        others = [row for row in self.rows if row[3] != "Clothes"]
+        dict_rows = [dict(zip(self.header, row)) for row in others]
+        grouper = AsyncGrouper([AsyncRows(self.header, clothes), iter(dict_rows)], self.group_rule,
+                               compact_leaves=True, batch_size=2)
+        self.assertEqual(self.expected, asyncio.run(grouper()))
+
+    def test_failed_stream_stops_the_others(self):
+        consumed = []
+
+        async def endless():
+            row = dict(zip(self.header, self.rows[0]))
+            while True:
+                await asyncio.sleep(0)
+                consumed.append(None)
+                yield row
+
+        async def group():
+            # the category of the last row conflicts with the first rows of its supplier
+            failing = AsyncRows(self.header, self.rows[:2] + [self.rows[0][:3] + ["Electronics"] + self.rows[0][4:]])
+            with self.assertRaises(ProcessException):
+                await AsyncGrouper([failing, endless()], self.group_rule, batch_size=1)()
+            count = len(consumed)
+            for _ in range(10):
+                await asyncio.sleep(0)
+            return count
+
+        self.assertEqual(asyncio.run(group()), len(consumed))
+
+    def test_empty_streams(self):
+        with self.assertRaises(ProcessException):
+            asyncio.run(AsyncGrouper([AsyncRows(self.header, []), iter([])], self.group_rule)())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import copy
+import csv
+import os
+import tempfile
+import unittest
+
+from benchmarks.generator import DatasetSpec, generate_csv, generate_rows
+from benchmarks.suite import compare
+from dyno_grp.grouper import Grouper
+
+
+class TestGenerator(unittest.TestCase):
+    def test_rows_are_reproducible(self):
+        spec = DatasetSpec(rows=50, columns=20, cardinality=5, depth=3, similar_ratio=0.5, selected_ratio=0.5)
+        rows = list(generate_rows(spec))
+        self.assertEqual(rows, list(generate_rows(spec)))
+        self.assertNotEqual(rows, list(generate_rows(DatasetSpec(**dict(spec.as_dict(), seed=7)))))
+        self.assertEqual([len(spec.header)] * 50, [len(row) for row in rows])
+        self.assertEqual(20, len(spec.header))
+        self.assertEqual(3 + 8, len(spec.rule()["select"]))
+
+    def test_generated_rule_groups_generated_data(self):
+        spec = DatasetSpec(rows=200, columns=12, cardinality=4, depth=2, similar_ratio=0.5, sorted_keys=True)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "data.csv")
+            generate_csv(file_name, spec)
+            with open(file_name, newline="") as f:
+                keys = [row["Key0"] for row in csv.DictReader(f)]
+            grouped_data = Grouper.csv_to_json_grouper(file_name, spec.rule(), sorted_input=True)()
+        self.assertEqual(keys, sorted(keys, key=lambda key: int(key.split("_")[1])))
+        self.assertEqual(4, len(grouped_data))
+        self.assertEqual(200, sum(len(subgroup["items"]) for group in grouped_data.values()
+                                  for subgroup in group["items"].values()))
+
+
+class TestCompare(unittest.TestCase):
+    def test_regressions_over_threshold(self):
+        baseline = {"scenarios": {"baseline": {"rows": 10, "rows_per_second": 100.0, "output_seconds": 1.0,
+                                               "peak_rss_mb": 50.0}}}
+        results = copy.deepcopy(baseline)
+        results["scenarios"]["baseline"]["rows_per_second"] = 95.0
+        reports = []
+        self.assertFalse(compare(results, baseline, 0.1, reports.append))
+        results["scenarios"]["baseline"]["peak_rss_mb"] = 60.0
+        self.assertTrue(compare(results, baseline, 0.1, reports.append))
+        self.assertIn("peak_rss_mb +20.0% REGRESSION", reports[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from decimal import Decimal
+
+from dyno_grp.binary_output import BinarySink, load_binary
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
+from dyno_grp.grouper import Grouper
+from dyno_grp.sinks import JsonSink
+from dyno_grp.streams import CsvDictStream
+
+
+class TestBinaryOutput(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp_dir.name, "groups.bin")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_round_trip_of_the_json_output(self):
+        for rule_file, data_file in (("rule_test002.json", "test_data002.csv"),
+                                     ("rule_test003.json", "test_data002.csv")):
+            with open(rule_file) as f:
+                rules = json.load(f)
+            for compact in (False, True):
+                json_output = io.StringIO()
+                Grouper.csv_to_json_grouper(data_file, rules, compact=compact)(sink=JsonSink(json_output))
+                binary_sink = BinarySink(self.output, batch_size=2)
+                Grouper.csv_to_json_grouper(data_file, rules, compact=compact)(sink=binary_sink)
+                self.assertEqual(json.loads(json_output.getvalue()), load_binary(self.output))
+
+    def test_typed_values_and_streams(self):
+        result = {
+            datetime.date(2021, 3, 1): {
+                "Socks": [{"Qty": 3, "UnitPrice": Decimal("1.10"), "Paid": True, "Weight": 0.5},
+                          {"Qty": 1 << 70, "UnitPrice": None, "Paid": False, "Weight": 1.0}],
+                "Boots": [{"Qty": 1, "Note": "ü"}, {"Note": "a", "Qty": 2}],
+                "Hats": [],
+            },
+            7: {"total": 2.5, "when": datetime.datetime(2021, 3, 1, 10, 30), "at": datetime.time(9, 15),
+                "tags": ["a", None, [{}], ({},)], "empty": {}},
+        }
+        stream = io.BytesIO()
+        with BinarySink(stream) as sink:
+            for key, group in result.items():
+                sink.write_group(key, group)
+        stream.seek(0)
+        loaded = load_binary(stream)
+        expected = dict(result)
+        expected[7] = dict(result[7], tags=["a", None, [{}], [{}]])
+        self.assertEqual(expected, loaded)
+        self.assertEqual([datetime.date, int], [type(key) for key in loaded])
+        self.assertIs(type(loaded[datetime.date(2021, 3, 1)]["Socks"][0]["UnitPrice"]), Decimal)
+        self.assertEqual(["Note", "Qty"], list(loaded[datetime.date(2021, 3, 1)]["Boots"][1]))
+
+    def test_nullable_columns(self):
+        # the column of the groups follows the magic, the count of the block and the column of the two keys
+        position = 8 + 4 + 1 + 2 * 4
+        for value, column in (("q", b"n\x00\x01s"), (3, b"n\x00\x01q"), ([3], b"n\x00\x01l")):
+            with BinarySink(self.output) as sink:
+                sink.write_group("a", None)
+                sink.write_group("b", value)
+            with open(self.output, "rb") as f:
+                self.assertEqual(column, f.read()[position:position + len(column)])
+            self.assertEqual({"a": None, "b": value}, load_binary(self.output))
+
+    def test_typed_grouping_and_invalid_output(self):
+        file_name = os.path.join(self.tmp_dir.name, "typed.csv")
+        with open(file_name, "w", newline="") as f:
+            f.write("Item,Qty,Price\nSocks,3,1.10\nSocks,1,20.00\nHat,10,5.5\n")
+        group_rule = GroupRule.from_raw({
+            "select": ["Item", {"Qty": {"type": "int"}}, {"Price": {"type": "decimal"}}],
+            "groups": {"Item": {}},
+        })
+        expected = Grouper(CsvDictStream(file_name), group_rule)()
+        Grouper(CsvDictStream(file_name), group_rule)(sink=BinarySink(self.output))
+        self.assertEqual(expected, load_binary(self.output))
+        with open(self.output, "wb") as f:
+            f.write(b"{}")
+        with self.assertRaises(ProcessException):
+            load_binary(self.output)
+        with self.assertRaises(ProcessException):
+            with BinarySink(io.BytesIO()) as sink:
+                sink.write_group("Socks", {"items": {1, 2}})
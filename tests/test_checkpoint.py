@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+
+from dyno_grp.builder import HierarchyBuilder
+from dyno_grp.checkpoint import Checkpoint
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
+from dyno_grp.grouper import Grouper
+from dyno_grp.streams import CsvDictStream, MmapCsvStream
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test002.json") as f:
+            self.rules = json.load(f)
+        self.group_rule = GroupRule.from_raw(self.rules)
+        with open("test_data002.csv", newline="") as f:
+            self.lines = f.read().splitlines(keepends=True)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.tmp_dir.name, "data.csv")
+        self.checkpoint_path = os.path.join(self.tmp_dir.name, "grouping.ckpt")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def _write(self, lines):
+        with open(self.file_name, "w", newline="") as f:
+            f.writelines(lines)
+
+    def _grouper(self, group_rule=None):
+        stream = MmapCsvStream(self.file_name, block_size=40)
+        return Grouper(stream, group_rule or self.group_rule, compact_leaves=True,
+                       checkpoint=Checkpoint(self.checkpoint_path, interval=1))
+
+    def _fail_midway(self):
+        # a row in the middle conflicts with the category of its supplier
+        self._write(self.lines[:7] + [self.lines[7].replace("Electronics", "Clothes")] + self.lines[8:])
+        with self.assertRaises(ProcessException):
+            self._grouper()()
+        self.assertTrue(os.path.exists(self.checkpoint_path))
+
+    def test_resume_after_failure(self):
+        expected = Grouper(CsvDictStream("test_data002.csv"), self.group_rule)()
+        self._fail_midway()
+        self._write(self.lines)
+        self.assertEqual(list(expected.items()), list(self._grouper()().items()))
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_checkpoint_of_another_rule_or_file_is_rejected(self):
+        self._fail_midway()
+        rules = dict(self.rules, where={"big": "Qty > 2"})
+        with self.assertRaises(ProcessException):
+            self._grouper(GroupRule.from_raw(rules))()
+        self._write(self.lines[:1] + [self.lines[1].replace("Socks", "Shoes")] + self.lines[2:])
+        with self.assertRaises(ProcessException):
+            self._grouper()()
+
+    def test_edit_anywhere_in_the_consumed_part_is_detected(self):
+        # far more than a block of the file before the offset
+        self._write(self.lines[:1] + self.lines[1:] * 1000)
+        offset = os.path.getsize(self.file_name) - len(self.lines[-1])
+        builder = HierarchyBuilder(self.group_rule, ["Item", "Qty", "Supplier", "Category", "City"],
+                                   compact_leaves=True)
+        checkpoint = Checkpoint(self.checkpoint_path, interval=1)
+        checkpoint.save(self.file_name, offset // 2, builder)
+        checkpoint.save(self.file_name, offset, builder)
+        self.assertEqual(offset, Checkpoint(self.checkpoint_path).load(self.file_name, builder))
+        # the same size, only the first row differs
+        self._write(self.lines[:1] + [self.lines[1].replace("Socks", "Shoes")] + self.lines[2:] + self.lines[1:] * 999)
+        self.assertLess(offset, os.path.getsize(self.file_name))
+        with self.assertRaises(ProcessException):
+            Checkpoint(self.checkpoint_path).load(self.file_name, builder)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import json
+import marshal
+import os
+import tempfile
+import sys
+import unittest
+from unittest import mock
+
+from dyno_grp.builder import HierarchyBuilder
+from dyno_grp.codegen import CodeCache, compile_grouping, default_cache_directory, generate_source
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
+from dyno_grp.grouper import Grouper
+
+
+class TestCodegen(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = CodeCache(self.tmp_dir.name)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def assert_same_groups(self, rules, compact=False):
+        expected = Grouper.csv_to_json_grouper("test_data002.csv", rules, compact=compact)()
+        grouped_data = Grouper.csv_to_json_grouper("test_data002.csv", rules, compact=compact,
+                                                   code_cache=self.cache)()
+        self.assertEqual(list(expected.items()), list(grouped_data.items()))
+
+    def test_generated_grouping_is_same_as_generic(self):
+        for rule_file in ("rule_test002.json", "rule_test003.json"):
+            with open(rule_file) as f:
+                rules = json.load(f)
+            self.assert_same_groups(rules)
+            self.assert_same_groups(rules, compact=True)
+
+    def test_generated_aggregates(self):
+        with open("rule_test002.json") as f:
+            rules = json.load(f)
+        rules["select"][1] = {"Qty": {"type": "int"}}
+        rules["groups"]["Supplier"]["aggregates"] = {"rows": "count", "total": "sum(Qty)"}
+        self.assert_same_groups(rules)
+        rules["groups"] = {"Supplier": dict(rules["groups"]["Supplier"], keep_items=False)}
+        self.assert_same_groups(rules)
+
+    def test_code_cached_on_disk(self):
+        with open("rule_test002.json") as f:
+            group_rule = GroupRule.from_raw(json.load(f))
+        projector = group_rule.compile_projector(["Item", "Qty", "Supplier", "Category", "City"], by_name=False)
+        builder = HierarchyBuilder(group_rule, projector.aliases)
+        code = self.cache.code(builder, projector.keys, projector.converters, False)
+        key = self.cache.cache_key(builder, projector.keys, projector.converters, False)
+        with open(os.path.join(self.tmp_dir.name, f"{key}.py")) as f:
+            self.assertEqual(generate_source(builder, projector.keys, projector.converters, False), f.read())
+        # another job loads the compiled code rather than generating it
+        self.assertEqual(code, CodeCache(self.tmp_dir.name).code(builder, projector.keys, projector.converters,
+                                                                False))
+        group_rows = compile_grouping(builder, projector.keys, projector.converters, cache=self.cache)
+        self.assertEqual(2, group_rows([["Socks", "3", "Alpha", "Clothes", "New York"],
+                                        ["Boots", "5", "Alpha", "Clothes", "New York"]]))
+        self.assertEqual({"Alpha": {"items_data": {"New York": {"Socks": [{"Qty": "3"}], "Boots": [{"Qty": "5"}]}},
+                                    "Category": "Clothes"}}, builder.result)
+        with self.assertRaises(ProcessException):
+            group_rows([["Phone", "1", "Alpha", "Electronics", "New York"]])
+
+    def test_untrusted_cache_is_not_loaded(self):
+        with open("rule_test002.json") as f:
+            group_rule = GroupRule.from_raw(json.load(f))
+        projector = group_rule.compile_projector(["Item", "Qty", "Supplier", "Category", "City"], by_name=False)
+        builder = HierarchyBuilder(group_rule, projector.aliases)
+        key = self.cache.cache_key(builder, projector.keys, projector.converters, False)
+        code_path = os.path.join(self.tmp_dir.name, f"{key}.{sys.implementation.cache_tag}.bin")
+        planted = compile("raise RuntimeError('planted')", code_path, "exec")
+        with open(code_path, "wb") as f:
+            marshal.dump(planted, f)
+        # a file which others can write to, or in a directory which others can write to, is never loaded
+        for file_mode, directory_mode in ((0o666, 0o700), (0o600, 0o777)):
+            os.chmod(code_path, file_mode)
+            os.chmod(self.tmp_dir.name, directory_mode)
+            code = CodeCache(self.tmp_dir.name).code(builder, projector.keys, projector.converters, False)
+            self.assertNotEqual(planted, code)
+        os.chmod(self.tmp_dir.name, 0o700)
+
+    def test_default_cache_directory_is_per_user(self):
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp_dir.name}):
+            self.assertEqual(os.path.join(self.tmp_dir.name, "dyno_grp", "codegen"), default_cache_directory())
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": ""}):
+            self.assertTrue(default_cache_directory().startswith(os.path.expanduser("~")))
+
+    def test_generated_grouping_only_in_memory(self):
+        with open("rule_test002.json") as f:
+            rules = json.load(f)
+        with self.assertRaises(ProcessException):
+            Grouper.csv_to_json_grouper("test_data002.csv", rules, sorted_input=True, code_cache=self.cache)
+        with self.assertRaises(ProcessException):
+            Grouper.csv_to_json_grouper("test_data002.csv", rules, intern_leaves=True, code_cache=self.cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from decimal import Decimal
+
+from dyno_grp.converters import converter
+from dyno_grp.definitions import Column, GroupRule
+from dyno_grp.errors import ClauseException, ProcessException
+from dyno_grp.grouper import Grouper
+from dyno_grp.sinks import JsonSink
+from dyno_grp.streams import CsvDictStream
+from dyno_grp.where_clause_lang.vectorized import HAS_NUMPY
+
+RULES = {
+    "select": [
+        "Item",
+        {"Qty": {"type": "int"}},
+        {"Price": {"as": "UnitPrice", "type": "decimal"}},
+        {"Shipped": {"type": "date"}},
+        {"Paid": {"type": "bool"}},
+    ],
+    "where": {"recent": "Shipped >= '2021-03-01' and Qty > 1"},
+    "groups": {"Shipped": {}, "Item": {}}
+}
+
+DATA = ("Item,Qty,Price,Shipped,Paid\n"
+        "Socks,3,1.10,2021-03-01,yes\n"
+        "Boots,1,20.00,2021-03-01,no\n"
+        "Shirt,2,,2021-04-15,true\n"
+        "Hat,10,5.5,2021-02-28,0\n")
+
+
+class TestConverters(unittest.TestCase):
+    def test_types(self):
+        self.assertEqual(10, converter("int")("10"))
+        self.assertEqual(Decimal("1.10"), converter("decimal")("1.10"))
+        self.assertEqual(datetime.date(2021, 3, 1), converter("date")("2021-03-01"))
+        self.assertEqual([True, False], list(map(converter("bool"), ["Yes", "0"])))
+        self.assertIsNone(converter("float")(""))
+        self.assertEqual(1.5, converter("float")(1.5))
+
+    def test_repeated_values_are_parsed_once(self):
+        convert = converter("int", cache_size=2)
+        self.assertIs(convert("1000000"), convert("1000000"))
+        with self.assertRaises(ProcessException):
+            converter("int", "Qty")("three")
+        with self.assertRaises(ClauseException):
+            converter("complex")
+        with self.assertRaises(ClauseException):
+            Column("Qty", column_type="complex")
+
+    def test_typed_grouping(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "typed.csv")
+            with open(file_name, "w", newline="") as f:
+                f.write(DATA)
+            group_rule = GroupRule.from_raw(RULES)
+            expected = {
+                datetime.date(2021, 3, 1): {
+                    "Socks": [{"Qty": 3, "UnitPrice": Decimal("1.10"), "Paid": True}]},
+                datetime.date(2021, 4, 15): {
+                    "Shirt": [{"Qty": 2, "UnitPrice": None, "Paid": True}]},
+            }
+            self.assertEqual(expected, Grouper(CsvDictStream(file_name), group_rule)())
+            self.assertEqual(expected, Grouper(CsvDictStream(file_name, compact=True), group_rule)())
+            if HAS_NUMPY:
+                self.assertEqual(expected, Grouper(CsvDictStream(file_name), group_rule, batch_size=2)())
+            output = io.StringIO()
+            Grouper(CsvDictStream(file_name), group_rule)(sink=JsonSink(output))
+            self.assertEqual({"2021-03-01": {"Socks": [{"Qty": 3, "UnitPrice": 1.1, "Paid": True}]},
+                              "2021-04-15": {"Shirt": [{"Qty": 2, "UnitPrice": None, "Paid": True}]}},
+                             json.loads(output.getvalue()))
+
+    def test_typed_columns_in_functions_and_comparisons(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "typed.csv")
+            with open(file_name, "w", newline="") as f:
+                f.write(DATA)
+            for where, items in (("len(Qty) > 1", ["Hat"]), ("lower(Qty) = '3'", ["Socks"]),
+                                 ("trim(UnitPrice) = '5.5'", ["Hat"]), ("upper(Paid) = 'FALSE'", ["Boots", "Hat"]),
+                                 ("Qty > len(Item)", ["Hat"])):
+                rules = dict(RULES, where={"rule": where}, groups={"Item": {}})
+                group_rule = GroupRule.from_raw(rules)
+                self.assertEqual(items, list(Grouper(CsvDictStream(file_name), group_rule)()), where)
+                if HAS_NUMPY:
+                    self.assertEqual(items, list(Grouper(CsvDictStream(file_name), group_rule, batch_size=2)()),
+                                     where)
+            for where in ("Qty > Item", "Shipped = Qty", "Shipped < 5", "lower(Item) = Qty"):
+                group_rule = GroupRule.from_raw(dict(RULES, where={"rule": where}, groups={"Item": {}}))
+                with self.assertRaises(ClauseException):
+                    Grouper(CsvDictStream(file_name), group_rule)()
+
+
+if __name__ == '__main__':
+    unittest.main()
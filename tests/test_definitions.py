@@ -80,6 +80,22 @@ class TestGroupDefinition(unittest.TestCase):
         with self.assertRaises(ClauseException):
             GroupDef("alpha", True)
 
+    def test_aggregates(self):
+        grp = GroupDef("alpha", aggregated_property="items", aggregates={"rows": "count", "total": "sum( Qty )"})
+        self.assertEqual(["rows", "total"], grp.aggregate_names)
+        self.assertEqual([None, "Qty"], [aggregate.column for aggregate in grp.aggregates])
+        self.assertTrue(grp.keep_items)
+        with self.assertRaises(ClauseException):
+            GroupDef("alpha", aggregated_property="items", aggregates={"total": "median(Qty)"})
+        with self.assertRaises(ClauseException):
+            GroupDef("alpha", aggregated_property="items", aggregates={"total": "sum"})
+        with self.assertRaises(ClauseException):
+            GroupDef("alpha", aggregates={"rows": "count"})
+        with self.assertRaises(ClauseException):
+            GroupDef("alpha", ["beta"], "items", aggregates={"beta": "count"})
+        with self.assertRaises(ClauseException):
+            GroupDef("alpha", aggregated_property="items", keep_items=False)
+
 
 class TestGroup(unittest.TestCase):
 
@@ -120,6 +136,14 @@ class TestGroup(unittest.TestCase):
         with self.assertRaises(ClauseException):
             GroupsClause(gen2)
 
+    def test_items_dropped_only_in_last_group(self):
+        gen = OrderedDict(
+            column2=GroupDef("column2", aggregated_property="values", aggregates={"rows": "count"}, keep_items=False),
+            column=GroupDef("column")
+        )
+        with self.assertRaises(ClauseException):
+            GroupsClause(gen)
+
     def test_same_group_in_similar_items(self):
         gen2 = OrderedDict(
             column2=GroupDef("column2", ['column'], "second_column_values"),
@@ -183,6 +207,18 @@ class TestGroupRule(unittest.TestCase):
         with self.assertRaises(ClauseException):
             group_rule = GroupRule(select_clause=select_clause, where_clause=None, groups_clause=groups_clause)
 
+    def test_group_def_aggregates_should_relate_to_aliases_in_select(self):
+        select_clause = SelectClause([
+            Column("column1", "first_name"),
+            Column("column2", "second_name"),
+        ])
+        groups_clause = GroupsClause.from_raw(OrderedDict([
+            ("first_name", {"aggregated_property": "values", "aggregates": {"total": "sum(column2)"}}),
+            ("second_name", dict()),
+        ]))
+        with self.assertRaises(ClauseException):
+            GroupRule(select_clause=select_clause, where_clause=None, groups_clause=groups_clause)
+
     def test_group_rule_load(self):
         with open("rule_example_no_lang.json") as f:
             definitions = json.load(f)
@@ -0,0 +1,27 @@
+import unittest
+
+from dyno_grp.encoding import ColumnDictionary, interning_getter
+from dyno_grp.projection import tuple_getter
+
+
+class TestColumnDictionary(unittest.TestCase):
+    def test_codes(self):
+        dictionary = ColumnDictionary()
+        self.assertEqual([0, 1, 0], [dictionary.encode(v) for v in ("Alpha", "Beta", "Alpha")])
+        self.assertEqual("Beta", dictionary.decode(1))
+        self.assertEqual(2, len(dictionary))
+        self.assertIn("Alpha", dictionary)
+
+    def test_overflowed_dictionary_stops_growing(self):
+        dictionary = ColumnDictionary(max_size=2)
+        self.assertEqual(["a", "b", "c", "a"], [dictionary.intern(v) for v in ("a", "b", "c", "a")])
+        self.assertTrue(dictionary.overflowed)
+        self.assertEqual(["a", "b"], dictionary.values)
+
+    def test_interning_getter(self):
+        dictionaries = [None, ColumnDictionary()]
+        getter = interning_getter(tuple_getter([2, 0]), dictionaries)
+        first = getter(["New York", "y", "Alpha"])
+        second = getter(["".join(["New ", "York"]), "y", "Alpha"])
+        self.assertEqual(("Alpha", "New York"), first)
+        self.assertIs(first[1], second[1])
@@ -1,7 +1,13 @@
 import json
 import unittest
 
+from dyno_grp.aggregates import ACCUMULATORS
+from dyno_grp.builder import HierarchyBuilder
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
 from dyno_grp.grouper import Grouper
+from dyno_grp.parallel import group_file_in_parallel
+from dyno_grp.streams import CsvDictStream
 
 
 class TestGrouping(unittest.TestCase):
@@ -21,7 +27,138 @@ class TestGrouping(unittest.TestCase):
         grouper = Grouper.csv_to_json_grouper(data_file, rules)
         grouped_data = grouper()
 
+    def test_spill_to_disk(self):
+        with open("rule_test002.json") as f:
+            rules = json.load(f)
+        expected = Grouper.csv_to_json_grouper("test_data002.csv", rules)()
+        grouper = Grouper(CsvDictStream("test_data002.csv", compact=True), GroupRule.from_raw(rules),
+                          memory_budget=64, spill_partitions=3)
+        grouped_data = grouper()
+        self.assertEqual(expected, grouped_data)
+
+    def test_sorted_input(self):
+        with open("rule_test002.json") as f:
+            rules = json.load(f)
+        expected = Grouper.csv_to_json_grouper("test_data002.csv", rules)()
+        groups = Grouper.csv_to_json_grouper("test_data002.csv", rules, sorted_input=True)(lazy=True)
+        self.assertEqual(("Alpha Clothes", expected["Alpha Clothes"]), next(groups))
+        self.assertEqual(list(expected.items())[1:], list(groups))
+
+    def test_unsorted_input(self):
+        with open("rule_test001.json") as f:
+            rules = json.load(f)
+        rules["groups"]["Gender"]["similar_items"] = []
+        grouper = Grouper.csv_to_json_grouper("test_data001.csv", rules, sorted_input=True)
+        with self.assertRaises(ProcessException):
+            grouper()
+
+
+class TestAggregates(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test002.json") as f:
+            self.rules = json.load(f)
+        self.rules["groups"]["Supplier"]["aggregates"] = {
+            "rows": "count",
+            "total": "sum(Qty)",
+            "avg_qty": "avg(Qty)",
+            "max_qty": "max(Qty)",
+            "cities": "count_distinct(City)",
+        }
+
+    def test_aggregates_of_groups(self):
+        grouped_data = Grouper.csv_to_json_grouper("test_data002.csv", self.rules)()
+        alpha = grouped_data["Alpha Clothes"]
+        self.assertEqual((3, 10, 5, 2), (alpha["rows"], alpha["total"], alpha["max_qty"], alpha["cities"]))
+        self.assertAlmostEqual(10 / 3, alpha["avg_qty"])
+        self.assertEqual(["New York", "Los Angeles"], list(alpha["items_data"]))
+        self.assertEqual(grouped_data, Grouper.csv_to_json_grouper("test_data002.csv", self.rules, compact=True)())
+
+    def test_aggregates_without_items(self):
+        self.rules["groups"] = {"Supplier": dict(self.rules["groups"]["Supplier"], keep_items=False)}
+        grouped_data = Grouper.csv_to_json_grouper("test_data002.csv", self.rules)()
+        self.assertEqual({"Category": "Electronics", "rows": 3, "total": 15, "avg_qty": 5.0, "max_qty": 7,
+                          "cities": 2}, grouped_data["Giga Phone"])
+
+    def test_empty_cells_and_numeric_text(self):
+        results = dict()
+        for function, accumulator in ACCUMULATORS.items():
+            instance = accumulator()
+            for value in ("9", "", "10", None, "2"):
+                instance.add(value)
+            results[function] = instance.result()
+        self.assertEqual({"count": 3, "sum": 21, "min": 2, "max": 10, "avg": 7.0, "count_distinct": 3}, results)
+        names = ACCUMULATORS["max"]()
+        for value in ("Boots", "Socks", ""):
+            names.add(value)
+        self.assertEqual("Socks", names.result())
+        with self.assertRaises(ProcessException):
+            names.add("3")
+
+    def test_aggregates_merged_across_ranges(self):
+        expected = Grouper.csv_to_json_grouper("test_data002.csv", self.rules)()
+        builder = group_file_in_parallel("test_data002.csv", GroupRule.from_raw(self.rules), workers=2, chunk_size=50)
+        self.assertEqual(expected, builder.result)
+
+
+class TestHierarchyBuilder(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test002.json") as f:
+            self.group_rule = GroupRule.from_raw(json.load(f))
+        self.aliases = ["Item", "Qty", "Supplier", "Category", "City"]
+
+    def test_single_pass_hierarchy(self):
+        builder = HierarchyBuilder(self.group_rule, self.aliases)
+        builder.add(("Socks", "3", "Alpha", "Clothes", "New York"))
+        builder.add(("Boots", "5", "Alpha", "Clothes", "New York"))
+        builder.add(("Socks", "2", "Alpha", "Clothes", "Los Angeles"))
+        builder.add(("Phone", "5", "Giga", "Electronics", "New York"))
+        self.assertEqual({
+            "Alpha": {
+                "items_data": {
+                    "New York": {"Socks": [{"Qty": "3"}], "Boots": [{"Qty": "5"}]},
+                    "Los Angeles": {"Socks": [{"Qty": "2"}]},
+                },
+                "Category": "Clothes",
+            },
+            "Giga": {
+                "items_data": {"New York": {"Phone": [{"Qty": "5"}]}},
+                "Category": "Electronics",
+            },
+        }, builder.result)
+
+    def test_compact_leaves_materialize_as_dicts(self):
+        rows = [
+            ("Socks", "3", "Alpha", "Clothes", "New York"),
+            ("Boots", "5", "Alpha", "Clothes", "New York"),
+            ("Phone", "5", "Giga", "Electronics", "Los Angeles"),
+        ]
+        builder = HierarchyBuilder(self.group_rule, self.aliases)
+        compact_builder = HierarchyBuilder(self.group_rule, self.aliases, compact_leaves=True)
+        for row in rows:
+            builder.add(row)
+            compact_builder.add(row)
+        self.assertEqual(("Qty",), compact_builder.leaf_names)
+        self.assertEqual(builder.result, compact_builder.result)
+
+    def test_interned_leaves_share_values(self):
+        rows = [
+            ("Socks", "30", "Alpha", "Clothes", "New York"),
+            ("Boots", "".join(["3", "0"]), "Alpha", "Clothes", "New York"),
+        ]
+        builder = HierarchyBuilder(self.group_rule, self.aliases)
+        interned_builder = HierarchyBuilder(self.group_rule, self.aliases, compact_leaves=True, intern_leaves=True)
+        for row in rows:
+            builder.add(row)
+            interned_builder.add(row)
+        self.assertEqual(builder.result, interned_builder.result)
+        items = interned_builder.state["Alpha"]["items_data"]["New York"]
+        self.assertIs(items["Socks"][0][0], items["Boots"][0][0])
 
+    def test_similar_items_checked_on_insert(self):
+        builder = HierarchyBuilder(self.group_rule, self.aliases)
+        builder.add(("Socks", "3", "Alpha", "Clothes", "New York"))
+        with self.assertRaises(ProcessException):
+            builder.add(("Phone", "1", "Alpha", "Electronics", "New York"))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,45 @@
+import bz2
+import json
+import os
+import tempfile
+import unittest
+
+from dyno_grp.errors import ProcessException
+from dyno_grp.grouper import Grouper
+from dyno_grp.multi_grouper import MultiGrouper
+
+
+class TestMultiGrouper(unittest.TestCase):
+    def setUp(self) -> None:
+        self.definitions = dict()
+        for name in ("rule_test002", "rule_test003"):
+            with open(f"{name}.json") as f:
+                self.definitions[name] = json.load(f)
+        self.definitions["by_city"] = {
+            "select": ["Item", {"Qty": {"type": "int"}}, "City"],
+            "groups": {"City": {}},
+        }
+
+    def test_results_are_same_as_of_separate_groupers(self):
+        for compact in (False, True):
+            results = MultiGrouper.csv_to_json_groupers("test_data002.csv", self.definitions, compact=compact)()
+            self.assertEqual(list(self.definitions), list(results))
+            for name, definition in self.definitions.items():
+                expected = Grouper.csv_to_json_grouper("test_data002.csv", definition, compact=compact)()
+                self.assertEqual(list(expected.items()), list(results[name].items()))
+
+    def test_rules_must_be_named(self):
+        with self.assertRaises(ProcessException):
+            MultiGrouper(None, [])
+
+    def test_single_compressed_file(self):
+        expected = MultiGrouper.csv_to_json_groupers("test_data002.csv", self.definitions)()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "data.csv.bz2")
+            with open("test_data002.csv", "rb") as f, bz2.open(file_name, "wb") as compressed:
+                compressed.write(f.read())
+            self.assertEqual(expected, MultiGrouper.csv_to_json_groupers(file_name, self.definitions)())
+
+
+if __name__ == '__main__':
+    unittest.main()
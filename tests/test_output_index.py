@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import unittest
+
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
+from dyno_grp.grouper import Grouper
+from dyno_grp.output_index import IndexedJsonReader, IndexedJsonSink, write_index
+
+
+class TestIndexedOutput(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test002.json") as f:
+            self.rules = json.load(f)
+        self.expected = Grouper.csv_to_json_grouper("test_data002.csv", self.rules)()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp_dir.name, "groups.json")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_top_level_lookups(self):
+        Grouper.csv_to_json_grouper("test_data002.csv", self.rules)(sink=IndexedJsonSink(self.output))
+        with open(self.output) as f:
+            self.assertEqual(self.expected, json.load(f))
+        with IndexedJsonReader(self.output) as reader:
+            self.assertEqual(5, len(reader))
+            self.assertEqual(self.expected["Giga Phone"], reader.get("Giga Phone"))
+            self.assertEqual(self.expected["Super TV"], reader["Super TV"])
+            self.assertIsNone(reader.get("Giga Phone", "New York"))
+            self.assertNotIn("Omega", reader)
+            with self.assertRaises(KeyError):
+                reader["Omega"]
+            self.assertEqual([(key,) for key in self.expected], reader.paths())
+
+    def test_children_lookups(self):
+        sink = IndexedJsonSink.for_rule(self.output, GroupRule.from_raw(self.rules))
+        Grouper.csv_to_json_grouper("test_data002.csv", self.rules, compact=True)(sink=sink)
+        with open(self.output) as f:
+            self.assertEqual(self.expected, json.load(f))
+        with IndexedJsonReader(self.output) as reader:
+            self.assertEqual(5 + 7, len(reader))
+            self.assertEqual(self.expected["Alpha Clothes"], reader.get("Alpha Clothes"))
+            self.assertEqual({"Computer": [{"Qty": "7"}]}, reader.get("Giga Phone", "Los Angeles"))
+            self.assertEqual(b'{"Boots": [{"Qty": "2"}]}', reader.raw("Beta Boots", "New York"))
+            self.assertEqual(("Alpha Clothes",), reader.paths()[0])
+            self.assertEqual(("Alpha Clothes", "New York"), reader.paths()[1])
+
+    def test_failed_output_is_not_indexed(self):
+        Grouper.csv_to_json_grouper("test_data002.csv", self.rules)(sink=IndexedJsonSink(self.output))
+        index_path = f"{self.output}.idx"
+        self.assertTrue(os.path.exists(index_path))
+        with self.assertRaises(ProcessException):
+            with IndexedJsonSink(self.output) as sink:
+                sink.write_group("Alpha", {"Qty": 1})
+                raise ProcessException("Failed")
+        self.assertFalse(os.path.exists(index_path))
+        with open(self.output) as f:
+            self.assertEqual('{"Alpha": {"Qty": 1}', f.read())
+        self.assertEqual(["groups.json"], os.listdir(self.tmp_dir.name))
+
+    def test_many_keys_and_invalid_index(self):
+        entries = [(json.dumps([str(i)]).encode("utf-8"), i, 1) for i in range(1000)]
+        index_path = os.path.join(self.tmp_dir.name, "many.idx")
+        with open(self.output, "w") as f:
+            f.write("0" * 1000)
+        write_index(index_path, entries)
+        with IndexedJsonReader(self.output, index_path) as reader:
+            self.assertEqual([b"0"] * 1000, [reader.raw(str(i)) for i in range(1000)])
+            self.assertIsNone(reader.raw("1000"))
+        with self.assertRaises(ProcessException):
+            write_index(index_path, entries[:2] * 2)
+        with self.assertRaises(ProcessException):
+            IndexedJsonReader(self.output, self.output).open()
+
+
+if __name__ == '__main__':
+    unittest.main()
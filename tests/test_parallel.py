@@ -0,0 +1,109 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
+from dyno_grp.grouper import Grouper
+from dyno_grp.parallel import group_file_in_parallel, group_files_in_parallel, record_ranges
+from dyno_grp.streams import MultiCsvStream, expand_sources, is_glob
+
+
+class TestParallelGrouping(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test002.json") as f:
+            self.rules = json.load(f)
+
+    def test_record_ranges_honor_quoted_new_lines(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "quoted.csv")
+            with open(file_name, "w", newline="") as f:
+                f.write('A,B\n1,"x\ny"\n2,"""q""\n,z"\n3,w\n')
+            header, ranges = record_ranges(file_name, chunk_size=1)
+            with open(file_name, "rb") as f:
+                data = f.read()
+        self.assertEqual(b"A,B\n", header)
+        self.assertEqual([b'1,"x\ny"\n', b'2,"""q""\n,z"\n', b"3,w\n"], [data[s:e] for s, e in ranges])
+
+    def test_parallel_grouping_is_same_as_sequential(self):
+        expected = Grouper.csv_to_json_grouper("test_data002.csv", self.rules)()
+        builder = group_file_in_parallel("test_data002.csv", GroupRule.from_raw(self.rules),
+                                         workers=2, chunk_size=50)
+        self.assertEqual(list(expected.items()), list(builder.items()))
+        self.assertEqual(expected, Grouper.csv_to_json_grouper("test_data002.csv", self.rules, workers=2)())
+
+    def test_similar_items_checked_across_ranges(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "conflict.csv")
+            with open(file_name, "w", newline="") as f:
+                f.write("Item,Qty,Supplier,Category,City\n"
+                        "Socks,3,Alpha,Clothes,New York\n"
+                        "Phone,1,Alpha,Electronics,New York\n")
+            with self.assertRaises(ProcessException):
+                group_file_in_parallel(file_name, GroupRule.from_raw(self.rules), workers=2, chunk_size=1)
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test002.json") as f:
+            self.rules = json.load(f)
+        with open("test_data002.csv", newline="") as f:
+            reader = csv.reader(f)
+            self.header = next(reader)
+            self.rows = list(reader)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # shards with columns in different orders, one of them compressed
+        for i, (opener, suffix) in enumerate(((open, ""), (gzip.open, ".gz"), (open, ""))):
+            order = list(range(len(self.header)))[::1 if i % 2 == 0 else -1]
+            with opener(os.path.join(self.tmp_dir.name, f"shard{i}.csv{suffix}"), "wt", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow([self.header[j] for j in order])
+                writer.writerows([row[j] for j in order] for row in self.rows[i * 4:(i + 1) * 4])
+        self.pattern = os.path.join(self.tmp_dir.name, "shard*")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_shards_are_grouped_as_one_file(self):
+        expected = Grouper.csv_to_json_grouper("test_data002.csv", self.rules)()
+        self.assertEqual(list(expected.items()), list(Grouper.csv_to_json_grouper(self.pattern, self.rules)().items()))
+        compact = Grouper.csv_to_json_grouper(self.pattern, self.rules, compact=True)()
+        self.assertEqual(list(expected.items()), list(compact.items()))
+        builder = group_files_in_parallel(MultiCsvStream(self.pattern).file_names, GroupRule.from_raw(self.rules),
+                                          workers=2)
+        self.assertEqual(list(expected.items()), list(builder.items()))
+        self.assertEqual(expected, Grouper.csv_to_json_grouper(self.pattern, self.rules, workers=2)())
+
+    def test_single_compressed_file(self):
+        file_name = os.path.join(self.tmp_dir.name, "data.csv.gz")
+        with open("test_data002.csv", "rb") as f, gzip.open(file_name, "wb") as compressed:
+            shutil.copyfileobj(f, compressed)
+        expected = Grouper.csv_to_json_grouper("test_data002.csv", self.rules)()
+        self.assertEqual(expected, Grouper.csv_to_json_grouper(file_name, self.rules)())
+        self.assertEqual(expected, Grouper.csv_to_json_grouper(file_name, self.rules, compact=True)())
+        self.assertEqual(expected, Grouper.csv_to_json_grouper([file_name], self.rules, workers=2)())
+        with self.assertRaises(ProcessException):
+            Grouper.csv_to_json_grouper(file_name, self.rules, workers=2)()
+
+    def test_existing_file_with_glob_characters(self):
+        file_name = os.path.join(self.tmp_dir.name, "shard[0].csv")
+        shutil.copy(os.path.join(self.tmp_dir.name, "shard0.csv"), file_name)
+        self.assertFalse(is_glob(file_name))
+        self.assertEqual([file_name], expand_sources(file_name))
+        self.assertTrue(is_glob(os.path.join(self.tmp_dir.name, "shard[0-9].csv")))
+
+    def test_incompatible_shard(self):
+        with open(os.path.join(self.tmp_dir.name, "shard9.csv"), "w", newline="") as f:
+            f.write("Item,Qty\nSocks,1\n")
+        with self.assertRaises(ProcessException):
+            Grouper.csv_to_json_grouper(self.pattern, self.rules)()
+        with self.assertRaises(ProcessException):
+            Grouper.csv_to_json_grouper(self.pattern, self.rules, workers=2)()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import io
+import json
+import unittest
+
+from dyno_grp.grouper import Grouper
+from dyno_grp.sinks import JsonSink, NdjsonSink
+
+
+class TestSinks(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test002.json") as f:
+            self.rules = json.load(f)
+
+    def test_json_sink(self):
+        expected = Grouper.csv_to_json_grouper("test_data002.csv", self.rules)()
+        output = io.StringIO()
+        self.assertIsNone(Grouper.csv_to_json_grouper("test_data002.csv", self.rules)(sink=JsonSink(output)))
+        self.assertEqual(expected, json.loads(output.getvalue()))
+
+    def test_ndjson_sink(self):
+        output = io.StringIO()
+        Grouper.csv_to_json_grouper("test_data002.csv", self.rules, compact=True)(sink=NdjsonSink(output))
+        lines = output.getvalue().splitlines()
+        self.assertEqual(["Alpha Clothes", "Beta Boots", "Giga Phone", "Super TV", "Giga Phones"],
+                         [next(iter(json.loads(line))) for line in lines])
+        self.assertEqual({"items_data": {"New York": {"Boots": [{"Qty": "2"}]}}, "Category": "Clothes"},
+                         json.loads(lines[1])["Beta Boots"])
+
+    def test_failed_output_is_not_finished(self):
+        output = io.StringIO()
+        with self.assertRaises(RuntimeError):
+            with JsonSink(output) as sink:
+                sink.write_group("Alpha", {"Qty": "1"})
+                raise RuntimeError("Stream failed")
+        self.assertEqual('{"Alpha": {"Qty": "1"}', output.getvalue())
+        with self.assertRaises(json.JSONDecodeError):
+            json.loads(output.getvalue())
+
+    def test_lazy_groups(self):
+        groups = Grouper.csv_to_json_grouper("test_data002.csv", self.rules)(lazy=True)
+        key, group = next(groups)
+        self.assertEqual("Alpha Clothes", key)
+        self.assertEqual("Clothes", group["Category"])
+
+
+if __name__ == '__main__':
+    unittest.main()
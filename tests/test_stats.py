@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+import unittest
+
+from dyno_grp.checkpoint import Checkpoint
+from dyno_grp.definitions import GroupRule
+from dyno_grp.grouper import Grouper
+from dyno_grp.sinks import NdjsonSink
+from dyno_grp.stats import GroupingStats
+from dyno_grp.streams import MmapCsvStream
+
+
+class TestGroupingStats(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test003.json") as f:
+            self.rules = json.load(f)
+        self.expected = Grouper.csv_to_json_grouper("test_data002.csv", self.rules)()
+
+    def test_counters_and_stages(self):
+        progress = []
+        stats = GroupingStats(progress=lambda rows, read_bytes: progress.append((rows, read_bytes)))
+        grouped_data = Grouper.csv_to_json_grouper("test_data002.csv", self.rules, stats=stats)()
+        self.assertEqual(self.expected, grouped_data)
+        self.assertEqual((9, 3, 6), (stats.rows_read, stats.rows_filtered, stats.rows_grouped))
+        self.assertEqual([2, 4, 6], stats.groups_per_level)
+        self.assertEqual(1, stats.largest_group)
+        self.assertEqual(["read", "filter", "project", "group", "output"], list(stats.stage_seconds))
+        self.assertAlmostEqual(stats.total_seconds, sum(stats.stage_seconds.values()))
+        self.assertEqual((9, os.path.getsize("test_data002.csv")), progress[-1])
+        self.assertIsNone(stats.traced_memory_peak)
+
+    def test_lazy_and_sink_output(self):
+        stats = GroupingStats(trace_memory=True)
+        grouper = Grouper.csv_to_json_grouper("test_data002.csv", self.rules, compact=True, stats=stats)
+        self.assertEqual(list(self.expected.items()), list(grouper(lazy=True)))
+        self.assertGreater(stats.traced_memory_peak, 0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            grouper(NdjsonSink(os.path.join(tmp_dir, "groups.ndjson")))
+        self.assertEqual((18, 12), (stats.rows_read, stats.rows_grouped))
+        self.assertEqual([4, 8, 12], stats.groups_per_level)
+
+    def test_spilled_and_checkpointed_grouping(self):
+        stats = GroupingStats()
+        grouped_data = Grouper.csv_to_json_grouper("test_data002.csv", self.rules, memory_budget=64, stats=stats)()
+        self.assertEqual(self.expected, grouped_data)
+        self.assertIn("spill", stats.stage_seconds)
+        stats = GroupingStats()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            grouper = Grouper(MmapCsvStream("test_data002.csv"), GroupRule.from_raw(self.rules),
+                              checkpoint=Checkpoint(os.path.join(tmp_dir, "checkpoint")), stats=stats)
+            self.assertEqual(self.expected, grouper())
+        self.assertEqual((9, 6), (stats.rows_read, stats.rows_grouped))
+        self.assertEqual(os.path.getsize("test_data002.csv"), stats.bytes_read)
+
+
+if __name__ == '__main__':
+    unittest.main()
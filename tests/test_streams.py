@@ -0,0 +1,174 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from dyno_grp.definitions import GroupRule
+from dyno_grp.errors import ProcessException
+from dyno_grp.grouper import Grouper
+from dyno_grp.sinks import NdjsonSink
+from dyno_grp.streams import CsvDictStream, MmapCsvStream, MultiCsvStream
+
+
+class TestMmapCsvStream(unittest.TestCase):
+    def test_rows_are_same_as_of_csv_reader(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "quoted.csv")
+            with open(file_name, "w", newline="") as f:
+                f.write('A,B,C\r\n1,"x\ny",a\r\n\r\n2,"""q"",z",\r\n3,w,b\r\n4,,c\r\n5,"é",d')
+            with open(file_name, newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                expected_header = next(reader)
+                expected = [row for row in reader if row]
+            for block_size in (1, 7, 1024):
+                with MmapCsvStream(file_name, block_size=block_size) as stream:
+                    self.assertEqual(expected_header, stream.header)
+                    self.assertEqual(expected, list(stream))
+
+    def test_empty_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "empty.csv")
+            open(file_name, "w").close()
+            with MmapCsvStream(file_name) as stream:
+                self.assertIsNone(stream.header)
+                self.assertEqual([], list(stream))
+
+    def test_grouping_is_same_as_of_csv_dict_stream(self):
+        with open("rule_test002.json") as f:
+            group_rule = GroupRule.from_raw(json.load(f))
+        expected = Grouper(CsvDictStream("test_data002.csv"), group_rule)()
+        result = Grouper(MmapCsvStream("test_data002.csv", block_size=64), group_rule)()
+        self.assertEqual(list(expected.items()), list(result.items()))
+
+
+class TestColumnPruning(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test003.json") as f:
+            self.rules = json.load(f)
+        self.group_rule = GroupRule.from_raw(self.rules)
+
+    def test_required_columns(self):
+        self.assertEqual({"Item", "Qty", "Supplier", "Category", "City"}, self.group_rule.required_columns)
+
+    def test_pruned_rows(self):
+        columns = {"Supplier", "Item", "Missing"}
+        with CsvDictStream("test_data002.csv") as stream:
+            expected = [{k: row[k] for k in stream.header if k in columns} for row in stream]
+        with CsvDictStream("test_data002.csv", columns=columns) as stream:
+            self.assertEqual(["Item", "Supplier"], stream.header)
+            self.assertEqual(expected, list(stream))
+        compact_expected = [tuple(row.values()) for row in expected]
+        with CsvDictStream("test_data002.csv", compact=True, columns=columns) as stream:
+            self.assertEqual(compact_expected, list(stream))
+        with MmapCsvStream("test_data002.csv", block_size=64, columns=columns) as stream:
+            self.assertEqual(["Item", "Supplier"], stream.header)
+            self.assertEqual(compact_expected, list(stream))
+
+    def test_short_rows_are_padded_in_every_mode(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "ragged.csv")
+            with open(file_name, "w", newline="") as f:
+                f.write("Item,Qty,Supplier\nSocks,3,Alpha\nBoots\nHat,1\n")
+            with CsvDictStream(file_name) as stream:
+                expected = [tuple(row.values()) for row in stream]
+            self.assertEqual([("Socks", "3", "Alpha"), ("Boots", None, None), ("Hat", "1", None)], expected)
+            for stream in (CsvDictStream(file_name, compact=True), MmapCsvStream(file_name),
+                           MultiCsvStream(file_name, compact=True)):
+                with stream:
+                    self.assertEqual(expected, list(map(tuple, stream)))
+            pruned = [(item, supplier) for item, _, supplier in expected]
+            for stream in (CsvDictStream(file_name, compact=True, columns={"Item", "Supplier"}),
+                           MmapCsvStream(file_name, columns={"Item", "Supplier"})):
+                with stream:
+                    self.assertEqual(pruned, list(stream))
+            with CsvDictStream(file_name, columns={"Item", "Supplier"}) as stream:
+                self.assertEqual([{"Item": item, "Supplier": supplier} for item, supplier in pruned], list(stream))
+
+    def test_grouping_of_pruned_stream(self):
+        expected = Grouper(CsvDictStream("test_data002.csv"), self.group_rule)()
+        columns = self.group_rule.required_columns
+        for stream in (CsvDictStream("test_data002.csv", columns=columns),
+                       MmapCsvStream("test_data002.csv", columns=columns)):
+            self.assertEqual(list(expected.items()), list(Grouper(stream, self.group_rule)().items()))
+
+
+class TestIncrementalGrouping(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("rule_test002.json") as f:
+            self.group_rule = GroupRule.from_raw(json.load(f))
+        with open("test_data002.csv", newline="") as f:
+            self.lines = f.read().splitlines(keepends=True)
+
+    def _suppliers(self, lines):
+        return list(dict.fromkeys(row["Supplier"] for row in csv.DictReader(self.lines[:1] + lines)))
+
+    def test_tail_of_appended_file(self):
+        expected = Grouper(CsvDictStream("test_data002.csv"), self.group_rule)()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "growing.csv")
+            with open(file_name, "w", newline="") as f:
+                f.writelines(self.lines[:4])
+                # a record which is still being written
+                f.write(self.lines[4][:5])
+            stream = MmapCsvStream(file_name, complete_records=True)
+            grouper = Grouper(stream, self.group_rule)
+            grouper()
+            offset = stream.end_offset
+            self.assertEqual(len("".join(self.lines[:4]).encode()), offset)
+            with open(file_name, "a", newline="") as f:
+                f.write(self.lines[4][5:])
+                f.writelines(self.lines[5:])
+            tail = MmapCsvStream(file_name, start_offset=offset, complete_records=True)
+            changed = grouper.update(tail)
+            self.assertEqual(os.path.getsize(file_name), tail.end_offset)
+            self.assertEqual(self._suppliers(self.lines[4:]), list(changed))
+            self.assertEqual({key: expected[key] for key in changed}, changed)
+            self.assertEqual(list(expected.items()), list(grouper.result.items()))
+            # nothing new
+            self.assertEqual({}, grouper.update(MmapCsvStream(file_name, start_offset=tail.end_offset)))
+            self.assertEqual(expected, grouper.result)
+
+    def test_update_with_new_file(self):
+        expected = Grouper(CsvDictStream("test_data002.csv"), self.group_rule, compact_leaves=True)()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first, second = os.path.join(tmp_dir, "first.csv"), os.path.join(tmp_dir, "second.csv")
+            with open(first, "w", newline="") as f:
+                f.writelines(self.lines[:3])
+            # the columns of the new file are in a different order
+            with open(second, "w", newline="") as f:
+                writer = csv.writer(f)
+                for row in csv.reader(self.lines[:1] + self.lines[3:]):
+                    writer.writerow(row[::-1])
+            grouper = Grouper(CsvDictStream(first, compact=True), self.group_rule, compact_leaves=True)
+            grouper(sink=NdjsonSink(io.StringIO()))
+            changed = grouper.update(CsvDictStream(second, compact=True))
+        self.assertEqual(self._suppliers(self.lines[3:]), list(changed))
+        self.assertEqual({key: expected[key] for key in changed}, changed)
+        self.assertEqual(list(expected.items()), list(grouper.result.items()))
+
+    def test_failed_update_leaves_result(self):
+        expected = Grouper(CsvDictStream("test_data002.csv"), self.group_rule)()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first, second = os.path.join(tmp_dir, "first.csv"), os.path.join(tmp_dir, "second.csv")
+            with open(first, "w", newline="") as f:
+                f.writelines(self.lines[:3])
+            # the new rows are fine, but for the last one which conflicts with the category of its supplier
+            with open(second, "w", newline="") as f:
+                f.writelines(self.lines[:1] + self.lines[3:] + ["Hat,1,Alpha Clothes,Electronics,Boston\n"])
+            grouper = Grouper(CsvDictStream(first), self.group_rule)
+            before = json.dumps(grouper())
+            with self.assertRaises(ProcessException):
+                grouper.update(CsvDictStream(second))
+            self.assertEqual(before, json.dumps(grouper.result))
+            with open(second, "w", newline="") as f:
+                f.writelines(self.lines[:1] + self.lines[3:])
+            grouper.update(CsvDictStream(second))
+        self.assertEqual(list(expected.items()), list(grouper.result.items()))
+
+    def test_sorted_result_cannot_be_updated(self):
+        grouper = Grouper(CsvDictStream("test_data002.csv"), self.group_rule, sorted_input=True)
+        grouper()
+        with self.assertRaises(ProcessException):
+            grouper.update(CsvDictStream("test_data002.csv"))
@@ -0,0 +1,166 @@
+import json
+import unittest
+
+from collections import OrderedDict
+
+from dyno_grp.definitions import Column, GroupRule, GroupsClause, SelectClause, WhereClause
+from dyno_grp.errors import ClauseException, ProcessException
+from dyno_grp.grouper import Grouper
+from dyno_grp.streams import CsvDictStream
+from dyno_grp.where_clause_lang.lexer import Scanner, TokenType
+from dyno_grp.where_clause_lang.parser import Binary, Call, ColumnRef, Like, Literal, Logical, parse
+from dyno_grp.where_clause_lang.vectorized import HAS_NUMPY, ColumnBatch, compile_vectorized
+
+
+class TestScanner(unittest.TestCase):
+    def test_tokens(self):
+        tokens = Scanner("(len(my_column) <= 10 OR \"my col\" like 'it''s*') and column2 <> 3.5").scan_tokens()
+        self.assertEqual([TokenType.LEFT_PAREN, TokenType.IDENTIFIER, TokenType.LEFT_PAREN, TokenType.IDENTIFIER,
+                          TokenType.RIGHT_PAREN, TokenType.LESS_EQ, TokenType.NUMBER, TokenType.OR,
+                          TokenType.IDENTIFIER, TokenType.LIKE, TokenType.STRING, TokenType.RIGHT_PAREN,
+                          TokenType.AND, TokenType.IDENTIFIER, TokenType.LESS_MORE, TokenType.NUMBER, TokenType.EOF],
+                         [token.token_type for token in tokens])
+        self.assertEqual("my col", tokens[8].literal)
+        self.assertEqual("it's*", tokens[10].literal)
+        self.assertEqual(3.5, tokens[15].literal)
+
+    def test_invalid_tokens(self):
+        with self.assertRaises(ClauseException):
+            Scanner("column ? 1").scan_tokens()
+        with self.assertRaises(ClauseException):
+            Scanner("column = 'unterminated").scan_tokens()
+
+
+class TestParser(unittest.TestCase):
+    def test_precedence(self):
+        expr = parse("(len(my_column) < 10 or my_column like 'help me*') and column2 > column3 + 1 * 2")
+        self.assertEqual(Logical(
+            TokenType.AND,
+            Logical(TokenType.OR,
+                    Binary(TokenType.LESS, Call("len", [ColumnRef("my_column")]), Literal(10)),
+                    Like(ColumnRef("my_column"), Literal("help me*"))),
+            Binary(TokenType.GREATER, ColumnRef("column2"),
+                   Binary(TokenType.PLUS, ColumnRef("column3"),
+                          Binary(TokenType.STAR, Literal(1), Literal(2))))), expr)
+        self.assertEqual({"my_column", "column2", "column3"}, expr.columns())
+
+    def test_syntax_errors(self):
+        for rule in ("a <", "a = 1 b", "(a = 1", "unknown(a) = 1", "len(a, b) = 1", "a < b < c"):
+            with self.assertRaises(ClauseException, msg=rule):
+                parse(rule)
+
+
+class TestWhereClause(unittest.TestCase):
+    def _predicate(self, rule):
+        return WhereClause({"rule": rule}).compile(lambda name: lambda row: row[name])
+
+    def test_evaluation(self):
+        row = {"name": "help me please", "qty": "7", "price": "2.5", "city": "Paris", "empty": None}
+        self.assertTrue(self._predicate("name like 'help me*'")(row))
+        self.assertTrue(self._predicate("name not like '*Paris*'")(row))
+        self.assertTrue(self._predicate("qty * price > 17 and qty % 2 = 1")(row))
+        self.assertTrue(self._predicate("10 > qty")(row))
+        self.assertTrue(self._predicate("len(city) = 5 and upper(city) = 'PARIS'")(row))
+        self.assertTrue(self._predicate("-qty < 0")(row))
+        self.assertFalse(self._predicate("not (city = 'Paris' or qty = 1)")(row))
+        self.assertFalse(self._predicate("empty = 1 or empty != 1 or empty like '*'")(row))
+
+    def test_invalid_number(self):
+        with self.assertRaises(ProcessException):
+            self._predicate("city > 1")({"city": "Paris"})
+        with self.assertRaises(ProcessException):
+            self._predicate("qty / 0 > 1")({"qty": "1"})
+
+    def test_empty_cells_are_null(self):
+        row = {"qty": "", "blank": "  "}
+        for rule in ("qty <= 5", "qty > 5", "qty + 1 > 0", "5 >= blank", "abs(qty) >= 0"):
+            self.assertFalse(self._predicate(rule)(row), rule)
+        self.assertTrue(self._predicate("qty = ''")(row))
+
+    def test_numeric_expression_compared_with_text(self):
+        self.assertTrue(self._predicate("qty + 1 > '5'")({"qty": "7"}))
+        self.assertTrue(self._predicate("'5' < qty * 2")({"qty": "3"}))
+        for rule in ("qty + 1 > 'abc'", "'' = -qty"):
+            with self.assertRaises(ClauseException, msg=rule):
+                self._predicate(rule)
+
+    def test_conjuncts_ordered_by_cost(self):
+        where_clause = WhereClause({"rule1": "name like 'x*' and qty > 1", "rule2": "len(name) > 2 and city = 'a'"})
+        self.assertEqual([parse("city = 'a'"), parse("qty > 1"), parse("len(name) > 2"), parse("name like 'x*'")],
+                         where_clause.conjuncts())
+
+    def test_where_columns_must_be_selected(self):
+        select_clause = SelectClause([Column("column1", "first_name"), Column("column2")])
+        groups_clause = GroupsClause.from_raw(OrderedDict([("first_name", dict())]))
+        with self.assertRaises(ClauseException):
+            GroupRule(select_clause, WhereClause({"rule": "column1 = 'a'"}), groups_clause)
+
+    def test_grouping_with_where(self):
+        with open("rule_test003.json") as f:
+            rules = json.load(f)
+        grouped_data = Grouper.csv_to_json_grouper("test_data002.csv", rules)()
+        self.assertEqual({
+            "Alpha Clothes": {"items_data": {"New York": {"Socks": [{"Qty": "3"}], "Boots": [{"Qty": "5"}]},
+                                             "Los Angeles": {"Socks": [{"Qty": "2"}]}},
+                              "Category": "Clothes"},
+            "Giga Phone": {"items_data": {"New York": {"Phone": [{"Qty": "5"}], "Computer": [{"Qty": "3"}]},
+                                          "Los Angeles": {"Computer": [{"Qty": "7"}]}},
+                           "Category": "Electronics"},
+        }, grouped_data)
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+class TestVectorizedWhereClause(unittest.TestCase):
+    def test_same_as_row_evaluation(self):
+        rows = [
+            {"name": "help me please", "qty": "7", "price": "2.5", "city": "Paris"},
+            {"name": "help", "qty": "1", "price": "20", "city": None},
+            {"name": None, "qty": None, "price": "1", "city": "Rome"},
+            {"name": "ab", "qty": "4", "price": None, "city": "Paris"},
+            {"name": "", "qty": "", "price": "3", "city": "Rome"},
+        ]
+        for rule in ("name like 'help*'", "qty * price > 17 or city != 'Paris'", "10 > qty and not len(name) < 3",
+                     "upper(city) = 'PARIS' or -qty < -3", "name not like '*e*'", "qty / price >= 2",
+                     "qty + 1 > '4'", "abs(qty) < 5"):
+            where_clause = WhereClause({"rule": rule})
+            predicate = where_clause.compile(lambda name: lambda row: row[name])
+            vectorized = compile_vectorized(where_clause.conjuncts(), lambda name: lambda batch: batch.column(name))
+            self.assertEqual([bool(predicate(row)) for row in rows], list(vectorized(ColumnBatch(rows))), rule)
+
+
+class ListStream:
+    def __init__(self, rows) -> None:
+        super().__init__()
+        self._rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class TestPredicatePushdown(unittest.TestCase):
+    def test_rejected_rows_are_not_projected(self):
+        select_clause = SelectClause([Column("column1", "first_name"), Column("column2")])
+        groups_clause = GroupsClause.from_raw(OrderedDict([("first_name", dict())]))
+        group_rule = GroupRule(select_clause, WhereClause({"rule": "first_name != 'skip'"}), groups_clause)
+        # the second row misses a selected column, it would fail the projection if it was not filtered before
+        stream = ListStream([{"column1": "a", "column2": "1"}, {"column1": "skip"}, {"column1": "a", "column2": "2"}])
+        self.assertEqual({"a": [{"column2": "1"}, {"column2": "2"}]}, Grouper(stream, group_rule)())
+
+    def test_batches(self):
+        with open("rule_test003.json") as f:
+            rules = json.load(f)
+        expected = Grouper.csv_to_json_grouper("test_data002.csv", rules)()
+        for compact in (False, True):
+            grouper = Grouper(CsvDictStream("test_data002.csv", compact=compact), GroupRule.from_raw(rules),
+                              batch_size=2)
+            self.assertEqual(expected, grouper())
+
+
+if __name__ == '__main__':
+    unittest.main()